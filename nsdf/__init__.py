@@ -78,10 +78,17 @@ nonuniform: Time series data that has been sampled with irregular
 
                  This is represented by nsdf.dialect.NANPADDED.
 
+              d) a single 1D dataset with the data of all sources
+                 concatenated, and an index of the offsets of each
+                 source's data (like a compressed sparse row
+                 matrix).
+
+                 This is represented by nsdf.dialect.RAGGED.
+
 event: Data points represent event times. Spike time data is the most
     common example in neuroscience. Similar to nonunform data, event
     times data from different sources are of different length. Thus
-    they, too, can be stored in three different ways.
+    they, too, can be stored in four different ways.
 
               a) individual 1D datasets under a common group.
 
@@ -98,6 +105,12 @@ event: Data points represent event times. Spike time data is the most
 
                  This is represented by nsdf.dialect.NANPADDED.
 
+              d) a single 1D dataset with the data of all sources
+                 concatenated, and an index of the offsets of each
+                 source's data.
+
+                 This is represented by nsdf.dialect.RAGGED.
+
 static: In addition to time series or temporal data, components in a
     model can have static data associated with them. These are stored
     under the `static` group.
@@ -141,6 +154,16 @@ modeltree: This group stores a tree structure representing
     attributes added by the user. One special attribute is `ontology`
     meant for storing the ontological term for this component.
 
+modeltable: Very large model trees can be stored in this compact
+    tabular form instead of one group per component. The datasets
+    `parent`, `name` and `uid` in this group have one entry for each
+    model component. `parent` stores the row of the parent of the
+    component, -1 for the first row, which represents `modeltree`
+    itself. The attributes of the components are stored in a subgroup
+    `attrs/{key}` for each attribute name, where the dataset `index`
+    lists the rows of the components that have this attribute and
+    the dataset `value` stores the corresponding values.
+
 .. _map-label:
 
 Map
@@ -164,6 +187,32 @@ each recorded variable. The first column is `source` and stores the
 uid of the source component and the second column is `data` which
 stores the reference to the 1D dataset collected from this source.
 
+For the RAGGED dialect, the offsets index of a dataset is stored in
+`/map/offsets/{event|nonuniform}/{population}_{variable}`. It has one
+row for each block of data appended to the dataset and the i-th row
+lists the starting position of the data of each source in that block,
+followed by the end position of the block. The dataset stores a
+reference to it in the attribute `offsets` and a reference to the
+source dataset in the attribute `source`.
+
+Event times and the sampling times of nonuniform data in the ONED and
+RAGGED dialects may be stored as integer ticks. Such datasets have
+the attributes `encoding`, `dt` and `tstart`, and the time value of
+tick `n` is `tstart + n * dt`. If `encoding` is `tick-delta`, each
+value is the difference from the previous tick, except for the first
+value of a dataset in ONED dialect and of each source's data in a
+block in RAGGED dialect, which are absolute ticks.
+
+Uniformly sampled data may be stored as scaled integers. Such
+datasets have the attributes `scale_factor` and `add_offset`, and the
+stored integer `n` represents the value `add_offset + n *
+scale_factor`.
+
+The optional dataset `/map/uid_index` indexes the sources by uid. It
+has one row for each source and dataset recorded from it, storing the
+uid, the sampling type, the population, the row of the source in the
+population, the field and a reference to the dataset.
+
 
 Note on namespace
 -----------------
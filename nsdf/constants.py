@@ -57,6 +57,28 @@ VLENSTR = h5.string_dtype(encoding='utf-8')  # newer h5py
 REFTYPE = h5.special_dtype(ref=h5.Reference)
 VLENBYTE = h5.special_dtype(vlen=bytes)
 SRCDATAMAPTYPE = np.dtype([('source', VLENSTR), ('data', REFTYPE)])
+UIDINDEXTYPE = np.dtype([('source', VLENSTR), ('stype', VLENSTR),
+                         ('population', VLENSTR), ('row', np.int64),
+                         ('field', VLENSTR), ('data', REFTYPE)])
+
+# Attributes recording how the stored values of a dataset are encoded
+# (see nsdf.ScaleOffset and nsdf.TickEncoding)
+ENCODING_ATTRS = ('scale_factor', 'add_offset', 'encoding', 'dt', 'tstart')
+
+# Target size in bytes of the chunks of datasets created by NSDFWriter
+CHUNK_BYTES = 1 << 20
+
+# Length in bytes assumed for the rows of a growing dataset created
+# empty, whose final length is not known
+MIN_CHUNK_BYTES = 1 << 12
+
+# Target size in bytes of the blocks of rows read at once by
+# NSDFReader
+READ_BYTES = 1 << 26
+
+# Default limit on the size in bytes of data queued for writing by an
+# asynchronous NSDFWriter
+IO_QUEUE_BYTES = 1 << 28
 
 # NonuniformRec = namedtuple('NonuniformRec', ['sid', 'data', 'time'])
 
@@ -87,13 +109,40 @@ class dialect(object):
             nonuniform data goes into regular 2D datasets. In this case
             the events are stored in 1D datasets.
 
+        RAGGED:
+            nonuniform and event data of a whole population stored
+            in a single flat 1D dataset, with an offsets index giving
+            the position of each source's data in every appended
+            block.
+
     """
     VLEN = 'VLEN'
     ONED = 'ONED'   
     NANPADDED = 'NANPADDED'      
     NUREGULAR = 'NUREGULAR'
+    RAGGED = 'RAGGED'
+
+
+class access(object):
+    """Enumeration of access patterns of 2D (source, time) datasets. The
+    chunk shape of a dataset is chosen to suit its access pattern.
+
+    The following constants are defined:
+
+        TIMEMAJOR:
+            data is appended and read in blocks of sampling times
+            (columns) covering all the sources. Chunks span as many
+            rows as possible.
+
+        SOURCEMAJOR:
+            data is mostly read one source (row) at a time. Chunks
+            span as many columns as possible.
+
+    """
+    TIMEMAJOR = 'TIMEMAJOR'
+    SOURCEMAJOR = 'SOURCEMAJOR'
+
 
-    
 SAMPLING_TYPES = [UNIFORM, NONUNIFORM, EVENT, STATIC]
 
 
@@ -55,10 +55,15 @@ except ImportError as e:
     from __builtin__ import range
     from __builtin__ import object
 
+import array
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
+
 __author__ = 'Subhasis Ray'
 __version__ = '0.1'
 
-
 class ModelComponent(object):
     """Tree node for model tree.
 
@@ -75,6 +80,9 @@ class ModelComponent(object):
             to in NSDF file.
 
     """
+    __slots__ = ('uid', 'name', 'parent', 'children', 'attrs', 'hdfgroup',
+                 '_id_path_dict', '_indexed', '_node')
+
     def __init__(self, name, uid=None, parent=None, attrs=None,
                  hdfgroup=None):
         self.uid = name if uid is None else uid
@@ -86,12 +94,22 @@ class ModelComponent(object):
         self.attrs = attrs if attrs is not None else {}
         self.hdfgroup = hdfgroup
         self._id_path_dict = None
+        # Whether this component or one of its ancestors holds an
+        # id->path mapping
+        self._indexed = False
+        # ModelNode this component was copied to by
+        # ModelNode.add_child
+        self._node = None
         if parent is not None:
-            parent.children[name] = self
-        
+            parent.add_child(self)
+
     def add_child(self, child):
         """Add a child component under this model component.
 
+        If this component has been copied into a ModelTree (by adding
+        it to a ModelNode), the child is added under its copy in the
+        tree.
+
         Args:
             child (ModelComponent): child component to add to this component
 
@@ -104,8 +122,15 @@ class ModelComponent(object):
         """
         if not isinstance(child, ModelComponent):
             raise TypeError('require a ModelComponent instance.')
+        if self._node is not None:
+            self._node.add_child(child)
+            return
+        if isinstance(child, ModelNode) and child.index != 0:
+            raise TypeError('only the root of a ModelTree can be added'
+                            ' as a child.')
         self.children[child.name] = child
         child.parent = self
+        self._register(child)
 
     def add_children(self, children):
         """Add a list of children to current component.
@@ -121,10 +146,38 @@ class ModelComponent(object):
 
         """
         for child in children:
-            if not isinstance(child, ModelComponent):
-                raise TypeError('require a ModelComponent instance.')
-            self.children[child.name] = child
-            child.parent = self
+            self.add_child(child)
+
+    def _register(self, child):
+        """Insert the uids and paths of the subtree rooted at the newly
+        added `child` into the id->path mappings of this component
+        and its ancestors that have one.
+
+        The mappings of the components in the subtree are left as they
+        are: `get_id_path_dict` rebuilds them if their paths have
+        changed.
+
+        """
+        if not self._indexed:
+            return
+        indexed = []
+        node = self
+        while node is not None:
+            if node._id_path_dict is not None:
+                indexed.append(node._id_path_dict)
+            node = node.parent
+        if not indexed:
+            return
+        entries = []
+        stack = [(child, child.path)]
+        while stack:
+            node, path = stack.pop()
+            node._indexed = True
+            entries.append((node.uid, path))
+            stack.extend((grandchild, path + '/' + name) for name, grandchild
+                         in node.children.items())
+        for id_path_dict in indexed:
+            id_path_dict.update(entries)
 
     def get_node(self, path):
         """Get node at `path` relative to this node.
@@ -146,6 +199,7 @@ class ModelComponent(object):
             if name == '':
                 continue
             node = node.children[name]
+        return node
 
     def visit(self, function, *args, **kwargs):
         """Visit the subtree starting with `node` recursively, applying
@@ -161,10 +215,13 @@ class ModelComponent(object):
             None
 
         """
-        function(self, *args, **kwargs)
-        for child in list(self.children.values()):
-            child.visit(function, *args, **kwargs)
-                
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            function(node, *args, **kwargs)
+            stack.extend(reversed(list(node.children.values())))
+
+
     def print_tree(self, indent=''):
         """Recursively print subtree rooted at this component.
 
@@ -175,9 +232,12 @@ class ModelComponent(object):
             None
 
         """
-        print('{}{}({})'.format(indent, self.name, self.uid))
-        for child in list(self.children.values()):
-            child.print_tree(indent + '  ')
+        stack = [(self, indent)]
+        while stack:
+            node, indent = stack.pop()
+            print('{}{}({})'.format(indent, node.name, node.uid))
+            stack.extend((child, indent + '  ') for child in
+                         reversed(list(node.children.values())))
 
     def check_uid(self, uid_dict):
         """Check that uid are indeed unique.
@@ -192,20 +252,21 @@ class ModelComponent(object):
             unix file paths.
 
         """
-        if self.uid is None:
-            if self.parent is None:
-                self.uid = self.name
-            else:
-                self.uid = '{}/{}'.format(self.parent.uid, self.name)
-        try:
-            clashing = uid_dict[self.uid]
-            print('Components with uid clashing with {}: \n'.format(self.name))
-            print('\n'.join([comp.name for comp in clashing]))
-            clashing.append(self)
-        except KeyError:
-            uid_dict[self.uid] = [self]
-        for child in list(self.children.values()):
-            child.check_uid(uid_dict)
+        def check(node):
+            if node.uid is None:
+                if node.parent is None:
+                    node.uid = node.name
+                else:
+                    node.uid = '{}/{}'.format(node.parent.uid, node.name)
+            try:
+                clashing = uid_dict[node.uid]
+                print('Components with uid clashing with {}: \n'.format(
+                    node.name))
+                print('\n'.join([comp.name for comp in clashing]))
+                clashing.append(node)
+            except KeyError:
+                uid_dict[node.uid] = [node]
+        self.visit(check)
             
     @property
     def path(self):
@@ -218,59 +279,448 @@ class ModelComponent(object):
         return '/' + pth
 
     def update_id_path_dict(self):
-        """Update the id->path mapping.
+        """Rebuild the id->path mapping.
 
-        This must be called before using get_id_path_dict whenever the
-        model tree is been modified
+        The mapping is kept up to date when components are added with
+        `add_child`, `add_children` or by passing `parent` to the
+        constructor. This must be called before using
+        get_id_path_dict when the model tree has been modified
+        otherwise, for example by removing or renaming components.
 
         .. seealso:: get_id_path_dict
 
         """
-        if self._id_path_dict is None:
-            self._id_path_dict = {}
-        def update_dict(node, dictobj):
-            """Insert the (uid, path) of `node` into `dictobj`."""
-            dictobj[node.uid] = node.path
-        self.visit(update_dict, self._id_path_dict)
+        id_path_dict = {}
+        stack = [(self, self.path)]
+        while stack:
+            node, path = stack.pop()
+            node._indexed = True
+            id_path_dict[node.uid] = path
+            stack.extend((child, path + '/' + name) for name, child
+                         in node.children.items())
+        self._id_path_dict = id_path_dict
 
     def get_id_path_dict(self):
         """Return a dictionary mapping the unique id of the model components
         to their path in modeltree.
 
+        The mapping is rebuilt if this component has been moved since
+        it was built.
+
         .. seealso:: update_id_path_dict
 
         """
-        if (self._id_path_dict is None) or (len(self._id_path_dict) == 0):
+        id_path_dict = self._id_path_dict
+        if id_path_dict is None or id_path_dict.get(self.uid) != self.path:
             self.update_id_path_dict()
         return self._id_path_dict
 
 def common_prefix(paths, sep='/'):
     """Find the common prefix of paths.
 
+    The common prefix of all the paths is the common prefix of the
+    smallest and the largest of their token lists, so only these two
+    are compared.
+
     Note: does not check for malformed paths right now.
     """
     tokens_list = [path.split(sep) for path in paths]
-    endmatch = False
-    common = ''
-    iii = 0
-    while not endmatch:
-        name = ''
+    if not tokens_list:
+        return ''
+    common = []
+    for first, last in zip(min(tokens_list), max(tokens_list)):
+        if first != last:
+            break
+        common.append(first)
+    return ''.join(sep + name for name in common if name)
+
+
+
+class ModelTree(object):
+    """Array-backed storage for large model trees.
+
+    The components are stored in rows of flat arrays: the row of the
+    parent, the first and last child and the next sibling of each
+    component, its depth and the index of its name in a table of
+    interned names. The uids are kept in a list and attributes and
+    HDF5 groups only for the components that have them. Components
+    are accessed through ModelNode views, which provide the
+    ModelComponent API.
+
+    The paths of all components are computed in one pass the first
+    time one is requested and kept up to date afterwards, so that
+    looking up a path takes constant time.
+
+    Components can only be added, not moved or removed. Names of
+    siblings must be unique.
+
+    Attributes:
+        parent (ModelComponent): the component the root of this tree
+            is attached to, None if the tree is not attached.
+
+    """
+    def __init__(self, name, uid=None, attrs=None):
+        self.parent = None
+        self._parent = array.array('q')
+        self._first_child = array.array('q')
+        self._last_child = array.array('q')
+        self._next_sibling = array.array('q')
+        self._depth = array.array('q')
+        self._name = array.array('q')
+        self._names = []
+        self._name_ids = {}
+        self._uid = []
+        self._attrs = {}
+        self._hdfgroup = {}
+        self._id_path_dicts = {}
+        self._indexed = False
+        self._paths = None
+        self._child_index = None
+        self.add(-1, name, uid, attrs)
+
+    def __len__(self):
+        return len(self._uid)
+
+    @classmethod
+    def from_arrays(cls, parents, names, uids):
+        """Create a tree from columns of components.
+
+        Args:
+            parents (sequence of int): row of the parent of each
+                component. The first row is the root and its parent
+                is ignored. Parents must come before their children.
+
+            names (sequence of str): names of the components.
+
+            uids (sequence of str): unique ids of the components.
+
+        Returns:
+            ModelTree with the components in the given order.
+
+        """
+        tree = cls(names[0], uids[0])
+        for row in range(1, len(parents)):
+            tree.add(int(parents[row]), names[row], uids[row])
+        return tree
+
+    @property
+    def root(self):
+        """ModelNode view of the root component."""
+        return ModelNode(self, 0)
+
+    def node(self, index):
+        """ModelNode view of the component in row `index`."""
+        return ModelNode(self, index)
+
+    def add(self, parent, name, uid=None, attrs=None):
+        """Add a component under the component in row `parent`.
+
+        Args:
+            parent (int): row of the parent component, -1 for the
+                root.
+
+            name (str): name of the new component.
+
+            uid (str): unique id of the new component. Defaults to
+                `name`.
+
+            attrs (dict): attributes of the new component.
+
+        Returns:
+            int: row of the new component.
+
+        """
+        index = len(self._uid)
         try:
-            tmp = [tokens[iii] for tokens in tokens_list]
-            name = tmp[0]
-            for jjj in range(1, len(tmp)):
-                if tmp[jjj] != tmp[0]:
-                    endmatch = True
-                    break
-            iii += 1
-        except IndexError:
-            endmatch = True
-        if name and (not endmatch):
-            common = common + sep + name
-    return common
-            
-        
-            
+            nameid = self._name_ids[name]
+        except KeyError:
+            nameid = len(self._names)
+            self._names.append(name)
+            self._name_ids[name] = nameid
+        self._parent.append(parent)
+        self._first_child.append(-1)
+        self._last_child.append(-1)
+        self._next_sibling.append(-1)
+        self._name.append(nameid)
+        self._uid.append(name if uid is None else uid)
+        if attrs:
+            self._attrs[index] = attrs
+        if parent < 0:
+            self._depth.append(0)
+            return index
+        self._depth.append(self._depth[parent] + 1)
+        if self._last_child[parent] < 0:
+            self._first_child[parent] = index
+        else:
+            self._next_sibling[self._last_child[parent]] = index
+        self._last_child[parent] = index
+        if self._paths is not None:
+            self._paths.append(self._paths[parent] + '/' + name)
+        if self._child_index is not None:
+            self._child_index[(parent, nameid)] = index
+        return index
+
+    def children(self, index):
+        """Iterate over the rows of the children of the component in row
+        `index`, in the order they were added."""
+        child = self._first_child[index]
+        while child >= 0:
+            yield child
+            child = self._next_sibling[child]
+
+    def child(self, index, name):
+        """Return the row of the child called `name` of the component in
+        row `index`.
+
+        Raises:
+            KeyError if there is no such child.
+
+        """
+        if self._child_index is None:
+            self._child_index = dict(
+                ((self._parent[row], self._name[row]), row)
+                for row in range(1, len(self._uid)))
+        return self._child_index[(index, self._name_ids[name])]
+
+    def name(self, index):
+        """Name of the component in row `index`."""
+        return self._names[self._name[index]]
+
+    def depth(self, index):
+        """Depth of the component in row `index` below the root."""
+        return self._depth[index]
+
+    def path(self, index):
+        """Path of the component in row `index`."""
+        if self._paths is None:
+            if self.parent is None:
+                prefix = '/'
+            else:
+                prefix = self.parent.path + '/'
+            names, nameids = self._names, self._name
+            parents = self._parent
+            paths = [prefix + names[nameids[0]]]
+            # parents always come before their children
+            for row in range(1, len(self._uid)):
+                paths.append(paths[parents[row]] + '/' +
+                             names[nameids[row]])
+            self._paths = paths
+        return self._paths[index]
+
+    def _reset_paths(self):
+        self._paths = None
+
+
+class _ChildrenView(Mapping):
+    """Read-only mapping from names to ModelNode views of the children
+    of a component of a ModelTree."""
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, name):
+        try:
+            return ModelNode(self.tree, self.tree.child(self.index, name))
+        except KeyError:
+            raise KeyError(name)
+
+    def __iter__(self):
+        for child in self.tree.children(self.index):
+            yield self.tree.name(child)
+
+    def __len__(self):
+        return sum(1 for child in self.tree.children(self.index))
+
+    def values(self):
+        return [ModelNode(self.tree, child) for child in
+                self.tree.children(self.index)]
+
+    def items(self):
+        return [(self.tree.name(child), ModelNode(self.tree, child))
+                for child in self.tree.children(self.index)]
+
+
+class _AttrsView(MutableMapping):
+    """Attributes of a component of a ModelTree. Storage is only
+    allocated for components that are given attributes."""
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.tree._attrs.get(self.index, {})[key]
+
+    def __setitem__(self, key, value):
+        self.tree._attrs.setdefault(self.index, {})[key] = value
+
+    def __delitem__(self, key):
+        attrs = self.tree._attrs.get(self.index, {})
+        del attrs[key]
+        if not attrs:
+            del self.tree._attrs[self.index]
+
+    def __iter__(self):
+        return iter(self.tree._attrs.get(self.index, {}))
+
+    def __len__(self):
+        return len(self.tree._attrs.get(self.index, {}))
+
+
+class ModelNode(ModelComponent):
+    """View of a component stored in a ModelTree, with the same API as
+    ModelComponent.
+
+    Views are created on access and compare equal when they refer to
+    the same component. Adding a ModelComponent as a child copies the
+    subtree rooted at it into the ModelTree, and children added later
+    to the copied components go to their copies.
+
+    Attributes:
+        tree (ModelTree): the tree storing the component.
+
+        index (int): row of the component in `tree`.
+
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, ModelNode) and other.tree is self.tree
+                and other.index == self.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return 'ModelNode({!r}, {})'.format(self.name, self.index)
+
+    @property
+    def name(self):
+        return self.tree.name(self.index)
+
+    @property
+    def uid(self):
+        return self.tree._uid[self.index]
+
+    @uid.setter
+    def uid(self, value):
+        self.tree._uid[self.index] = value
+
+    @property
+    def parent(self):
+        parent = self.tree._parent[self.index]
+        if parent < 0:
+            return self.tree.parent
+        return ModelNode(self.tree, parent)
+
+    @parent.setter
+    def parent(self, value):
+        if self.index != 0:
+            raise TypeError('only the root of a ModelTree can be moved.')
+        self.tree.parent = value
+        self.tree._reset_paths()
+
+    @property
+    def children(self):
+        return _ChildrenView(self.tree, self.index)
+
+    @property
+    def attrs(self):
+        return _AttrsView(self.tree, self.index)
+
+    @property
+    def hdfgroup(self):
+        return self.tree._hdfgroup.get(self.index)
+
+    @hdfgroup.setter
+    def hdfgroup(self, value):
+        self.tree._hdfgroup[self.index] = value
+
+    @property
+    def _id_path_dict(self):
+        return self.tree._id_path_dicts.get(self.index)
+
+    @_id_path_dict.setter
+    def _id_path_dict(self, value):
+        if value is None:
+            self.tree._id_path_dicts.pop(self.index, None)
+        else:
+            self.tree._id_path_dicts[self.index] = value
+
+    @property
+    def _indexed(self):
+        tree = self.tree
+        return tree._indexed or (tree.parent is not None and
+                                 tree.parent._indexed)
+
+    @_indexed.setter
+    def _indexed(self, value):
+        if value:
+            self.tree._indexed = True
+
+    @property
+    def depth(self):
+        """Depth of this component below the root of its tree."""
+        return self.tree.depth(self.index)
+
+    @property
+    def path(self):
+        """Path of this component"""
+        return self.tree.path(self.index)
+
+    def add_child(self, child):
+        """Copy the subtree rooted at `child` into the tree under this
+        component.
+
+        Args:
+            child (ModelComponent): root of the subtree to add.
+
+        Returns:
+            None
+
+        Raises:
+            TypeError
+
+        """
+        if not isinstance(child, ModelComponent):
+            raise TypeError('require a ModelComponent instance.')
+        tree = self.tree
+        first = None
+        stack = [(child, self.index)]
+        while stack:
+            component, parent = stack.pop()
+            index = tree.add(parent, component.name, component.uid,
+                             dict(component.attrs) or None)
+            if not isinstance(component, ModelNode):
+                component._node = ModelNode(tree, index)
+            if first is None:
+                first = index
+            stack.extend((grandchild, index) for grandchild in
+                         reversed(list(component.children.values())))
+        self._register(ModelNode(tree, first))
+
+    def update_id_path_dict(self):
+        """Rebuild the id->path mapping.
+
+        .. seealso:: ModelComponent.update_id_path_dict
+
+        """
+        if self.index != 0:
+            return super(ModelNode, self).update_id_path_dict()
+        tree = self.tree
+        tree.path(0)
+        self._id_path_dict = dict(zip(tree._uid, tree._paths))
+        tree._indexed = True
 
 # 
 # model.py ends here
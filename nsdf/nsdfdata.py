@@ -51,6 +51,11 @@ try:
 except Exception as e:
     from __builtin__ import object
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import numpy as np
 
 class NSDFData(object):
@@ -140,20 +145,147 @@ class UniformData(TimeSeriesData):
     
         tunit (float): unit of time.
 
+        tstart (float): sampling time of the first data point. It is
+            set by NSDFReader, NSDFWriter takes the start time as an
+            argument of `add_uniform_data`. Default: 0.0
+
     """
     def __init__(self, *args, **kwargs):
         dt = kwargs.pop('dt', 1.0)
         tunit = kwargs.pop('tunit', 's')
+        tstart = kwargs.pop('tstart', 0.0)
         super(UniformData, self).__init__(*args, **kwargs)
         self.dt = dt
         self.tunit = tunit
+        self.tstart = tstart
         
     def set_dt(self, value, unit):
         """Set the timestep used for data recording."""
         self.dt = value
         self.tunit = unit
 
-        
+
+class _BlockRows(Mapping):
+    """Read-only mapping from source to the corresponding row of a
+    UniformBlockData."""
+    def __init__(self, block):
+        self._block = block
+
+    def __getitem__(self, source):
+        return self._block.get_data(source)
+
+    def __iter__(self):
+        return iter(self._block.get_sources())
+
+    def __len__(self):
+        return len(self._block.get_sources())
+
+    def keys(self):
+        return self._block._index.keys()
+
+
+class UniformBlockData(UniformData):
+    """Stores uniformly sampled data from a fixed set of sources in a
+    single 2D (source, time) array.
+
+    The data of each source is a row of the array: `put_data` copies
+    the values into the row in place and `get_data` returns a view of
+    it. The NSDFWriter writes the whole block at once, without
+    collecting the rows of individual sources.
+
+    Attributes:
+        dt (float): the sampling interval of the data.
+
+        tunit (float): unit of time.
+
+        tstart (float): sampling time of the first column.
+
+    Examples:
+        >>> vm = nsdf.UniformBlockData('Vm', ['soma_0', 'soma_1'], 1000,
+        ...                            unit='mV', dt=0.1, tunit='ms')
+        >>> vm.put_data('soma_1', np.zeros(1000))
+        >>> vm.get_data('soma_1').base is vm.get_block()
+        True
+
+    """
+    def __init__(self, name, sources, nsamples, *args, **kwargs):
+        """Create the data container.
+
+        Args:
+            name (str): name of the dataset.
+
+            sources (sequence): uids of the data sources, in the
+                order of the rows of the block.
+
+            nsamples (int or numpy.ndarray): number of sampling points
+                per source. Alternatively a 2D array with one row per
+                source, which is then used as the block without
+                copying.
+
+            Other arguments are those of UniformData.
+
+        """
+        super(UniformBlockData, self).__init__(name, *args, **kwargs)
+        self._sources = list(sources)
+        self._index = dict((src, row) for row, src in
+                           enumerate(self._sources))
+        if len(self._index) != len(self._sources):
+            raise ValueError('`sources` must be unique.')
+        if isinstance(nsamples, np.ndarray):
+            if nsamples.ndim != 2 or \
+               nsamples.shape[0] != len(self._sources):
+                raise ValueError('block must have one row per source.')
+            self._block = nsamples
+            self.dtype = nsamples.dtype
+        else:
+            self._block = np.zeros((len(self._sources), nsamples),
+                                   dtype=self.dtype)
+        self._src_data_dict = _BlockRows(self)
+
+    def put_data(self, source, data):
+        """Copy the data array for source into its row of the block.
+
+        Args:
+            source (str): uid of the data source. It must be one of
+                the sources of this container.
+
+            data (sequence of elements of dtype): the data for this
+                source, as many values as the columns of the block.
+
+        Returns:
+            None
+
+        Raises:
+            KeyError if `source` is not one of the sources.
+
+        """
+        self._block[self._index[source]] = data
+
+    def update_source_data_dict(self, src_data):
+        """Copy a bunch of source, data pairs into the block."""
+        if isinstance(src_data, Mapping):
+            src_data = src_data.items()
+        for source, data in src_data:
+            self.put_data(source, data)
+
+    def get_sources(self):
+        """Return the source ids in the order of the rows of the block.
+        The returned list must not be modified."""
+        return self._sources
+
+    def get_all_data(self):
+        """Return the block, whose rows are the data of the sources."""
+        return self._block
+
+    def get_data(self, source):
+        """Return a view of the row storing the data for `source`."""
+        return self._block[self._index[source]]
+
+    def get_block(self):
+        """Return the 2D array storing the data of all the sources."""
+        return self._block
+
+
 class NonuniformData(TimeSeriesData):
     """Stores nonuniformly sampled data.
 
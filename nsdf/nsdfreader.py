@@ -61,29 +61,110 @@ except ImportError as e:
 
 import h5py as h5
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
 
-from .model import ModelComponent, common_prefix
+from .model import ModelComponent, ModelTree, common_prefix
 from .constants import *
 from .util import *
 from .nsdfdata import *
 from datetime import datetime
 
 
+def _read_dsid(dsid):
+    """Read the whole dataset with low-level id `dsid`, decoding
+    ticks to times."""
+    values = np.empty(dsid.shape, dtype=dsid.dtype)
+    if values.size:
+        dsid.read(h5.h5s.ALL, h5.h5s.ALL, values)
+    # Only tick-encoded datasets need their attributes
+    if not h5.h5a.exists(dsid, b'encoding'):
+        return values
+    encoding = TickEncoding.from_attrs(h5.Dataset(dsid).attrs, dsid.dtype)
+    return encoding.decode(values)
+
+
+def _time_scale(dsid):
+    """Return the low-level id of the dimension scale called `time`
+    attached to the first axis of the dataset with low-level id
+    `dsid`.
+
+    Raises:
+        KeyError if there is no such scale.
+
+    """
+    scale = h5.h5ds.iterate(
+        dsid, 0,
+        lambda scale: scale if h5.h5ds.get_scale_name(scale) == b'time'
+        else None)
+    if scale is None:
+        raise KeyError('time')
+    return scale
+
+
+def _read_oned(fd, mapping, start, stop, with_times):
+    """Read the 1D datasets referred to by the rows `start` to `stop` of
+    the ONED map dataset `mapping` in the open file `fd`.
+
+    The datasets are dereferenced and read through the low-level
+    h5py API, without creating a high-level object for each.
+
+    Returns:
+        list of (values, times) tuples, one for each row, where times
+        is the data of the time dimension scale if `with_times` is
+        True, and None otherwise.
+
+    """
+    ret = []
+    for ref in mapping[start:stop]['data']:
+        dsid = h5.h5r.dereference(ref, fd.id)
+        times = _read_dsid(_time_scale(dsid)) if with_times else None
+        ret.append((_read_dsid(dsid), times))
+    return ret
+
+
+def _read_oned_file(filename, mapname, start, stop, with_times):
+    """Open the file `filename` read-only and read the rows `start` to
+    `stop` of the ONED map dataset `mapname` with `_read_oned`. This is
+    the task run by worker processes."""
+    with h5.File(filename, 'r') as fd:
+        return _read_oned(fd, fd[mapname], start, stop, with_times)
+
+
 class NSDFReader(object):
     """Reader for NSDF files.
     
     This class encapsulates an NSDF file and provides utility
     functions to read the data in an organized manner.
 
-    
+    Attributes:
+        processes (int): number of worker processes reading the
+            datasets of ONED populations, None if they are read in
+            the calling process.
 
     """
-    def __init__(self, filename):
+    def __init__(self, filename, processes=None):
+        """Open NSDF file for reading.
+
+        Args:
+            filename (str): path of the file.
+
+            processes (int): if specified, `get_event_data` and
+                `get_nonuniform_data` read the per-source datasets of
+                the ONED dialect in this many worker processes, each
+                opening the file read-only and reading a contiguous
+                range of the sources. Default: None.
+
+        """
+        if processes is not None and processes <= 0:
+            raise ValueError('`processes` must be a positive integer.')
+        self.processes = processes
         self._fd = h5.File(filename, 'r')
         self.data = self._fd['data']
         self.model = self._fd['model']
         self.mapping = self._fd['map']
         self.dialect = str(self._fd.attrs['dialect'])
+        self._source_cache = {}
+        self._uid_index = None
 
     def __del__(self):
         self._fd.close()
@@ -169,6 +250,52 @@ class NSDFReader(object):
         """
         return list(self.data['event'].keys())
 
+    def get_modeltree(self):
+        """Rebuild the model tree stored in the file.
+
+        Components stored as groups under `/model/modeltree` and as
+        rows of the tables in `/model/modeltable` are both included.
+        When the tables are present, the tree is an array-backed
+        ModelTree built directly from them.
+
+        Returns:
+            ModelComponent representing `/model/modeltree`, with the
+            stored components as its descendants.
+
+        """
+        root = ModelComponent('modeltree', uid='modeltree')
+        try:
+            stack = [(self.model['modeltree'], root)]
+        except KeyError:
+            stack = []
+        while stack:
+            group, component = stack.pop()
+            for name, subgroup in group.items():
+                if not isinstance(subgroup, h5.Group):
+                    continue
+                attrs = dict((key, value) for key, value in
+                             subgroup.attrs.items()
+                             if key not in ('uid', 'map'))
+                child = ModelComponent(name, uid=subgroup.attrs.get('uid'),
+                                       parent=component, attrs=attrs)
+                stack.append((subgroup, child))
+        try:
+            table = self.model['modeltable']
+        except KeyError:
+            return root
+        tree = ModelTree.from_arrays(table['parent'][()],
+                                     table['name'].asstr()[()],
+                                     table['uid'].asstr()[()])
+        for key, attrgrp in table['attrs'].items():
+            values = attrgrp['value']
+            if h5.check_string_dtype(values.dtype) is not None:
+                values = values.asstr()
+            for row, value in zip(attrgrp['index'][()], values[()]):
+                tree.node(row).attrs[key] = value
+        for child in list(root.children.values()):
+            tree.root.add_child(child)
+        return tree.root
+
     def get_uniform_vars(self, population):
         """Returns the names of uniform variables recorded for `population`.
 
@@ -286,27 +413,95 @@ class NSDFReader(object):
         Args:
             srcid (str): unique id of the source.
 
-            varname (str): name of the variable.
+            field (str): the recorded field of the source.
 
         Returns:
-            (data, unit, times, timeunit)
+            (data, unit, times, timeunit), or None if no data was
+            recorded for `field` from `srcid`.
 
         """
-        for srcmap in self.mapping[UNIFORM]:
-            sources = np.asarray(srcmap, dtype=str)
-            indices = np.where(sources == srcid)[0]
-            if indices:
-                index = indices[0]
-                for refinfo, dtype in sources.attrs['REFERENCE_LIST']:
-                    ref = refinfo[0]
-                    dataset = self._fd[ref]
-                    if dataset.attrs['field'] == field:
-                        data = np.asarray(dataset[index])
-                        unit =  dataset.attrs['unit']
-                        ts, tunit = self._get_or_create_uniform_ts(dataset)
-                        return (data, unit, ts, tunit)
-
-    def get_uniform_data(self, population, variable):
+        for stype, population, dataset, row in self.find_source(
+                srcid, UNIFORM, field):
+            data = self._read_uniform(dataset, [row])[0]
+            unit = dataset.attrs['unit']
+            ts, tunit = self._get_or_create_uniform_ts(dataset)
+            return (data, unit, ts, tunit)
+
+    def find_source(self, srcid, stype=None, field=None):
+        """Find the datasets recorded from the source with unique id
+        `srcid`, across all populations and sampling types.
+
+        The lookup uses an index from uid to datasets. It is read from
+        `/map/uid_index` if the file has one (see
+        `NSDFWriter.add_uid_index`), otherwise it is built by scanning
+        the maps on the first call. Later lookups take constant time.
+
+        Args:
+            srcid (str): unique id of the source.
+
+            stype (str): if specified, only datasets of this sampling
+                type (UNIFORM, NONUNIFORM, EVENT or STATIC) are
+                returned.
+
+            field (str): if specified, only datasets of this recorded
+                field are returned.
+
+        Returns:
+            list of (stype, population, dataset, row) tuples. `row` is
+            the position of the source in the population, i.e. the
+            row of `dataset` storing its data. In the 1D dialect
+            `dataset` is the source's own dataset for event and
+            nonuniform data.
+
+        """
+        return [(entry_stype, population, self._fd[ref], row)
+                for entry_stype, population, entry_field, row, ref
+                in self._get_uid_index().get(srcid, ())
+                if (stype is None or entry_stype == stype) and
+                (field is None or entry_field == field)]
+
+    def _get_uid_index(self):
+        """Return the dict mapping each uid to a list of (stype,
+        population, field, row, ref) entries, loading or building it
+        on first use."""
+        if self._uid_index is not None:
+            return self._uid_index
+        try:
+            table = self.mapping['uid_index']
+        except KeyError:
+            records = uid_records(self._fd)
+        else:
+            columns = [table[name] for name in UIDINDEXTYPE.names]
+            for ii, name in enumerate(UIDINDEXTYPE.names):
+                if h5.check_string_dtype(table.dtype[name]) is not None:
+                    columns[ii] = [value.decode('utf-8')
+                                   for value in columns[ii]]
+            records = zip(*columns)
+        index = {}
+        for uid, stype, population, row, field, ref in records:
+            entry = (stype, population, field, int(row), ref)
+            try:
+                index[uid].append(entry)
+            except KeyError:
+                index[uid] = [entry]
+        self._uid_index = index
+        return index
+
+    def _read_uniform(self, dataset, rows=None, start=None, stop=None):
+        """Read the columns `start` to `stop` of `rows` (all if None)
+        of the uniform `dataset`, converting scaled integers to
+        floating point values."""
+        if rows is None:
+            values = dataset[:, start:stop]
+        else:
+            values = read_rows(dataset, rows, (slice(start, stop),))
+        encoding = ScaleOffset.from_attrs(dataset.attrs)
+        if encoding is None:
+            return values
+        return encoding.decode(values)
+
+    def get_uniform_data(self, population, variable, t0=None, t1=None,
+                         sources=None):
         """Returns a UniformData object contents for recorded `variable`
         from `population`.
 
@@ -315,81 +510,407 @@ class NSDFReader(object):
 
             variable (str): name of the variable.
 
+            t0 (float): if specified, only the data sampled at or after
+                `t0` is read.
+
+            t1 (float): if specified, only the data sampled before `t1`
+                is read.
+
+            sources (sequence of str): if specified, only the data of
+                these sources is read, in this order.
+
         Returns:
 
-            dataobject (nsdf.UniformData): data container filled with
-                source, data, dt and units.
+            dataobject (nsdf.UniformBlockData): data container filled
+                with source, data, dt and units, with `tstart` set to
+                the time of the first column read. The rows are read
+                with one hyperslab read for each run of consecutive
+                rows, and the data of each source is a row of the
+                result. Data stored as scaled integers is converted to
+                float64.
+
+        Raises:
+            KeyError if any of `sources` is not in `population`.
 
         """
         data = self.data[UNIFORM][population][variable]
         mapping = self.mapping[UNIFORM][population]
-        ret = UniformData(data.name.rpartition('/')[-1],
-                          unit=data.attrs['unit'],
-                          field=data.attrs['field'],
-                          dt=data.attrs['dt'],
-                          tunit=data.attrs['tunit'],
-                          dtype=data.dtype)
-        for src, row in zip(mapping, data):
-            ret.put_data(src, row)
-        return ret
+        uids, rows = self._select_sources(mapping, sources)
+        tstart = data.attrs['tstart']
+        dt = data.attrs['dt']
+        ncols = data.shape[1]
+        start, stop = 0, ncols
+        if t0 is not None:
+            start = int(np.clip(np.ceil((t0 - tstart) / dt - 1e-9), 0, ncols))
+        if t1 is not None:
+            stop = int(np.clip(np.ceil((t1 - tstart) / dt - 1e-9), start,
+                               ncols))
+        return UniformBlockData(data.name.rpartition('/')[-1],
+                                uids,
+                                self._read_uniform(data, rows, start, stop),
+                                unit=data.attrs['unit'],
+                                field=data.attrs['field'],
+                                dt=dt,
+                                tunit=data.attrs['tunit'],
+                                tstart=tstart + start * dt)
+
+    def _source_index(self, mapping):
+        """Return the uids stored in the map dataset `mapping`, decoded
+        to str, and a dict mapping each uid to its row. These are cached
+        for later calls."""
+        try:
+            return self._source_cache[mapping.name]
+        except KeyError:
+            pass
+        uids = decode_uids(mapping)
+        index = dict((uid, row) for row, uid in enumerate(uids))
+        self._source_cache[mapping.name] = (uids, index)
+        return uids, index
+
+    def _select_sources(self, mapping, sources):
+        """Return the uids of `sources`, all the sources in `mapping` if
+        None, and the array of their rows in `mapping`.
+
+        Raises:
+            KeyError if any of `sources` is not in `mapping`.
+
+        """
+        uids, index = self._source_index(mapping)
+        if sources is None:
+            return uids, np.arange(len(uids))
+        sources = list(sources)
+        return sources, np.array([index[src] for src in sources],
+                                 dtype=np.int64)
 
     def _get_nonuniform_1d_data(self, data):
         ret = NonuniformData(data.name.rpartition('/')[-1],
                              unit=data.attrs['unit'],
                              field=data.attrs['field'])
-        for name, dset in list(data.items()):
-            times = dset.dims[0]['time']
-            ret.put_data(dset.attrs['source'], (np.asarray(dset),
-                                                np.asarray(times)))
-        ret.tunit = times.attrs['unit']
-        ret.dtype = dset.dtype
+        sources, rows = self._read_oned_group(data, True)
+        for src, (values, times) in zip(sources, rows):
+            ret.dtype = values.dtype
+            ret.put_data(src, (values, times))
+        if sources:
+            dataset = self._fd[self._fd[data.attrs['source']]['data', 0]]
+            ret.tunit = dataset.dims[0]['time'].attrs['unit']
         return ret
 
+    def _read_oned_group(self, data, with_times):
+        """Read the datasets of all the sources in the ONED `data`
+        group, and those of their time dimension scales if
+        `with_times` is True.
+
+        The datasets are located through the references in the map
+        instead of iterating over the group. With `processes`, the
+        sources are split into contiguous ranges read by a process
+        pool.
+
+        Returns:
+            (sources, rows): list of the source uids and the list of
+            the corresponding (values, times) tuples.
+
+        """
+        mapping = self._fd[data.attrs['source']]
+        sources, _ = self._source_index(mapping)
+        if self.processes is None or len(sources) < 2:
+            return sources, _read_oned(self._fd, mapping, 0, len(sources),
+                                       with_times)
+        # A few tasks per process to even out the load
+        bounds = np.linspace(0, len(sources),
+                             min(len(sources), 4 * self.processes) + 1)
+        bounds = bounds.astype(np.int64).tolist()
+        nranges = len(bounds) - 1
+        rows = []
+        with ProcessPoolExecutor(self.processes) as pool:
+            for part in pool.map(_read_oned_file,
+                                 [self._fd.filename] * nranges,
+                                 [mapping.name] * nranges,
+                                 bounds[:-1], bounds[1:],
+                                 [with_times] * nranges):
+                rows.extend(part)
+        return sources, rows
+
+    def _read_times(self, dataset, starts=None):
+        """Read the time values stored in the 1D `dataset`, converting
+        them from ticks if they are encoded. `starts` lists the start
+        positions of independently delta encoded segments."""
+        values = np.asarray(dataset)
+        encoding = TickEncoding.from_attrs(dataset.attrs)
+        if encoding is None:
+            return values
+        return encoding.decode(values, starts)
+
     def _get_nonuniform_regular_data(self, data):
-        mapping = data.dims[0]['source']
+        sources, _ = self._source_index(data.dims[0]['source'])
         times = data.dims[1]['time']
         ret = NonuniformRegularData(data.name.rpartition('/')[-1],
                                     unit=data.attrs['unit'],
                                     field=data.attrs['field'],
                                     tunit=times.attrs['unit'],
                                     dtype=data.dtype)
-        ret.set_times(times)
-        for ii in range(data.shape[0]):
-            ret.put_data(mapping[ii], data[ii])
         ret.set_times(np.asarray(times), tunit=times.attrs['unit'])
+        for start, stop in row_blocks(data):
+            for src, row in zip(sources[start:stop], data[start:stop]):
+                ret.put_data(src, row)
         return ret
 
+    def _get_vlen_rows(self, data):
+        """Read all rows of the VLEN dataset `data` in blocks. For
+        segmented datasets (2D, one column per appended block) the
+        segments of each row are joined."""
+        rows = []
+        for start, stop in row_blocks(data):
+            rows.extend(self._join_vlen(row, data)
+                        for row in data[start:stop])
+        return rows
+
+    def _join_vlen(self, row, data):
+        """Join the segments in `row` of the VLEN dataset `data` if it
+        is segmented. Rows of 1D VLEN datasets are returned as they
+        are."""
+        if data.ndim == 1:
+            return row
+        if len(row) == 0:
+            return np.empty((0,), dtype=data.dtype.metadata['vlen'])
+        return np.concatenate(row)
+
     def _get_nonuniform_vlen_data(self, data):
-        mapping = data.dims[0]['source']
+        sources, _ = self._source_index(data.dims[0]['source'])
         times = data.dims[0]['time']
         ret = NonuniformData(data.name.rpartition('/')[-1],
                              unit=data.attrs['unit'],
                              field=data.attrs['field'],
                              tunit=times.attrs['unit'],
                              dtype=np.float64) # h5 only supports vlen with 32 bit float, we convert it to float64
-        for ii in range(data.shape[0]):
-            ret.put_data(mapping[ii], (np.asarray(data[ii]),
-                                       np.asarray(times[ii])))
+        for src, row, trow in zip(sources, self._get_vlen_rows(data),
+                                  self._get_vlen_rows(times)):
+            ret.put_data(src, (row, trow))
         return ret
         
+    def _get_fill_lengths(self, data):
+        """Return the number of valid entries in each row of the NaN
+        padded dataset `data`.
+
+        The length index referred to by the `length` attribute is used
+        when present, otherwise the rows are scanned for the first NaN
+        in blocks.
+
+        """
+        try:
+            return np.asarray(self._fd[data.attrs['length']])
+        except KeyError:
+            pass
+        lengths = np.zeros(data.shape[0], dtype=np.int64)
+        for start, stop in row_blocks(data):
+            missing = np.isnan(data[start:stop])
+            lengths[start:stop] = np.where(missing.any(axis=1),
+                                           missing.argmax(axis=1),
+                                           data.shape[1])
+        return lengths
+
+    def _get_nan_rows(self, data, lengths):
+        """Iterate over the rows of the NaN padded dataset `data`
+        without the padding, given the row `lengths`. The rows are
+        read in blocks, each up to the longest row in it."""
+        ncols = int(lengths.max()) if len(lengths) else 0
+        for start, stop in row_blocks(data, ncols):
+            block = data[start:stop, :lengths[start:stop].max()]
+            for row, end in zip(block, lengths[start:stop]):
+                yield row[:end]
+
     def _get_nonuniform_nan_data(self, data):
-        mapping = data.dims[0]['source']
+        sources, _ = self._source_index(data.dims[0]['source'])
         times = data.dims[1]['time']
         ret = NonuniformData(data.name.rpartition('/')[-1],
                              unit=data.attrs['unit'],
                              field=data.attrs['field'],
                              tunit=times.attrs['unit'])
-        for iii in range(data.shape[0]):
-            try:
-                starts = next(find(data[iii], np.isnan))[0][0]
-            except StopIteration:
-                starts = len(data[iii])                
-            cleaned_data = np.asarray(data[iii,:starts])
-            cleaned_times = np.asarray(times[iii,:starts])
-            ret.put_data(mapping[iii], (cleaned_data, cleaned_times))
+        lengths = self._get_fill_lengths(data)
+        for src, row, trow in zip(sources, self._get_nan_rows(data, lengths),
+                                  self._get_nan_rows(times, lengths)):
+            ret.put_data(src, (row, trow))
         return ret
 
-    def get_nonuniform_data(self, population, variable):
+    def _get_ragged_rows(self, data):
+        """Return the source uids and the offsets index of the flat dataset
+        `data` in RAGGED dialect."""
+        mapping = self._fd[data.attrs['source']]
+        offsets = np.asarray(self._fd[data.attrs['offsets']])
+        sources, _ = self._source_index(mapping)
+        return sources, offsets
+
+    def _ragged_row(self, values, offsets, index):
+        """Extract the data for the source at `index` from the flat array
+        `values`. Each row of `offsets` lists the positions of the data
+        of all sources in one block of `values`."""
+        if offsets.shape[0] == 1:
+            return values[offsets[0, index]: offsets[0, index + 1]]
+        return np.concatenate([values[start: end] for start, end in
+                               zip(offsets[:, index], offsets[:, index + 1])])
+
+    def _get_nonuniform_ragged_data(self, data):
+        times = data.dims[0]['time']
+        sources, offsets = self._get_ragged_rows(data)
+        values = np.asarray(data)
+        tvalues = self._read_times(times, offsets[:, :-1].ravel())
+        ret = NonuniformData(data.name.rpartition('/')[-1],
+                             unit=data.attrs['unit'],
+                             field=data.attrs['field'],
+                             tunit=times.attrs['unit'],
+                             dtype=data.dtype,
+                             ttype=tvalues.dtype)
+        for iii, src in enumerate(sources):
+            ret.put_data(src, (self._ragged_row(values, offsets, iii),
+                               self._ragged_row(tvalues, offsets, iii)))
+        return ret
+
+    def _read_window(self, times, values, t0, t1, start=0, stop=None,
+                     row=None, count=False):
+        """Read the entries of sorted `times` in the range [start, stop)
+        (of row `row` if it is a 2D dataset) that fall in the time
+        window [t0, t1), and the entries of `values` at the same
+        positions. Either end of the window may be None.
+
+        Returns:
+            (times, values) arrays, with values None if `values` is
+            None. If `count` is True, (n, None) instead, where n is the
+            number of entries in the window, and no data is read
+            beyond what is needed to locate the window.
+
+        """
+        if stop is None:
+            stop = times.shape[-1]
+
+        def select(lo, hi):
+            return slice(lo, hi) if row is None else (row, slice(lo, hi))
+
+        encoding = TickEncoding.from_attrs(times.attrs)
+        if encoding is not None and encoding.delta:
+            # Delta encoded ticks cannot be bisected on file
+            tvalues = encoding.decode(times[select(start, stop)])
+            lo = 0 if t0 is None else np.searchsorted(tvalues, t0)
+            hi = len(tvalues) if t1 is None else \
+                np.searchsorted(tvalues, t1)
+            if count:
+                return hi - lo, None
+            tvalues = tvalues[lo: hi]
+            lo, hi = start + lo, start + hi
+        else:
+            scale = (lambda t: t) if encoding is None else \
+                (lambda t: (t - encoding.tstart) / encoding.dt)
+            lo = start if t0 is None else \
+                bisect_dataset(times, scale(t0), start, stop, row)
+            hi = stop if t1 is None else \
+                bisect_dataset(times, scale(t1), lo, stop, row)
+            if count:
+                return hi - lo, None
+            tvalues = times[select(lo, hi)]
+            if encoding is not None:
+                tvalues = encoding.decode(tvalues)
+        if values is not None:
+            values = values[select(lo, hi)]
+        return tvalues, values
+
+    def _read_windows(self, stype, data, t0, t1, sources, count=False):
+        """Read the data in the time window [t0, t1) for `sources` (all
+        if None) from the event or nonuniform `data` of any dialect
+        except NUREGULAR nonuniform data.
+
+        Returns:
+            (items, tunit): items is a list of (uid, times, values)
+            tuples, where values is None for event data, and tunit is
+            the unit of the times. If `count` is True, the number of
+            entries in the window takes the place of times and values
+            is None.
+
+        """
+        items = []
+        if isinstance(data, h5.Group):
+            mapping = self._fd[data.attrs['source']]
+            uids, rows = self._select_sources(mapping, sources)
+            refs = mapping['data']
+            tunit = data.attrs['unit']
+            for uid, row in zip(uids, rows):
+                dataset = self._fd[refs[row]]
+                if stype == EVENT:
+                    times, values = dataset, None
+                else:
+                    times, values = dataset.dims[0]['time'], dataset
+                    tunit = times.attrs['unit']
+                items.append((uid,) + self._read_window(
+                    times, values, t0, t1, count=count))
+            return items, tunit
+        if self.dialect == dialect.RAGGED:
+            mapping = self._fd[data.attrs['source']]
+            axis = 0
+        else:
+            mapping = data.dims[0]['source']
+            axis = 0 if self.dialect == dialect.VLEN else 1
+        if stype == EVENT:
+            times, values = data, None
+            tunit = data.attrs['unit']
+        else:
+            times, values = data.dims[axis]['time'], data
+            tunit = times.attrs['unit']
+        uids, rows = self._select_sources(mapping, sources)
+        if self.dialect == dialect.VLEN:
+            trows = [self._join_vlen(row, times)
+                     for row in read_rows(times, rows)]
+            vrows = [None] * len(rows) if values is None or count else \
+                [self._join_vlen(row, values)
+                 for row in read_rows(values, rows)]
+            for uid, trow, vrow in zip(uids, trows, vrows):
+                trow = np.asarray(trow, dtype=np.float64)
+                lo = 0 if t0 is None else np.searchsorted(trow, t0)
+                hi = len(trow) if t1 is None else np.searchsorted(trow, t1)
+                if count:
+                    items.append((uid, hi - lo, None))
+                    continue
+                if vrow is not None:
+                    vrow = np.asarray(vrow, dtype=np.float64)[lo: hi]
+                items.append((uid, trow[lo: hi], vrow))
+        elif self.dialect == dialect.RAGGED:
+            offsets = np.asarray(self._fd[data.attrs['offsets']])
+            for uid, row in zip(uids, rows):
+                parts = [self._read_window(times, values, t0, t1, start,
+                                           stop, count=count)
+                         for start, stop in zip(offsets[:, row],
+                                                offsets[:, row + 1])]
+                if count:
+                    items.append((uid, sum(part[0] for part in parts), None))
+                    continue
+                tparts = [part[0] for part in parts]
+                vparts = None if values is None else \
+                    np.concatenate([part[1] for part in parts])
+                items.append((uid, np.concatenate(tparts), vparts))
+        else:
+            lengths = self._get_fill_lengths(data)
+            for uid, row in zip(uids, rows):
+                items.append((uid,) + self._read_window(
+                    times, values, t0, t1, 0, lengths[row], row, count))
+        return items, tunit
+
+    def _get_nonuniform_regular_window(self, data, t0, t1, sources):
+        """Read the NUREGULAR nonuniform `data` in the time window [t0,
+        t1) for `sources`."""
+        times = data.dims[1]['time']
+        uids, rows = self._select_sources(data.dims[0]['source'], sources)
+        lo = 0 if t0 is None else bisect_dataset(times, t0)
+        hi = times.shape[0] if t1 is None else \
+            bisect_dataset(times, t1, lo)
+        ret = NonuniformRegularData(data.name.rpartition('/')[-1],
+                                    unit=data.attrs['unit'],
+                                    field=data.attrs['field'],
+                                    tunit=times.attrs['unit'],
+                                    dtype=data.dtype)
+        ret.set_times(np.asarray(times[lo: hi]))
+        block = read_rows(data, rows, (slice(lo, hi),))
+        for uid, values in zip(uids, block):
+            ret.put_data(uid, values)
+        return ret
+
+    def get_nonuniform_data(self, population, variable, t0=None, t1=None,
+                            sources=None):
         """Get nonuniform data `variable` under `population`.
 
         In NSDF a variable is recorded from a population of sources
@@ -407,21 +928,60 @@ class NSDFReader(object):
 
             variable (str): name of the variable this data represents.
 
+            t0 (float): if specified, only the data sampled at or after
+                `t0` is read.
+
+            t1 (float): if specified, only the data sampled before `t1`
+                is read.
+
+            sources (sequence of str): if specified, only the data of
+                these sources is read.
+
         Returns:
             nsdf.NonuniformRegularData if dialect of the file is NUREGULAR.
             nsdf.NonuniformData otherwise.
 
-        Note: Data is converted to float64 for VLEN dialect.
+        Raises:
+            KeyError if any of `sources` is not in `population`.
+
+        Note: Data is converted to float64 for VLEN dialect. The
+            boundaries of a time window are located by bisection on
+            the sampling times, which are sorted, so that only the
+            data within the window is read (except for the VLEN
+            dialect, where rows can only be read whole).
 
         """
         data = self.data[NONUNIFORM][population][variable]
-        mapping = self.mapping[NONUNIFORM][population]
+        if (t0, t1, sources) != (None, None, None):
+            if self.dialect == dialect.NUREGULAR:
+                return self._get_nonuniform_regular_window(data, t0, t1,
+                                                           sources)
+            items, tunit = self._read_windows(NONUNIFORM, data, t0, t1,
+                                              sources)
+            if self.dialect == dialect.VLEN:
+                dtype = np.float64
+            elif isinstance(data, h5.Group):
+                # ONED: the type of the per-source datasets
+                dtype = next((dataset.dtype for dataset in data.values()),
+                             np.float64)
+            else:
+                dtype = data.dtype
+            ret = NonuniformData(data.name.rpartition('/')[-1],
+                                 unit=data.attrs['unit'],
+                                 field=data.attrs['field'],
+                                 tunit=tunit,
+                                 dtype=dtype)
+            for src, times, values in items:
+                ret.put_data(src, (values, times))
+            return ret
         if self.dialect == dialect.NUREGULAR:
             return self._get_nonuniform_regular_data(data)
         elif self.dialect == dialect.VLEN:
             return self._get_nonuniform_vlen_data(data)
         elif self.dialect == dialect.NANPADDED:
             return self._get_nonuniform_nan_data(data)
+        elif self.dialect == dialect.RAGGED:
+            return self._get_nonuniform_ragged_data(data)
         else:
             return self._get_nonuniform_1d_data(data)
 
@@ -429,10 +989,10 @@ class NSDFReader(object):
         ret = EventData(datagroup.name.rpartition('/')[-1],
                         unit=datagroup.attrs['unit'],
                         field=datagroup.attrs['field'])
-        for name, dataset in list(datagroup.items()):
-            ret.put_data(dataset.attrs['source'],
-                         np.asarray(dataset))
-        ret.dtype = dataset.dtype
+        sources, rows = self._read_oned_group(datagroup, False)
+        for src, (values, _) in zip(sources, rows):
+            ret.dtype = values.dtype
+            ret.put_data(src, values)
         return ret
 
     def _get_event_vlen_data(self, data):
@@ -440,10 +1000,9 @@ class NSDFReader(object):
                         unit=data.attrs['unit'],
                         field=data.attrs['field'],
                         dtype=np.float64) # h5 only supports vlen with 32 bit float, we convert it to float64
-        mapping = data.dims[0]['source']
-        for iii in range(data.shape[0]):
-            row = np.asarray(data[iii])
-            ret.put_data(mapping[iii], row)
+        sources, _ = self._source_index(data.dims[0]['source'])
+        for src, row in zip(sources, self._get_vlen_rows(data)):
+            ret.put_data(src, row)
         return ret
 
     def _get_event_nan_data(self, data):
@@ -451,17 +1010,104 @@ class NSDFReader(object):
                         unit=data.attrs['unit'],
                         field=data.attrs['field'],
                         dtype=data.dtype)
-        mapping = data.dims[0]['source']
-        for iii in range(data.shape[0]):
-            try:
-                starts = next(find(data[iii], np.isnan))[0][0]
-            except StopIteration:
-                starts = len(data[iii])                
-            cleaned_data = np.asarray(data[iii,:starts])
-            ret.put_data(mapping[iii], cleaned_data)
+        sources, _ = self._source_index(data.dims[0]['source'])
+        lengths = self._get_fill_lengths(data)
+        for src, row in zip(sources, self._get_nan_rows(data, lengths)):
+            ret.put_data(src, row)
+        return ret
+
+    def _get_event_ragged_data(self, data):
+        sources, offsets = self._get_ragged_rows(data)
+        values = self._read_times(data, offsets[:, :-1].ravel())
+        ret = EventData(data.name.rpartition('/')[-1],
+                        unit=data.attrs['unit'],
+                        field=data.attrs['field'],
+                        dtype=values.dtype)
+        for iii, src in enumerate(sources):
+            ret.put_data(src, self._ragged_row(values, offsets, iii))
         return ret
 
-    def get_event_data(self, population, variable):
+    def get_event_counts(self, population, variable, t0=None, t1=None,
+                         sources=None):
+        """Count the events of each source in the time window [t0, t1).
+
+        The event times of each source are sorted, so the boundaries
+        of the window are located by bisection, first over the chunks
+        of the dataset and then within a single chunk. Only the chunks
+        probed on the way are read, and none of the event times in
+        between. Rows of VLEN datasets can only be read whole.
+
+        Args:
+            population (str): name of the population from which this
+                data was recorded.
+
+            variable (str): name of the variable this data represents.
+
+            t0 (float): start of the window. If None, events are
+                counted from the beginning.
+
+            t1 (float): end of the window. If None, events are counted
+                till the end.
+
+            sources (sequence of str): if specified, only the events of
+                these sources are counted, in this order.
+
+        Returns:
+            (sources, counts): list of the uids of the sources and
+            numpy.ndarray of the number of events of each.
+
+        Raises:
+            KeyError if any of `sources` is not in `population`.
+
+        """
+        data = self.data[EVENT][population][variable]
+        items, _ = self._read_windows(EVENT, data, t0, t1, sources,
+                                      count=True)
+        return ([item[0] for item in items],
+                np.array([item[1] for item in items], dtype=np.int64))
+
+    def get_event_source_data(self, population, variable, srcid):
+        """Get the event times recorded in `variable` from a single source.
+
+        This is only supported for the RAGGED dialect, where it reads
+        just the slices of the flat dataset that belong to `srcid`:
+        one slice per block appended by the writer, so the cost grows
+        with the number of blocks.
+
+        Args:
+            population (str): name of the population from which this
+                data was recorded.
+
+            variable (str): name of the variable this data represents.
+
+            srcid (str): unique id of the source.
+
+        Returns:
+            numpy.ndarray: event times for the source.
+
+        Raises:
+            ValueError if dialect of the file is not RAGGED.
+
+            KeyError if `srcid` is not in `population`.
+
+        """
+        if self.dialect != dialect.RAGGED:
+            raise ValueError('only supported for dialect=RAGGED')
+        data = self.data[EVENT][population][variable]
+        _, index = self._source_index(self._fd[data.attrs['source']])
+        row = index[srcid]
+        # Only the start and end columns of the source in each block
+        offsets = self._fd[data.attrs['offsets']][:, row: row + 2]
+        values = self._ragged_row(data, offsets, 0)
+        encoding = TickEncoding.from_attrs(data.attrs, data.dtype)
+        if encoding is None:
+            return values
+        # Each block of the source is a separately encoded segment
+        lengths = offsets[:, 1] - offsets[:, 0]
+        return encoding.decode(values, np.cumsum(lengths)[:-1])
+
+    def get_event_data(self, population, variable, t0=None, t1=None,
+                       sources=None):
         """Get event variable recorded from population.
 
         In NSDF a variable is recorded from a population of sources
@@ -475,16 +1121,42 @@ class NSDFReader(object):
 
             variable (str): name of the variable this data represents.
 
+            t0 (float): if specified, only the events at or after `t0`
+                are read.
+
+            t1 (float): if specified, only the events before `t1` are
+                read.
+
+            sources (sequence of str): if specified, only the events of
+                these sources are read.
+
         Returns: nsdf.EventData
 
-        Note: Data is converted to float64 for VLEN dialect.
+        Raises:
+            KeyError if any of `sources` is not in `population`.
+
+        Note: Data is converted to float64 for VLEN dialect. The
+            boundaries of a time window are located by bisection on
+            the sorted event times, so that only the events within
+            the window are read (except for the VLEN dialect, where
+            rows can only be read whole).
 
         """
         data = self.data[EVENT][population][variable]
+        if (t0, t1, sources) != (None, None, None):
+            items, _ = self._read_windows(EVENT, data, t0, t1, sources)
+            ret = EventData(data.name.rpartition('/')[-1],
+                            unit=data.attrs['unit'],
+                            field=data.attrs['field'])
+            for src, times, _ in items:
+                ret.put_data(src, times)
+            return ret
         if self.dialect == dialect.VLEN:
             return self._get_event_vlen_data(data)
         elif self.dialect == dialect.NANPADDED:
             return self._get_event_nan_data(data)
+        elif self.dialect == dialect.RAGGED:
+            return self._get_event_ragged_data(data)
         else:
             return self._get_event_1d_data(data)
             
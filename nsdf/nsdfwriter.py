@@ -52,14 +52,25 @@ except ImportError as e:
     from __builtin__ import range
     from __builtin__ import object
 
+import copy
+import functools
 import h5py as h5
 import numpy as np
 import os
+import threading
 import warnings
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
 
-from .model import ModelComponent, common_prefix
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from .model import ModelComponent, ModelTree, common_prefix
 from .constants import *
 from .util import *
+from .nsdfdata import UniformBlockData
 from datetime import datetime
 
 def match_datasets(hdfds, pydata):
@@ -168,6 +179,438 @@ def write_dir_contents(root_group, root_dir, ascii, **compression_opts):
                 dset = write_binary_file(grp, dset_name, file_path, **compression_opts)
 
 
+def deflate_chunk(block, level, shuffle):
+    """Encode `block` the way the HDF5 shuffle and deflate (gzip)
+    filters would store it in a chunk.
+
+    Args:
+        block (numpy.ndarray): contents of the chunk.
+
+        level (int): gzip compression level (0-9).
+
+        shuffle (bool): whether to apply the byte shuffle filter
+            before compression.
+
+    Returns:
+        bytes: the compressed chunk.
+
+    """
+    block = np.ascontiguousarray(block)
+    if shuffle and block.dtype.itemsize > 1:
+        block = block.reshape(-1).view(np.uint8).reshape(
+            -1, block.dtype.itemsize).T
+    return zlib.compress(np.ascontiguousarray(block).tobytes(), level)
+
+
+class _ChunkCompressor(object):
+    """Compresses the chunks of gzip-compressed 2D datasets in a thread
+    pool and stores them with direct chunk writes, bypassing the HDF5
+    filter pipeline, which runs on the writing thread.
+
+    Only chunks that are entirely covered by the written columns, or
+    lie at the end of the dataset, are written directly. The rest of
+    the data, and datasets with filters other than gzip and shuffle,
+    are written through h5py as usual. Since the chunks are encoded
+    exactly as by the HDF5 filters, the file can be read by any HDF5
+    library.
+
+    Attributes:
+        pool (concurrent.futures.ThreadPoolExecutor): the threads
+            compressing the chunks. zlib releases the GIL while
+            compressing.
+
+    """
+    def __init__(self, threads):
+        self.pool = ThreadPoolExecutor(threads)
+
+    def supports(self, dataset):
+        """Whether the chunks of `dataset` can be written directly."""
+        return (dataset.ndim == 2 and dataset.chunks is not None and
+                dataset.compression == 'gzip' and not dataset.fletcher32
+                and dataset.scaleoffset is None)
+
+    def write(self, dataset, data, start):
+        """Write 2D array `data` into the columns of `dataset` starting
+        at `start`. The dataset must already extend to the end of the
+        written columns."""
+        end = start + data.shape[1]
+        if not self.supports(dataset):
+            dataset[:, start:end] = data
+            return
+        nrows, ncols = dataset.shape
+        rowchunk, colchunk = dataset.chunks
+        # Columns before the first chunk boundary go through HDF5
+        first = min(-(-start // colchunk) * colchunk, end)
+        if first > start:
+            dataset[:, start:first] = data[:, :first - start]
+        offsets = []
+        blocks = []
+        for col in range(first, end, colchunk):
+            stop = min(col + colchunk, end)
+            if stop - col < colchunk and stop < ncols:
+                dataset[:, col:stop] = data[:, col - start:stop - start]
+                continue
+            for row in range(0, nrows, rowchunk):
+                block = np.full(dataset.chunks, dataset.fillvalue,
+                                dtype=dataset.dtype)
+                rowstop = min(row + rowchunk, nrows)
+                block[:rowstop - row, :stop - col] = \
+                    data[row:rowstop, col - start:stop - start]
+                offsets.append((row, col))
+                blocks.append(block)
+        level = dataset.compression_opts
+        encoded = self.pool.map(deflate_chunk, blocks,
+                                [level] * len(blocks),
+                                [dataset.shuffle] * len(blocks))
+        for offset, chunk in zip(offsets, encoded):
+            dataset.id.write_direct_chunk(offset, chunk)
+
+    def shutdown(self):
+        self.pool.shutdown()
+
+
+def write_columns(dataset, data, compressor=None, start=None):
+    """Append the columns of 2D array `data` to the end of 2D `dataset`
+    along axis 1.
+
+    Args:
+        dataset (h5py.Dataset): a 2D dataset resizable along axis 1.
+
+        data (numpy.ndarray): 2D array with as many rows as `dataset`.
+
+        compressor (_ChunkCompressor): if specified, used for writing
+            compressed chunks in parallel.
+
+        start (int): if specified, column at which the data is
+            written. The dataset is resized only if the data extends
+            beyond its current length. Used for datasets preallocated
+            at their expected length. Default: None (append after the
+            last column).
+
+    Returns:
+        None
+
+    """
+    if start is None:
+        start = dataset.shape[1]
+    stop = start + data.shape[1]
+    if stop > dataset.shape[1]:
+        dataset.resize(stop, axis=1)
+    if compressor is None:
+        dataset.write_direct(np.ascontiguousarray(data),
+                             dest_sel=np.s_[:, start:stop])
+    else:
+        compressor.write(dataset, data, start)
+
+
+def _table_values(key, values, dtype=None):
+    """Return the values of attribute `key` listed in `values` as an
+    array to be stored in a column of the model tables, and the HDF5
+    type of the column.
+
+    Args:
+        key (str): name of the attribute.
+
+        values (list): the values of the attribute.
+
+        dtype (numpy.dtype): type of the existing column, None if it
+            is created for these values.
+
+    Raises:
+        ValueError if the values are not all strings or all numbers,
+        or if any of them cannot be represented exactly in the type
+        of the column.
+
+    """
+    column = np.asarray(values)
+    if column.dtype.kind == 'U':
+        if any(not isinstance(value, str) for value in values) or \
+           (dtype is not None and h5.check_string_dtype(dtype) is None):
+            raise ValueError('values of attribute {} cannot be stored'
+                             ' in a table of strings'.format(key))
+        return column.astype(object), VLENSTR
+    if column.dtype.kind not in 'biuf' or \
+       (dtype is not None and dtype.kind not in 'biuf'):
+        raise ValueError('values of attribute {} cannot be stored'
+                         ' in a table'.format(key))
+    if dtype is None:
+        dtype = column.dtype
+    with np.errstate(all='ignore'):
+        stored = column.astype(dtype)
+    if not all(np.array_equal(value, item) for value, item in
+               zip(values, stored)):
+        raise ValueError('values of attribute {} cannot be represented'
+                         ' as {}'.format(key, dtype))
+    return stored, dtype
+
+
+def append_table(group, name, values):
+    """Append `values` to the resizable dataset `name` under `group`
+    along the first axis."""
+    dataset = group[name]
+    start = dataset.shape[0]
+    dataset.resize(start + len(values), axis=0)
+    dataset[start:] = values
+
+
+class _ColumnBuffer(object):
+    """In-memory write buffer for a 2D (source, time) dataset.
+
+    Columns appended to the buffer are copied into a preallocated
+    array and written to the dataset only when `size` columns have
+    accumulated, or when the buffer is flushed explicitly. When `size`
+    matches the chunk length of the dataset along axis 1, each write
+    covers whole chunks.
+
+    Attributes:
+        dataset (h5py.Dataset): the dataset the buffer writes into.
+
+        size (int): number of columns held by the buffer.
+
+        fill (int): number of columns currently in the buffer.
+
+        compressor (_ChunkCompressor): used for writing compressed
+            chunks in parallel, if not None.
+
+        start (int): column of the dataset where the next block is
+            written, if it is preallocated. None if blocks are appended
+            after its last column.
+
+    """
+    def __init__(self, dataset, size, compressor=None, start=None):
+        self.dataset = dataset
+        self.size = size
+        self.compressor = compressor
+        self.start = start
+        self.fill = 0
+        self._buf = np.empty((dataset.shape[0], size), dtype=dataset.dtype)
+
+    def append(self, data):
+        """Add the columns of 2D array `data` to the buffer, writing out
+        every block of `size` columns that gets completed."""
+        start = 0
+        ncols = data.shape[1]
+        while start < ncols:
+            if self.fill == 0 and ncols - start >= self.size:
+                # Whole blocks bypass the buffer
+                stop = start + (ncols - start) // self.size * self.size
+                self._write(data[:, start:stop])
+                start = stop
+                continue
+            count = min(self.size - self.fill, ncols - start)
+            self._buf[:, self.fill: self.fill + count] = \
+                data[:, start: start + count]
+            self.fill += count
+            start += count
+            if self.fill == self.size:
+                self.flush()
+
+    def flush(self):
+        """Write the buffered columns to the dataset."""
+        if self.fill == 0:
+            return
+        self._write(self._buf[:, :self.fill])
+        self.fill = 0
+
+    def _write(self, data):
+        write_columns(self.dataset, data, self.compressor, self.start)
+        if self.start is not None:
+            self.start += data.shape[1]
+
+
+def append_vlen_rows(dataset, rows):
+    """Append the arrays in `rows` to the corresponding rows of the VLEN
+    `dataset`.
+
+    If `dataset` is 1D, each row is read, extended and written back,
+    using one bulk read and one bulk write for the whole dataset, so
+    each append costs time proportional to the data already written
+    (see `vlen_segments` of NSDFWriter). If
+    it is 2D, with one row per source and one column per appended
+    segment, `rows` is written as a new column without reading
+    existing data.
+
+    Args:
+        dataset (h5py.Dataset): VLEN dataset with one row per source.
+
+        rows (sequence of numpy.ndarray): data to be appended to each
+            row.
+
+    Returns:
+        None
+
+    """
+    # Filled element by element and written with write_direct: numpy
+    # and h5py would otherwise broadcast arrays of equal length into a
+    # 2D array
+    column = np.empty(len(rows), dtype=object)
+    if dataset.ndim == 2:
+        for ii, row in enumerate(rows):
+            column[ii] = np.asarray(row)
+        ncols = dataset.shape[1] + 1
+        dataset.resize(ncols, axis=1)
+        if len(column):
+            dataset.write_direct(column[:, np.newaxis],
+                                 dest_sel=np.s_[:, ncols - 1: ncols])
+    else:
+        old = dataset[()]
+        for ii, (head, tail) in enumerate(zip(old, rows)):
+            column[ii] = np.concatenate((head, tail))
+        if len(column):
+            dataset.write_direct(column)
+
+
+class _VlenBuffer(object):
+    """In-memory write buffer for VLEN datasets sharing the same rows
+    (e.g. data and sampling times of a nonuniform population).
+
+    The data appended to each row is held in memory until `size`
+    elements per row have accumulated on average, or until the buffer
+    is flushed explicitly. Then each dataset is extended with a single
+    bulk write.
+
+    Attributes:
+        datasets (tuple of h5py.Dataset): datasets the buffer writes
+            into.
+
+        size (int): average number of elements per row held by the
+            buffer before it is flushed.
+
+    """
+    def __init__(self, datasets, size):
+        self.datasets = datasets
+        self.size = size
+        self._tails = [[[] for ii in range(ds.shape[0])]
+                       for ds in datasets]
+        self._count = 0
+        self._pending = False
+
+    def append(self, rows_list):
+        """Append the rows in `rows_list[i]` to `datasets[i]`."""
+        for tails, rows in zip(self._tails, rows_list):
+            for tail, row in zip(tails, rows):
+                tail.append(np.asarray(row))
+        self._pending = True
+        self._count += sum(len(row) for row in rows_list[0])
+        if self._count >= self.size * len(self._tails[0]):
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows to the datasets."""
+        if not self._pending:
+            return
+        for ds, tails in zip(self.datasets, self._tails):
+            rows = [np.concatenate(tail) if tail else
+                    np.empty((0,), dtype=ds.dtype.metadata['vlen'])
+                    for tail in tails]
+            append_vlen_rows(ds, rows)
+            for tail in tails:
+                del tail[:]
+        self._count = 0
+        self._pending = False
+
+
+def data_nbytes(data_object):
+    """Return the number of bytes occupied by the arrays stored in
+    `data_object`, or in each of them if it is a list of data
+    objects."""
+    if isinstance(data_object, (list, tuple)):
+        return sum(data_nbytes(item) for item in data_object)
+    nbytes = 0
+    for data in data_object.get_all_data():
+        if isinstance(data, tuple):
+            nbytes += sum(np.asarray(item).nbytes for item in data)
+        else:
+            nbytes += np.asarray(data).nbytes
+    return nbytes
+
+
+class _IOThread(object):
+    """Background thread executing the writes queued by an asynchronous
+    NSDFWriter in the order they were submitted.
+
+    Submitting blocks while the data already queued would exceed
+    `maxbytes`. A single submission larger than `maxbytes` is accepted
+    when the queue is empty.
+
+    """
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.pending = 0
+        self.error = None
+        self._cond = threading.Condition()
+        self._queue = queue.Queue()
+        self.thread = threading.Thread(target=self._run,
+                                       name='NSDFWriter-io')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, nbytes, func, *args, **kwargs):
+        """Queue `func(*args, **kwargs)` and return a Future for its
+        result."""
+        future = Future()
+        with self._cond:
+            while self.pending > 0 and self.pending + nbytes > self.maxbytes:
+                self._cond.wait()
+            self.pending += nbytes
+        self._queue.put((future, nbytes, func, args, kwargs))
+        return future
+
+    def _run(self):
+        while True:
+            task = self._queue.get()
+            try:
+                if task is None:
+                    return
+                future, nbytes, func, args, kwargs = task
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(func(*args, **kwargs))
+                    except Exception as error:
+                        future.set_exception(error)
+                        if self.error is None:
+                            self.error = error
+                with self._cond:
+                    self.pending -= nbytes
+                    self._cond.notify_all()
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait for all queued writes to complete. Re-raises the first
+        error from a write since the last call."""
+        self._queue.join()
+        error, self.error = self.error, None
+        if error is not None:
+            raise error
+
+    def stop(self):
+        """Finish the queued writes and stop the thread."""
+        self._queue.put(None)
+        self.thread.join()
+
+
+def _queued(method):
+    """Make the data writing `method` of NSDFWriter run in the
+    background I/O thread when the writer was created with
+    `async_io=True`. A snapshot of the data object and of any array
+    arguments is queued so that the caller is free to modify them, and
+    a Future for the return value is returned instead."""
+    @functools.wraps(method)
+    def wrapper(self, source_ds, data_object, *args, **kwargs):
+        if self._io is None or \
+           threading.current_thread() is self._io.thread:
+            return method(self, source_ds, data_object, *args, **kwargs)
+        data_object, args, kwargs = copy.deepcopy((data_object, args,
+                                                   kwargs))
+        nbytes = data_nbytes(data_object) + sum(
+            arg.nbytes for arg in list(args) + list(kwargs.values())
+            if isinstance(arg, np.ndarray))
+        return self._io.submit(nbytes, method, self, source_ds,
+                               data_object, *args, **kwargs)
+    return wrapper
+
+
 class NSDFWriter(object):
     """Writer for NSDF files.
 
@@ -202,8 +645,37 @@ class NSDFWriter(object):
             stores the unique identifier of the model component it
             represents in the string attribute `uid`.
 
+        buffersize (int): number of columns of uniformly sampled data
+            accumulated in memory for each dataset before writing to
+            file. None if buffering is disabled.
+
+        access (nsdf.access member): expected access pattern of the 2D
+            datasets, used for choosing their chunk shapes.
+
+        vlen_segments (bool): whether VLEN datasets store each append
+            as a separate segment (column).
+
+        async_io (bool): whether data is written by a background
+            thread.
+
+        compress_threads (int): number of threads compressing the
+            chunks of uniformly sampled data, None if HDF5 compresses
+            them.
+
+        expected_length (int): expected number of sampling points of
+            uniformly sampled datasets for which no length was set
+            with `set_expected_length`. None if not known.
+
+        time_encoding (nsdf.TickEncoding): encoding of the event times
+            and sampling times of nonuniform data in new datasets,
+            None if they are stored as floating point values.
+
     """
-    def __init__(self, filename, dialect=dialect.ONED, mode='a', **h5args):
+    def __init__(self, filename, dialect=dialect.ONED, mode='a',
+                 buffersize=None, access=access.TIMEMAJOR,
+                 vlen_segments=False, async_io=False,
+                 io_queue_bytes=IO_QUEUE_BYTES, compress_threads=None,
+                 expected_length=None, time_encoding=None, **h5args):
         """Initialize NSDF writer.
 
         Args:
@@ -216,6 +688,74 @@ class NSDFWriter(object):
             mode (str): file write mode. Default is 'a', which is also
                 the default of h5py.File.
 
+            buffersize (int): if specified, data appended with
+                `add_uniform_data` is accumulated in memory and
+                written to file in blocks of `buffersize` columns,
+                which is also used as the chunk length along the time
+                axis. Buffered data is written out by `flush()` and
+                `close()`. Default: None (no buffering).
+
+            access (nsdf.access member): how the 2D (source, time)
+                datasets are going to be accessed. TIMEMAJOR if they
+                are mostly appended to and read in blocks of time
+                covering all sources, SOURCEMAJOR if they are mostly
+                read one source at a time. The chunk shapes of the
+                datasets are chosen accordingly, unless `chunks` is
+                passed explicitly in `h5args`. Default: TIMEMAJOR.
+
+            vlen_segments (bool): if True, VLEN datasets are created
+                2D, with one row per source and one column for each
+                block of data appended to them. Appending then writes
+                a new column without reading the existing data, so
+                incremental writing is linear in recording length. If
+                False, the VLEN datasets are 1D and appending rewrites
+                every row. With `buffersize`, appends to VLEN datasets
+                are accumulated in memory and written out on average
+                `buffersize` elements per row at a time. Default:
+                False.
+
+            async_io (bool): if True, the `add_*_data`, `add_*_1d`,
+                `add_*_vlen`, `add_*_nan`, `add_*_ragged`,
+                `add_*_array`, `add_uniform_batch` and
+                `add_nonuniform_regular` methods queue a copy of the
+                data and return immediately with a
+                `concurrent.futures.Future` for the dataset. A
+                dedicated thread performs the HDF5 writes in the
+                order they were queued, so that computation can
+                overlap with disk I/O. Errors are set on the returned
+                futures and the first one is raised again by
+                `flush()` or `close()`, which wait for all queued
+                writes to complete. The other methods run on the
+                calling thread. Default: False.
+
+            io_queue_bytes (int): with `async_io`, the data methods
+                block while the data waiting to be written exceeds
+                this many bytes. Default: IO_QUEUE_BYTES (256 MiB).
+
+            compress_threads (int): if specified, chunks of uniformly
+                sampled data in gzip compressed datasets are
+                compressed by this many threads and stored with
+                direct chunk writes, instead of being compressed
+                serially by HDF5 on the writing thread. Works best
+                with `buffersize` set, so that each write covers
+                whole chunks. Default: None.
+
+            expected_length (int): if specified, uniformly sampled
+                datasets are created with this many columns and chunks
+                laid out for this length, so that appending writes
+                into the preallocated space without resizing. The
+                unused columns are removed by `close()`. See also
+                `set_expected_length`. Default: None.
+
+            time_encoding (nsdf.TickEncoding): if specified, event
+                times and the sampling times of nonuniformly sampled
+                data written by the `add_*_1d` and `add_*_ragged`
+                methods are stored as integer ticks of this encoding
+                in newly created datasets. Data appended to existing
+                datasets uses the encoding recorded in them.
+                NSDFReader converts the ticks back to times. Default:
+                None.
+
             **h5args: other keyword arguments are passed to h5py when
                   creating datasets. These can be `compression`
                   (='gzip'/'szip'/'lzf'), `compression_opts` (=0-9
@@ -223,6 +763,14 @@ class NSDFWriter(object):
                   (=True/False).
 
         """
+        if buffersize is not None and buffersize <= 0:
+            raise ValueError('`buffersize` must be a positive integer.')
+        if compress_threads is not None and compress_threads <= 0:
+            raise ValueError('`compress_threads` must be a positive'
+                             ' integer.')
+        if expected_length is not None and expected_length <= 0:
+            raise ValueError('`expected_length` must be a positive'
+                             ' integer.')
         self.filename = filename
         self._fd = h5.File(filename, mode)
         self.timestamp = datetime.utcnow()
@@ -241,16 +789,175 @@ class NSDFWriter(object):
             self.mapping.require_group(stype)
         self.modelroot = ModelComponent('modeltree', uid='modeltree',
                                         hdfgroup=self.modeltree)
+        self.buffersize = buffersize
+        self._buffers = {}
+        self._source_cache = {}
+        self._table_rows = None
+        if 'modeltable' in self.model:
+            self._load_modeltable()
+        self.access = access
+        self.vlen_segments = vlen_segments
         self.h5args = h5args
+        self._io = _IOThread(io_queue_bytes) if async_io else None
+        self.compress_threads = compress_threads
+        self._compressor = None
+        if compress_threads:
+            self._compressor = _ChunkCompressor(compress_threads)
+        self.expected_length = expected_length
+        self.time_encoding = time_encoding
+        self._expected = {}
+        self._precision = {}
+        self._filled = {}
 
     def __enter__(self):
         return self
-    
+
     def __exit__(self, exc_type, exc_val, traceback):
-        self._fd.close()
+        self.close()
+
+    def __del__(self):
+        # Make sure buffered data reaches the file when the writer is
+        # garbage collected without an explicit close()
+        if getattr(self, '_fd', None):
+            self.close()
+
+    def flush(self):
+        """Write all buffered data to the file and flush the HDF5 file
+        buffers. With `async_io`, first wait for the queued writes to
+        complete."""
+        if self._io is not None:
+            self._io.join()
+        for buf in self._buffers.values():
+            buf.flush()
+        self._fd.flush()
 
     def close(self):
-        self._fd.close()
+        """Write out buffered data and close the file."""
+        if not self._fd:
+            return
+        try:
+            self.flush()
+            self._trim()
+            if 'uid_index' in self.mapping:
+                self._write_uid_index()
+        finally:
+            if self._io is not None:
+                self._io.stop()
+                self._io = None
+            if self._compressor is not None:
+                self._compressor.shutdown()
+                self._compressor = None
+            self._fd.close()
+
+    def _trim(self):
+        """Shrink the preallocated datasets to the number of columns
+        written into them."""
+        ends = dict(self._filled)
+        for buf in self._buffers.values():
+            if getattr(buf, 'start', None) is not None:
+                ends[buf.dataset.name] = buf.start
+        for name, end in ends.items():
+            dataset = self._fd[name]
+            if dataset.shape[1] > end:
+                dataset.resize(end, axis=1)
+
+    def add_uid_index(self):
+        """Store an index of the data sources in `/map/uid_index`.
+
+        The index has one row for each source and dataset recorded
+        from it, with the columns `source` (uid), `stype` (sampling
+        type), `population`, `row` (position of the source in the
+        population), `field` and `data` (reference to the dataset).
+        NSDFReader uses it for looking up sources by uid instead of
+        scanning all the maps. Once added, the index is rebuilt when
+        the writer is closed, so that it covers data added later.
+
+        Returns:
+            None
+
+        """
+        self.flush()
+        self._write_uid_index()
+
+    def _write_uid_index(self):
+        """Create or replace the uid index dataset."""
+        _write_uid_index(self._fd)
+
+    def set_expected_length(self, source_ds, length, name=None):
+        """Declare the expected number of sampling points of the
+        uniformly sampled data from the population in `source_ds`.
+
+        Datasets created afterwards for this population are allocated
+        at this length, so that data appended with `add_uniform_data`
+        is written into the preallocated space without resizing the
+        dataset. The unused columns are removed when the writer is
+        closed.
+
+        Args:
+            source_ds (HDF5 Dataset): the dataset storing the source
+                ids under map.
+
+            length (int): expected number of sampling points, e.g.
+                simulation time / dt.
+
+            name (str): name of the variable this applies to. If None,
+                it applies to all variables of the population without
+                a length of their own. Default: None.
+
+        Returns:
+            None
+
+        """
+        if length <= 0:
+            raise ValueError('`length` must be a positive integer.')
+        popname = source_ds.name.rpartition('/')[-1]
+        self._expected[(popname, name)] = length
+
+    def set_precision(self, source_ds, encoding, name=None):
+        """Store the uniformly sampled data from the population in
+        `source_ds` as scaled integers.
+
+        This applies to datasets created afterwards. NSDFReader
+        converts the stored integers back to floating point values.
+
+        Args:
+            source_ds (HDF5 Dataset): the dataset storing the source
+                ids under map.
+
+            encoding (nsdf.ScaleOffset): the resolution, offset and
+                integer type of the stored values. If its offset is
+                None, each dataset gets the middle of the range of the
+                first data written to it.
+
+            name (str): name of the variable this applies to. If None,
+                it applies to all variables of the population without
+                an encoding of their own. Default: None.
+
+        Returns:
+            None
+
+        Examples:
+            >>> writer.set_precision(vm_ds, nsdf.ScaleOffset(0.01),
+            ...                      name='Vm')
+
+        """
+        popname = source_ds.name.rpartition('/')[-1]
+        self._precision[(popname, name)] = encoding
+
+    def _expected_length(self, popname, name):
+        """Return the expected number of sampling points of uniform
+        variable `name` of population `popname`, None if not known."""
+        return self._lookup(self._expected, popname, name,
+                            self.expected_length)
+
+    def _lookup(self, settings, popname, name, default=None):
+        """Return the entry for variable `name` of population `popname`
+        in `settings`, or else the entry for the whole population, or
+        else `default`."""
+        try:
+            return settings[(popname, name)]
+        except KeyError:
+            return settings.get((popname, None), default)
 
     def set_properties(self, properties):
         """Set the file attributes (environments).
@@ -499,13 +1206,9 @@ class NSDFWriter(object):
             None
 
         """
-        self.modelroot.update_id_path_dict()
         id_path_dict = self.modelroot.get_id_path_dict()
-        if mapds.dtype.fields is None:
-            idlist = mapds
-        else:
-            idlist = mapds['source']
-            
+        idlist, index = self._source_index(mapds)
+
         if len(id_path_dict) > 1:
             # there are elements other than /model/modeltree
             paths = []
@@ -520,6 +1223,10 @@ class NSDFWriter(object):
                 warnings.warn('no common prefix for map dimscale {}'.format(
                     mapds.name))
                 return
+            if self._table_rows is not None and \
+               '/modeltree/' + prefix in self._table_rows:
+                # Stored in /model/modeltable, there is no group to link
+                return
             try:
                 source = self.modeltree[prefix]
                 tmpattr = ([ref for ref in source.attrs.get('map', [])]
@@ -527,18 +1234,53 @@ class NSDFWriter(object):
                 attr = np.zeros((len(tmpattr),), dtype=REFTYPE)
                 attr[:] = tmpattr
                 source.attrs['map'] = attr
-                tmpattr = ([ref for ref in mapds.attrs.get('map', [])]
+                tmpattr = ([ref for ref in mapds.attrs.get('model', [])]
                            + [source.ref])
                 attr = np.zeros((len(tmpattr),), dtype=REFTYPE)
                 attr[:] = tmpattr
                 mapds.attrs['model'] = attr                
             except KeyError as error:
-                warnings.warn(error.message)
-        
-    def add_modeltree(self, root, target='/'):
+                warnings.warn(str(error))
+
+    def _create_dataset(self, group, name, shape, dtype, maxshape=None,
+                        expected=None, blocklen=None, **kwargs):
+        """Create dataset `name` under `group` with the h5py options of
+        this writer and the chunk shape chosen by `plan_chunks` for its
+        access pattern.
+
+        The access pattern is recorded in the `access` attribute of 2D
+        chunked datasets. Keyword arguments `expected` and `blocklen`
+        are passed on to `plan_chunks`, the rest to
+        h5py.Group.create_dataset.
+
+        """
+        args = dict(self.h5args)
+        args.update(kwargs)
+        if maxshape is None:
+            maxshape = shape
+        if 'chunks' not in args:
+            filtered = any(args.get(key) for key in
+                           ('compression', 'shuffle', 'fletcher32',
+                            'scaleoffset'))
+            args['chunks'] = plan_chunks(shape, maxshape, dtype,
+                                         pattern=self.access,
+                                         expected=expected,
+                                         blocklen=blocklen,
+                                         filtered=filtered)
+        dataset = group.create_dataset(name, shape=shape, dtype=dtype,
+                                       maxshape=maxshape, **args)
+        if dataset.chunks is not None and len(shape) == 2:
+            dataset.attrs['access'] = self.access
+        return dataset
+
+    def add_modeltree(self, root, target='/', compact=False):
         """Add an entire model tree. This will cause the modeltree rooted at
         `root` to be written to the NSDF file.
 
+        Only the components in the subtree rooted at `root` are
+        written, so a model can be added in stages in time linear in
+        the size of each stage.
+
         Args:
             root (ModelComponent): root of the source tree.
 
@@ -546,17 +1288,23 @@ class NSDFWriter(object):
                 to '/model/modeltree'. `root` and its children are
                 added under this group.
 
+            compact (bool): if True, the subtree is stored as rows of
+                the tables in `/model/modeltable` instead of one group
+                per component. `target` must then be '/' or a
+                component stored in the tables, including those
+                written before the file was reopened. Components
+                stored this way are not linked to the map datasets of
+                their descendants. Default: False.
+
+        Raises:
+            ValueError if `compact` is True and `target` is not
+            stored in the model tables, or if the values of an
+            attribute are not all strings or all numbers, or cannot
+            be represented exactly in the type of its table. Nothing
+            is written in that case.
+
         """
-        def write_absolute(node, rootgroup):
-            """Write ModelComponent `node` at its path relative to `rootgroup`.
-            """
-            if node.parent is None:
-                parentgroup = rootgroup
-            else:
-                parentpath = node.parent.path[1:] 
-                parentgroup = rootgroup[parentpath]
-            add_model_component(node, parentgroup)
-            
+        add_model_component(self.modelroot, self.model)
         node = self.modelroot
         # Get the node corresponding to `target`, traverse by
         # splitting to avoid confusion between absolute and relative
@@ -564,8 +1312,106 @@ class NSDFWriter(object):
         for name in target.split('/'):
             if name:
                 node = node.children[name]
+        if compact:
+            self._add_modeltable(node, root)
+            return
+        node.add_child(root)
+        parentgroup = node.hdfgroup
+        # The component may have been written to another file as well
+        if parentgroup is None or not parentgroup.id.valid or \
+           parentgroup.file != self._fd:
+            parentgroup = self.model.require_group(node.path[1:])
+        # Only the new subtree is written, each component under the
+        # group just created for its parent
+        stack = [(root, parentgroup)]
+        while stack:
+            component, group = stack.pop()
+            group = add_model_component(component, group)
+            stack.extend((child, group) for child in
+                         component.children.values())
+
+    def _load_modeltable(self):
+        """Rebuild the components stored in `/model/modeltable` of an
+        existing file as an array-backed ModelTree rooted at
+        `modelroot`, with the table row of each path, so that more
+        components can be appended to the tables."""
+        table = self.model['modeltable']
+        tree = ModelTree.from_arrays(table['parent'][()],
+                                     table['name'].asstr()[()],
+                                     table['uid'].asstr()[()])
+        tree.root.hdfgroup = self.modeltree
+        self.modelroot = tree.root
+        self._table_rows = dict((tree.path(row), row)
+                                for row in range(len(tree)))
+
+    def _add_modeltable(self, node, root):
+        """Attach `root` under `node` and append the components in the
+        subtree rooted at `root` to the tables in `/model/modeltable`."""
+        if self._table_rows is None:
+            self._table_rows = {self.modelroot.path: 0}
+        try:
+            parentrow = self._table_rows[node.path]
+        except KeyError:
+            raise ValueError('target {} is not stored in the model'
+                             ' tables'.format(node.path))
+        try:
+            table = self.model['modeltable']
+            start = table['parent'].shape[0]
+        except KeyError:
+            table = None
+            start = 1
+        parents, names, uids = [], [], []
+        rows = {}
+        attrs = {}
+        stack = [(root, parentrow, node.path + '/' + root.name)]
+        while stack:
+            component, parentrow, path = stack.pop()
+            row = start + len(parents)
+            rows[path] = row
+            parents.append(parentrow)
+            names.append(component.name)
+            uids.append(path if component.uid is None else component.uid)
+            for key, value in component.attrs.items():
+                attrs.setdefault(key, ([], []))
+                attrs[key][0].append(row)
+                attrs[key][1].append(value)
+            stack.extend((child, row, path + '/' + name) for name, child
+                         in component.children.items())
+        # Check all the attribute values before writing anything
+        columns = {}
+        for key, (attrrows, values) in attrs.items():
+            dtype = None
+            if table is not None and key in table['attrs']:
+                dtype = table['attrs'][key]['value'].dtype
+            columns[key] = (attrrows,) + _table_values(key, values, dtype)
+        if table is None:
+            table = self.model.create_group('modeltable')
+            table.create_group('attrs')
+            for name, dtype in [('parent', np.int64), ('name', VLENSTR),
+                                ('uid', VLENSTR)]:
+                table.create_dataset(name, shape=(0,), dtype=dtype,
+                                     maxshape=(None,), chunks=(4096,))
+            append_table(table, 'parent', [-1])
+            append_table(table, 'name', [self.modelroot.name])
+            append_table(table, 'uid', [self.modelroot.uid])
         node.add_child(root)
-        self.modelroot.visit(write_absolute, self.model)
+        self._table_rows.update(rows)
+        append_table(table, 'parent', parents)
+        append_table(table, 'name', names)
+        append_table(table, 'uid', uids)
+        for key, (attrrows, values, dtype) in columns.items():
+            try:
+                attrgrp = table['attrs'][key]
+            except KeyError:
+                attrgrp = table['attrs'].create_group(key)
+                attrgrp.create_dataset('index', shape=(0,), dtype=np.int64,
+                                       maxshape=(None,), chunks=(4096,))
+                attrgrp.create_dataset(
+                    'value', shape=(0,) + values.shape[1:], dtype=dtype,
+                    maxshape=(None,) + values.shape[1:],
+                    chunks=(4096,) + values.shape[1:])
+            append_table(attrgrp, 'index', attrrows)
+            append_table(attrgrp, 'value', values)
 
     def add_model_filecontents(self, filenames, basedir, ascii=True, recursive=True):
         """Add the files and directories listed in `filenames` to
@@ -712,10 +1558,10 @@ class NSDFWriter(object):
         assert self.dialect == dialect.ONED, 'valid only for dialect=ONED'
         assert len(idlist) > 0, 'idlist must be nonempty'
         grp = base.require_group(popname)
-        src_ds = grp.create_dataset(varname, shape=(len(idlist),),
-                                dtype=SRCDATAMAPTYPE)
-        for iii in range(len(idlist)):
-            src_ds[iii] = (idlist[iii], None)
+        rows = np.empty(len(idlist), dtype=SRCDATAMAPTYPE)
+        rows['source'] = idlist
+        src_ds = grp.create_dataset(varname, data=rows,
+                                    dtype=SRCDATAMAPTYPE)
         self._link_map_model(src_ds)
         return src_ds
 
@@ -768,10 +1614,10 @@ class NSDFWriter(object):
             (self.dialect == dialect.NUREGULAR)),   \
             'dialect must be ONED or NUREGULAR'
         grp = base.require_group(popname)
-        src_ds = grp.create_dataset(varname, shape=(len(idlist),),
-                                     dtype=SRCDATAMAPTYPE)
-        for iii in range(len(idlist)):
-            src_ds[iii] = (idlist[iii], None)
+        rows = np.empty(len(idlist), dtype=SRCDATAMAPTYPE)
+        rows['source'] = idlist
+        src_ds = grp.create_dataset(varname, data=rows,
+                                    dtype=SRCDATAMAPTYPE)
         self._link_map_model(src_ds)
         return src_ds
 
@@ -798,10 +1644,10 @@ class NSDFWriter(object):
         # idlist = np.array(idlist, dtype=VLENSTR)
         src_ds = base.create_dataset(popname, shape=(len(idlist),),
                                  dtype=VLENSTR, data=idlist)
-        self.modelroot.update_id_path_dict()
         self._link_map_model(src_ds)
         return src_ds        
     
+    @_queued
     def add_uniform_data(self, source_ds, data_object, tstart=0.0,
                          fixed=False):
         """Append uniformly sampled `variable` values from `sources` to
@@ -834,19 +1680,188 @@ class NSDFWriter(object):
         """
         popname = source_ds.name.rpartition('/')[-1]
         ugrp = self.data[UNIFORM].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        if isinstance(data_object, UniformBlockData):
+            data = self._source_rows(source_ds, data_object.get_block(),
+                                     data_object.get_sources())
+            return self._add_uniform(ugrp, source_ds, data_object, data,
+                                     tstart, fixed)
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match sources in'
                            ' `data`.')
-        strinfo = h5.check_string_dtype(source_ds.dtype)
-        if strinfo is not None:
-            sources = [src.decode(strinfo.encoding) for src in source_ds]
-        ordered_data = [data_object.get_data(src) for src in sources]
-        data = np.vstack(ordered_data)
+        data = np.vstack([data_object.get_data(src) for src in sources])
+        return self._add_uniform(ugrp, source_ds, data_object, data, tstart,
+                                 fixed)
+
+    @_queued
+    def add_uniform_array(self, source_ds, data_object, data, sources=None,
+                          tstart=0.0, fixed=False):
+        """Append uniformly sampled values stored in the rows of a 2D
+        array.
+
+        This avoids collecting the rows of a population into a data
+        object: `data` is written directly to the file, without
+        copying, when its rows are in the order of the sources in
+        `source_ds`. Otherwise the rows are reordered with a single
+        copy.
+
+        Args:
+            source_ds (HDF5 Dataset): the dataset storing the source
+                ids under map.
+
+            data_object (nsdf.UniformData): data object providing the
+                name, unit, sampling interval and other properties of
+                the dataset. Any data stored in it is ignored.
+
+            data (numpy.ndarray): 2D (source, time) array of values.
+
+            sources (sequence): the source of each row of `data`. If
+                None, the rows are in the order of `source_ds`.
+                Default: None.
+
+            tstart (double): (optional) start time of this dataset
+                recording. Defaults to 0.
+
+            fixed (bool): if True, the data cannot grow. Default: False
+
+        Returns:
+            HDF5 dataset storing the data
+
+        Raises:
+            KeyError if `sources` do not match those in `source_ds`.
+
+            ValueError if `data` does not have one row per source, or
+            dt is not specified or <= 0 when inserting data for the
+            first time.
+
+        """
+        popname = source_ds.name.rpartition('/')[-1]
+        ugrp = self.data[UNIFORM].require_group(popname)
+        data = self._source_rows(source_ds, data, sources)
+        return self._add_uniform(ugrp, source_ds, data_object, data, tstart,
+                                 fixed)
+
+    @_queued
+    def add_uniform_batch(self, source_ds, data_objects, tstart=0.0,
+                          fixed=False):
+        """Append uniformly sampled values of several variables recorded
+        from the same population of `sources`.
+
+        This is equivalent to calling `add_uniform_data` for each entry
+        in `data_objects`, but the source order is looked up and
+        validated only once for the whole batch. All the entries are
+        checked before any is written, so that the file is left
+        unchanged if one of them is invalid.
+
+        Args:
+            source_ds (HDF5 Dataset): the dataset storing the source
+                ids under map.
+
+            data_objects (list of nsdf.UniformData): Uniform datasets,
+                one per variable, all with the same sources.
+
+            tstart (double): (optional) start time of these recordings.
+                Defaults to 0.
+
+            fixed (bool): if True, the data cannot grow. Default: False
+
+        Returns:
+            list of HDF5 datasets storing the data, in the order of
+            `data_objects`.
+
+        Raises:
+            KeyError if the sources in any of `data_objects` do not
+            match those in `source_ds`.
+
+            ValueError if dt is not specified or <= 0 when inserting
+            data for the first time.
+
+        """
+        if len(data_objects) == 0:
+            return []
+        popname = source_ds.name.rpartition('/')[-1]
+        ugrp = self.data[UNIFORM].require_group(popname)
+        sources = self._ordered_sources(source_ds, data_objects[0])
+        if sources is None or any(
+                data_object.get_source_data_dict().keys() !=
+                data_objects[0].get_source_data_dict().keys()
+                for data_object in data_objects[1:]):
+            raise KeyError('members of `source_ds` must match sources in'
+                           ' `data`.')
+        # Check and encode all the variables before writing any, so
+        # that an invalid entry leaves the file unchanged
+        checked = []
+        for data_object in data_objects:
+            if isinstance(data_object, UniformBlockData):
+                data = self._source_rows(source_ds, data_object.get_block(),
+                                         data_object.get_sources())
+            else:
+                data = np.vstack([data_object.get_data(src)
+                                  for src in sources])
+            checked.append(self._check_uniform(ugrp, data_object, data))
+        return [self._store_uniform(ugrp, source_ds, data_object, dataset,
+                                    encoding, data, tstart, fixed)
+                for data_object, (dataset, encoding, data) in
+                zip(data_objects, checked)]
+
+    def _source_rows(self, source_ds, data, sources):
+        """Return 2D array `data`, whose rows come from `sources`, with
+        the rows in the order of the sources in `source_ds`. `data`
+        itself is returned if `sources` is None or already in that
+        order."""
+        data = np.asarray(data)
+        nrows = source_ds.shape[0]
+        if sources is not None and len(sources) != nrows:
+            raise KeyError('members of `source_ds` must match `sources`.')
+        if data.ndim != 2 or data.shape[0] != nrows:
+            raise ValueError('`data` must be a 2D array with one row for'
+                             ' each member of `source_ds`.')
+        if sources is None:
+            return data
+        map_sources, index = self._source_index(source_ds)
+        if list(sources) == map_sources:
+            return data
+        try:
+            rows = np.fromiter((index[src] for src in sources),
+                               dtype=np.intp, count=nrows)
+        except KeyError:
+            raise KeyError('members of `source_ds` must match `sources`.')
+        if np.array_equal(rows, np.arange(nrows)):
+            return data
+        order = np.full(nrows, -1, dtype=np.intp)
+        order[rows] = np.arange(nrows)
+        if (order < 0).any():
+            raise KeyError('members of `source_ds` must match `sources`.')
+        return data[order]
+
+    def _add_uniform(self, ugrp, source_ds, data_object, data, tstart,
+                     fixed):
+        """Write the rows of 2D array `data`, in the order of the
+        sources in `source_ds`, to the dataset for `data_object` under
+        `ugrp`, creating the dataset if needed."""
+        dataset, encoding, data = self._check_uniform(ugrp, data_object,
+                                                      data)
+        return self._store_uniform(ugrp, source_ds, data_object, dataset,
+                                   encoding, data, tstart, fixed)
+
+    def _check_uniform(self, ugrp, data_object, data):
+        """Look up the dataset for `data_object` under `ugrp` and encode
+        `data` for it, without writing anything.
+
+        Returns:
+            tuple (dataset, encoding, data) of the existing dataset
+            (None if it has to be created), its ScaleOffset encoding
+            (None if the values are not scaled) and `data` as it is
+            to be stored.
+
+        Raises:
+            ValueError if the dataset has to be created and `dt`,
+            `unit` or `tunit` of `data_object` is missing, or if
+            `data` cannot be encoded.
+
+        """
         try:
             dataset = ugrp[data_object.name]
-            oldcolcount = dataset.shape[1]
-            dataset.resize(oldcolcount + data.shape[1], axis=1)
-            dataset[:, oldcolcount:] = data
         except KeyError:
             if data_object.dt <= 0.0:
                 raise ValueError('`dt` must be > 0.0 for creating dataset.')
@@ -854,26 +1869,219 @@ class NSDFWriter(object):
                 raise ValueError('`unit` is required for creating dataset.')
             if data_object.tunit is None:
                 raise ValueError('`tunit` is required for creating dataset.')
-            maxcol = None
-            if fixed:
-                maxcol = data.shape[1]
-            dataset = ugrp.create_dataset(
-                data_object.name,
+            popname = ugrp.name.rpartition('/')[-1]
+            encoding = self._lookup(self._precision, popname,
+                                    data_object.name)
+            if encoding is not None:
+                encoding = encoding.fit(data)
+                data = encoding.encode(data)
+            return None, encoding, data
+        encoding = ScaleOffset.from_attrs(dataset.attrs, dataset.dtype)
+        if encoding is not None:
+            data = encoding.encode(data)
+        return dataset, encoding, data
+
+    def _store_uniform(self, ugrp, source_ds, data_object, dataset,
+                       encoding, data, tstart, fixed):
+        """Append `data`, as returned by `_check_uniform`, to `dataset`,
+        or create the dataset for `data_object` under `ugrp` if
+        `dataset` is None."""
+        if dataset is not None:
+            self._append_uniform(dataset, data)
+            return dataset
+        popname = ugrp.name.rpartition('/')[-1]
+        expected = self._expected_length(popname, data_object.name)
+        dtype = data_object.dtype if encoding is None else encoding.dtype
+        if fixed:
+            dataset = self._create_dataset(
+                ugrp, data_object.name,
                 shape=data.shape,
-                dtype=data_object.dtype,
-                data=data,
-                maxshape=(data.shape[0], maxcol),
-                **self.h5args)
-            source_ds.make_scale('source')
-            dataset.dims[0].attach_scale(source_ds)
-            dataset.dims[0].label = 'source'
-            dataset.attrs['tstart'] = tstart
-            dataset.attrs['dt'] = data_object.dt
-            dataset.attrs['field'] = data_object.field
-            dataset.attrs['unit'] = data_object.unit
-            dataset.attrs['tunit'] = data_object.tunit
+                dtype=dtype,
+                maxshape=data.shape)
+            self._write_uniform(dataset, data)
+        elif expected is not None:
+            # Preallocate and write into place, trimmed on close
+            dataset = self._create_dataset(
+                ugrp, data_object.name,
+                shape=(data.shape[0], max(expected, data.shape[1])),
+                dtype=dtype,
+                maxshape=(data.shape[0], None),
+                expected=expected,
+                blocklen=self.buffersize)
+            self._filled[dataset.name] = 0
+            self._append_uniform(dataset, data)
+        elif self.buffersize:
+            # Start empty and let the buffer write whole chunks
+            dataset = self._create_dataset(
+                ugrp, data_object.name,
+                shape=(data.shape[0], 0),
+                dtype=dtype,
+                maxshape=(data.shape[0], None),
+                blocklen=self.buffersize)
+            self._append_uniform(dataset, data)
+        else:
+            dataset = self._create_dataset(
+                ugrp, data_object.name,
+                shape=data.shape,
+                dtype=dtype,
+                maxshape=(data.shape[0], None))
+            self._write_uniform(dataset, data)
+        source_ds.make_scale('source')
+        dataset.dims[0].attach_scale(source_ds)
+        dataset.dims[0].label = 'source'
+        dataset.attrs['tstart'] = tstart
+        dataset.attrs['dt'] = data_object.dt
+        dataset.attrs['field'] = data_object.field
+        dataset.attrs['unit'] = data_object.unit
+        dataset.attrs['tunit'] = data_object.tunit
+        if encoding is not None:
+            encoding.set_attrs(dataset)
         return dataset
 
+    def _source_index(self, source_ds):
+        """Return the uids of the sources in map dataset `source_ds` in
+        row order and a dict mapping each uid to its row.
+
+        These are read and decoded once per map dataset and cached for
+        later calls.
+
+        """
+        try:
+            sources, index = self._source_cache[source_ds.name]
+            if len(sources) == source_ds.shape[0]:
+                return sources, index
+        except KeyError:
+            pass
+        if source_ds.dtype.fields is None:
+            ids = source_ds[()]
+            strinfo = h5.check_string_dtype(source_ds.dtype)
+        else:
+            ids = source_ds['source']
+            strinfo = h5.check_string_dtype(source_ds.dtype['source'])
+        if strinfo is None:
+            sources = list(ids)
+        else:
+            sources = [src.decode(strinfo.encoding) for src in ids]
+        index = dict((src, row) for row, src in enumerate(sources))
+        self._source_cache[source_ds.name] = (sources, index)
+        return sources, index
+
+    def _ordered_sources(self, source_ds, data_object):
+        """Return the uids of the sources in map dataset `source_ds` in
+        row order, or None if they are not the same as the sources in
+        `data_object`."""
+        sources, index = self._source_index(source_ds)
+        if index.keys() != data_object.get_source_data_dict().keys():
+            return None
+        return sources
+
+    def _set_map_refs(self, source_ds, sources, refs):
+        """Store the dataset references in `refs`, a dict mapping rows
+        to references, in the `data` column of the ONED map dataset
+        `source_ds` with a single write."""
+        if not refs:
+            return
+        if len(refs) == len(sources):
+            rows = np.empty(len(sources), dtype=SRCDATAMAPTYPE)
+            rows['source'] = sources
+        else:
+            rows = source_ds[()]
+        for iii, ref in refs.items():
+            rows['data'][iii] = ref
+        source_ds[:] = rows
+
+    def _create_vlen_dataset(self, group, name, nrows, dtype, fixed):
+        """Create a VLEN dataset with `nrows` rows and element type
+        `dtype` under `group`, segmented if `vlen_segments` is set."""
+        vlentype = h5.special_dtype(vlen=dtype)
+        if self.vlen_segments:
+            return self._create_dataset(
+                group, name,
+                shape=(nrows, 0),
+                maxshape=(nrows, 1 if fixed else None),
+                dtype=vlentype)
+        return self._create_dataset(
+            group, name,
+            shape=(nrows,),
+            maxshape=(nrows if fixed else None,),
+            dtype=vlentype)
+
+    def _append_vlen(self, datasets, rows_list):
+        """Append `rows_list[i]` to the rows of VLEN dataset `datasets[i]`,
+        through the write buffer if buffering is enabled."""
+        if not self.buffersize:
+            for dataset, rows in zip(datasets, rows_list):
+                append_vlen_rows(dataset, rows)
+            return
+        try:
+            buf = self._buffers[datasets[0].name]
+        except KeyError:
+            buf = _VlenBuffer(datasets, self.buffersize)
+            self._buffers[datasets[0].name] = buf
+        buf.append(rows_list)
+
+    def _create_fill_lengths(self, stype, dataset):
+        """Create the index of valid lengths of the rows of NaN padded
+        `dataset` under `/map/length/{stype}` and store a reference to it
+        in the `length` attribute of `dataset`."""
+        popname, name = dataset.name.split('/')[-2:]
+        length_ds = self.mapping.require_group('length').require_group(
+            stype).create_dataset('{}_{}'.format(popname, name),
+                                  shape=(dataset.shape[0],),
+                                  dtype=np.int64)
+        dataset.attrs['length'] = length_ds.ref
+        return length_ds
+
+    def _get_fill_lengths(self, stype, dataset):
+        """Return the valid lengths of the rows of NaN padded `dataset`
+        and the dataset storing them.
+
+        Files written without the length index are scanned for the
+        first NaN in each row and the index is created.
+
+        """
+        try:
+            length_ds = self._fd[dataset.attrs['length']]
+            return length_ds[()], length_ds
+        except KeyError:
+            pass
+        lengths = np.zeros(dataset.shape[0], dtype=np.int64)
+        for iii in range(dataset.shape[0]):
+            row = dataset[iii]
+            try:
+                lengths[iii] = next(find(row, np.isnan))[0][0]
+            except StopIteration:
+                lengths[iii] = len(row)
+        length_ds = self._create_fill_lengths(stype, dataset)
+        length_ds[:] = lengths
+        return lengths, length_ds
+
+    def _write_uniform(self, dataset, data):
+        """Write 2D array `data` into a newly created uniform `dataset`
+        of the same shape."""
+        if self._compressor is None:
+            dataset.write_direct(np.ascontiguousarray(data))
+        else:
+            self._compressor.write(dataset, data, 0)
+
+    def _append_uniform(self, dataset, data):
+        """Append the columns of `data` to uniform `dataset`, through the
+        write buffer if buffering is enabled."""
+        if not self.buffersize:
+            start = self._filled.get(dataset.name)
+            write_columns(dataset, data, self._compressor, start)
+            if start is not None:
+                self._filled[dataset.name] = start + data.shape[1]
+            return
+        try:
+            buf = self._buffers[dataset.name]
+        except KeyError:
+            buf = _ColumnBuffer(dataset, self.buffersize, self._compressor,
+                                self._filled.pop(dataset.name, None))
+            self._buffers[dataset.name] = buf
+        buf.append(data)
+
+    @_queued
     def add_nonuniform_regular(self, source_ds, data_object,
                                fixed=False):
         """Append nonuniformly sampled `variable` values from `sources` to
@@ -906,10 +2114,11 @@ class NSDFWriter(object):
         """
         popname = source_ds.name.rpartition('/')[-1]
         ngrp = self.data[NONUNIFORM].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match sources in'
                            ' `data_object`.')
-        ordered_data = [data_object.get_data(src) for src in source_ds]
+        ordered_data = [data_object.get_data(src) for src in sources]
         data = np.vstack(ordered_data)
         if data.shape[1] != len(data_object.get_times()):
             raise ValueError('number sampling times must be '
@@ -927,24 +2136,22 @@ class NSDFWriter(object):
             maxcol = None
             if fixed:
                 maxcol = data.shape[1]
-            dataset = ngrp.create_dataset(
-                data_object.name, shape=data.shape,
+            dataset = self._create_dataset(
+                ngrp, data_object.name, shape=data.shape,
                 dtype=data.dtype,
                 data=data,
-                maxshape=(data.shape[0], maxcol),
-                **self.h5args)
+                maxshape=(data.shape[0], maxcol))
             source_ds.make_scale('source')
             dataset.dims[0].attach_scale(source_ds)
             dataset.dims[0].label = 'source'
             dataset.attrs['field'] = data_object.field
             dataset.attrs['unit'] = data_object.unit
             tsname = '{}_{}'.format(popname, data_object.name)
-            tscale = self.time_dim.create_dataset(
-                tsname,
+            tscale = self._create_dataset(
+                self.time_dim, tsname,
                 shape=(len(data_object.get_times()),),
                 dtype=np.float64,
-                data=data_object.get_times(),
-                **self.h5args)
+                data=data_object.get_times())
             tscale.make_scale('time')
             # dataset.dims.create_scale(tscale, 'time')
             dataset.dims[1].attach_scale(tscale)
@@ -952,6 +2159,7 @@ class NSDFWriter(object):
             tscale.attrs['unit'] = data_object.tunit
         return dataset
 
+    @_queued
     def add_nonuniform_1d(self, source_ds, data_object,
                           source_name_dict=None, fixed=False):
         """Add nonuniform data when data from each source is in a separate 1D
@@ -1001,32 +2209,32 @@ class NSDFWriter(object):
         """
         assert self.dialect == dialect.ONED, \
             'add 1D dataset under nonuniform only for dialect=ONED'
+        sources, index = self._source_index(source_ds)
         if source_name_dict is None:
-            names = np.array(source_ds['source'], dtype=np.str_)
-            slash_pos = np.char.find(names, '/') 
-            dot_pos = np.char.find(names, '.')
-            if np.any(( slash_pos >= 0) |
-                      ( dot_pos >= 0)):
-                names = [str(index) for index in range(len(names))]
-            source_name_dict = dict(list(zip(source_ds['source'], names)))
-
+            # if names contain invalid chars for HDF5 name, substitute with index
+            if np.any((np.char.find(sources, '/') >= 0) |
+                      (np.char.find(sources, '.') >= 0)):
+                names = [str(index) for index in range(len(sources))]
+            else:
+                names = sources
+            source_name_dict = dict(zip(sources, names))
         assert len(set(source_name_dict.values())) == len(source_ds), \
             'The names in `source_name_dict` must be unique'        
         popname = source_ds.name.split('/')[-2]
         ngrp = self.data[NONUNIFORM].require_group(popname)
-        assert match_datasets(list(source_name_dict.keys()),
-                              data_object.get_sources()), \
+        assert source_name_dict.keys() ==   \
+            data_object.get_source_data_dict().keys(), \
                'sources in `source_name_dict`'    \
                ' do not match those in `data_object`'
-        assert match_datasets(source_ds['source'],
-                              list(source_name_dict.keys())),  \
+        assert index.keys() == source_name_dict.keys(),  \
             'sources in mapping dataset do not match those with data'
         datagrp = ngrp.require_group(data_object.name)
         datagrp.attrs['source'] = source_ds.ref
         datagrp.attrs['unit'] = data_object.unit
         datagrp.attrs['field'] = data_object.field
         ret = {}
-        for iii, source in enumerate(source_ds['source']):
+        new_refs = {}
+        for iii, source in enumerate(sources):
             data, time = data_object.get_data(source)
             dsetname = source_name_dict[source]
             timescale = None
@@ -1034,6 +2242,7 @@ class NSDFWriter(object):
                 dset = datagrp[dsetname]
                 oldlen = dset.shape[0]
                 timescale = dset.dims[0]['time']
+                time = self._encode_times(timescale, time)
                 dset.resize((oldlen + len(data),))
                 dset[oldlen:] = data
                 timescale.resize((oldlen + len(data),))
@@ -1046,35 +2255,40 @@ class NSDFWriter(object):
                     raise ValueError('`tunit` is required'
                                      ' for creating dataset.')
                 maxcol = len(data) if fixed else None
-                dset = datagrp.create_dataset(
-                    dsetname,
+                dset = self._create_dataset(
+                    datagrp, dsetname,
                     shape=(len(data),),
                     dtype=data_object.dtype,
                     data=data,
-                    maxshape=(maxcol,),
-                    **self.h5args)
+                    maxshape=(maxcol,))
                 dset.attrs['unit'] = data_object.unit
                 dset.attrs['field'] = data_object.field
                 dset.attrs['source'] = source
-                source_ds[iii] = (source, dset.ref)
+                new_refs[iii] = dset.ref
                 # Using {popname}_{variablename}_{dsetname} for
                 # simplicity. What about creating a hierarchy?
                 tsname = '{}_{}_{}'.format(popname, data_object.name, dsetname)
-                timescale = self.time_dim.create_dataset(
-                    tsname,
+                encoding = self.time_encoding
+                ttype = data_object.ttype
+                if encoding is not None:
+                    time, ttype = encoding.encode(time), encoding.dtype
+                timescale = self._create_dataset(
+                    self.time_dim, tsname,
                     shape=(len(data),),
-                    dtype=data_object.ttype,
+                    dtype=ttype,
                     data=time,
-                    maxshape=(maxcol,),
-                    **self.h5args)
+                    maxshape=(maxcol,))
+                self._init_encoding(timescale, encoding, time)
                 # dset.dims.create_scale(timescale, 'time')
                 timescale.make_scale('time')
                 dset.dims[0].label = 'time'
                 dset.dims[0].attach_scale(timescale)
                 timescale.attrs['unit'] = data_object.tunit
             ret[source] = (dset, timescale)
+        self._set_map_refs(source_ds, sources, new_refs)
         return ret
     
+    @_queued
     def add_nonuniform_vlen(self, source_ds, data_object,
                                 fixed=False):
         """Add nonuniform data when data from all sources in a population is
@@ -1107,11 +2321,10 @@ class NSDFWriter(object):
             tuple containing HDF5 Datasets for the data and sampling
             times.
 
-        TODO: 
-            Concatenating old data with new data and reassigning is a poor
-            choice. waiting for response from h5py mailing list about
-            appending data to rows of vlen datasets. If that is not
-            possible, vlen dataset is a technically poor choice.
+        Notes:
+            Unless the writer was created with `vlen_segments=True`,
+            appending rewrites every row of the dataset. See
+            `append_vlen_rows`.
 
             h5py does not support vlen datasets with float64
             elements. Change dtype to np.float64 once that is
@@ -1123,7 +2336,8 @@ class NSDFWriter(object):
                             ' only for dialect=VLEN')
         popname = source_ds.name.rpartition('/')[-1]
         ngrp = self.data[NONUNIFORM].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match keys of'
                            ' `source_data_dict`.')
         # Using {popname}_{variablename} for simplicity. What
@@ -1137,15 +2351,9 @@ class NSDFWriter(object):
                 raise ValueError('`unit` is required for creating dataset.')
             if data_object.tunit is None:
                 raise ValueError('`tunit` is required for creating dataset.')
-            vlentype = h5.special_dtype(vlen=data_object.dtype)
-            maxrows = source_ds.shape[0] if fixed else None
-            # Fix me: is there any point of keeping the compression
-            # and shuffle options?
-            dataset = ngrp.create_dataset(
-                data_object.name,
-                shape=source_ds.shape,
-                dtype=vlentype,
-                **self.h5args)
+            dataset = self._create_vlen_dataset(
+                ngrp, data_object.name, source_ds.shape[0],
+                data_object.dtype, fixed)
             dataset.attrs['field'] = data_object.field
             dataset.attrs['unit'] = data_object.unit
             source_ds.make_scale('source')
@@ -1153,23 +2361,20 @@ class NSDFWriter(object):
             dataset.dims[0].label = 'source'
             # FIXME: VLENFLOAT should be made VLENDOUBLE whenever h5py
             # fixes it
-            time_ds = self.time_dim.create_dataset(
-                tsname,
-                shape=dataset.shape,
-                maxshape=(maxrows,),
-                dtype=VLENFLOAT,
-                **self.h5args)
+            time_ds = self._create_vlen_dataset(
+                self.time_dim, tsname, source_ds.shape[0],
+                VLENFLOAT.metadata['vlen'], fixed)
             time_ds.make_scale('time')
             # dataset.dims.create_scale(time_ds, 'time')
             dataset.dims[0].attach_scale(time_ds)
             dataset.dims[0].label = 'time'            
             time_ds.attrs['unit'] = data_object.tunit
-        for iii, source in enumerate(source_ds):
-            data, time, = data_object.get_data(source)
-            dataset[iii] = np.concatenate((dataset[iii], data))
-            time_ds[iii] = np.concatenate((time_ds[iii], time))
+        rows = [data_object.get_data(src) for src in sources]
+        self._append_vlen((dataset, time_ds),
+                          ([row[0] for row in rows], [row[1] for row in rows]))
         return dataset, time_ds
 
+    @_queued
     def add_nonuniform_nan(self, source_ds, data_object, fixed=False):
         """Add nonuniform data when data from all sources in a population is
         stored in a 2D array with NaN padding.
@@ -1202,27 +2407,24 @@ class NSDFWriter(object):
             'add 2D dataset under `nonuniform` only for dialect=NANPADDED'
         popname = source_ds.name.rpartition('/')[-1]
         ngrp = self.data[NONUNIFORM].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match sources '
                            'in `data_object`.')
         # Using {popname}_{variablename} for simplicity. What
         # about creating a hierarchy?
         tsname = '{}_{}'.format(popname, data_object.name)
         cols = [len(data_object.get_data(source)[0]) for source in
-                source_ds]
-        starts = np.zeros(source_ds.shape[0], dtype=int)
-        ends = np.asarray(cols, dtype=int)
+                sources]
+        starts = np.zeros(source_ds.shape[0], dtype=np.int64)
+        ends = np.asarray(cols, dtype=np.int64)
         try:
             dataset = ngrp[data_object.name]
-            for iii in range(source_ds.shape[0]):
-                try:
-                    starts[iii] = next(find(dataset[iii], np.isnan))[0][0]
-                except StopIteration:
-                    starts[iii] = len(dataset[iii])
-                ends[iii] = starts[iii] + cols[iii]
-            dataset.resize(max(ends), 1)            
+            starts, length_ds = self._get_fill_lengths(NONUNIFORM, dataset)
+            ends = starts + ends
+            dataset.resize(max(max(ends), dataset.shape[1]), 1)
             time_ds = self.time_dim[tsname]
-            time_ds.resize(max(ends), 1)
+            time_ds.resize(dataset.shape[1], 1)
         except KeyError:
             if data_object.unit is None:
                 raise ValueError('`unit` is required for creating dataset.')
@@ -1231,37 +2433,76 @@ class NSDFWriter(object):
             
             maxrows = len(source_ds) if fixed else None
             maxcols = max(cols) if fixed else None
-            dataset = ngrp.create_dataset(
-                data_object.name,
+            dataset = self._create_dataset(
+                ngrp, data_object.name,
                 shape=(source_ds.shape[0], max(ends)),
                 maxshape=(maxrows, maxcols),
                 fillvalue=np.nan,
-                dtype=data_object.dtype,
-                **self.h5args)
+                dtype=data_object.dtype)
             dataset.attrs['field'] = data_object.field
             dataset.attrs['unit'] = data_object.unit
             source_ds.make_scale('source')
             dataset.dims[0].attach_scale(source_ds)
             dataset.dims[0].label = 'source'
-            time_ds = self.time_dim.create_dataset(
-                tsname,
+            time_ds = self._create_dataset(
+                self.time_dim, tsname,
                 shape=dataset.shape,
                 maxshape=(maxrows,maxcols),
                 dtype=data_object.ttype,
-                fillvalue=np.nan,
-                **self.h5args)
+                fillvalue=np.nan)
             time_ds.make_scale('time')
             # dataset.dims.create_scale(time_ds, 'time')
             dataset.dims[1].attach_scale(time_ds)
             dataset.dims[1].label = 'time'            
             time_ds.attrs['unit'] = data_object.tunit
-        for iii, source in enumerate(source_ds):
+            length_ds = self._create_fill_lengths(NONUNIFORM, dataset)
+        for iii, source in enumerate(sources):
             data, time = data_object.get_data(source)
             dataset[iii, starts[iii]:ends[iii]] = data
             time_ds[iii, starts[iii]:ends[iii]] = time
+        length_ds[:] = ends
         return dataset
 
+    @_queued
+    def add_nonuniform_ragged(self, source_ds, data_object, fixed=False):
+        """Add nonuniform data when data from all sources in a population is
+        stored in a single flat dataset with an offsets index.
+
+        The data of all sources is concatenated in the order of
+        `source_ds` and appended to the 1D dataset
+        `/data/nonuniform/{population}/{name}` as one contiguous
+        block, and the sampling times to the dimension scale
+        `/map/time/{population}_{name}`. The positions of each
+        source's data in the block are appended as a row to the
+        offsets index `/map/offsets/nonuniform/{population}_{name}`.
+
+        Args: 
+            source_ds (HDF5 Dataset): the dataset under
+                `/map/nonuniform` created for this population of
+                sources (created by add_nonunifrom_ds).
+
+            data_object (nsdf.NonuniformData): NSDFData object storing
+                the data for all sources in `source_ds`.
+
+            fixed (bool): if True, this is a one-time write and the
+                data cannot grow. Default: False
+
+        Returns:
+            HDF5 Dataset containing the data.
+
+        Raises:
+            AssertionError if dialect is not RAGGED.
+
+            KeyError if the sources in `data_object` do not match
+            those in `source_ds`.
+
+        """
+        assert self.dialect == dialect.RAGGED,    \
+            'add flat dataset under `nonuniform` only for dialect=RAGGED'
+        return self._add_ragged(NONUNIFORM, source_ds, data_object, fixed)
+
 
+    @_queued
     def add_event_1d(self, source_ds, data_object, source_name_dict=None,
                      fixed=False):
         """Add event time data when data from each source is in a separate 1D
@@ -1305,11 +2546,7 @@ class NSDFWriter(object):
         assert ((self.dialect == dialect.ONED) or
             self.dialect == dialect.NUREGULAR), \
             'add 1D dataset under event only for dialect=ONED or NUREGULAR'
-        strinfo = h5.check_string_dtype(source_ds['source'].dtype)
-        if strinfo is None:
-            sources = source_ds['source']
-        else:
-            sources = [src.decode(strinfo.encoding) for src in source_ds['source']]
+        sources, index = self._source_index(source_ds)
         if source_name_dict is None:
             # if names contain invalid chars for HDF5 name, substitute with index
             if np.any((np.char.find(sources, '/') >= 0) |
@@ -1322,20 +2559,22 @@ class NSDFWriter(object):
             'The names in `source_name_dict` must be unique'
         popname = source_ds.name.split('/')[-2]
         ngrp = self.data[EVENT].require_group(popname)
-        assert match_datasets(source_name_dict.keys(),
-                              data_object.get_sources()),  \
+        assert source_name_dict.keys() ==   \
+            data_object.get_source_data_dict().keys(),  \
             'sources do not match dataset'
         datagrp = ngrp.require_group(data_object.name)
         datagrp.attrs['source'] = source_ds.ref
         datagrp.attrs['unit'] = data_object.unit
         datagrp.attrs['field'] = data_object.field
         ret = {}
+        new_refs = {}
         for iii, source in enumerate(sources):
             data = data_object.get_data(source)
             dsetname = source_name_dict[source]
             try:
                 dset = datagrp[dsetname]
                 oldlen = dset.shape[0]
+                data = self._encode_times(dset, data)
                 dset.resize((oldlen + len(data),))
                 dset[oldlen:] = data
             except KeyError:
@@ -1344,19 +2583,25 @@ class NSDFWriter(object):
                 if data_object.field is None:
                     raise ValueError('`field` is required for creating dataset.')
                 maxrows = len(data) if fixed else None
-                dset = datagrp.create_dataset(
-                    dsetname,
+                encoding = self.time_encoding
+                dtype = data_object.dtype
+                if encoding is not None:
+                    data, dtype = encoding.encode(data), encoding.dtype
+                dset = self._create_dataset(
+                    datagrp, dsetname,
                     shape=(len(data),),
-                    dtype=data_object.dtype, data=data,
-                    maxshape=(maxrows,),
-                    **self.h5args)
+                    dtype=dtype, data=data,
+                    maxshape=(maxrows,))
+                self._init_encoding(dset, encoding, data)
                 dset.attrs['unit'] = data_object.unit
                 dset.attrs['field'] = data_object.field
                 dset.attrs['source'] = source
-                source_ds[iii] = (source, dset.ref)
+                new_refs[iii] = dset.ref
             ret[source] = dset
+        self._set_map_refs(source_ds, sources, new_refs)
         return ret
     
+    @_queued
     def add_event_vlen(self, source_ds, data_object, fixed=False):
         """Add event data when data from all sources in a population is
         stored in a 2D ragged array.
@@ -1382,9 +2627,9 @@ class NSDFWriter(object):
             HDF5 Dataset containing the data.
 
         Notes: 
-            Concatenating old data with new data and reassigning is a
-            poor choice for saving data incrementally. HDF5 does not
-            seem to support appending data to VLEN datasets.
+            Unless the writer was created with `vlen_segments=True`,
+            appending rewrites every row of the dataset. See
+            `append_vlen_rows`.
 
             h5py does not support vlen datasets with float64
             elements. Change dtype to np.float64 once that is
@@ -1396,33 +2641,28 @@ class NSDFWriter(object):
                             ' only for dialect=VLEN')
         popname = source_ds.name.rpartition('/')[-1]
         ngrp = self.data[EVENT].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match sources '
-                           'in `data_object`.')        
+                           'in `data_object`.')
         try:
             dataset = ngrp[data_object.name]
         except KeyError:
             if data_object.unit is None:
                 raise ValueError('`unit` is required for creating dataset.')
-            vlentype = h5.special_dtype(vlen=data_object.dtype)
-            maxrows = len(source_ds) if fixed else None
-            # Fix me: is there any point of keeping the compression
-            # and shuffle options?
-            dataset = ngrp.create_dataset(
-                data_object.name, shape=source_ds.shape,
-                maxshape=(maxrows,),
-                dtype=vlentype,
-                **self.h5args)
+            dataset = self._create_vlen_dataset(
+                ngrp, data_object.name, source_ds.shape[0],
+                data_object.dtype, fixed)
             dataset.attrs['field'] = data_object.field
             dataset.attrs['unit'] = data_object.unit
             source_ds.make_scale('source')
             dataset.dims[0].attach_scale(source_ds)
             dataset.dims[0].label = 'source'            
-        for iii, source in enumerate(source_ds):
-            data = data_object.get_data(source)
-            dataset[iii] = np.concatenate((dataset[iii], data))
+        self._append_vlen((dataset,),
+                          ([data_object.get_data(src) for src in sources],))
         return dataset
 
+    @_queued
     def add_event_nan(self, source_ds, data_object, fixed=False):
         """Add event data when data from all sources in a population is
         stored in a 2D array with NaN padding.
@@ -1446,44 +2686,216 @@ class NSDFWriter(object):
             'add 2D vlen dataset under event only for dialect=NANPADDED'
         popname = source_ds.name.rpartition('/')[-1]
         ngrp = self.data[EVENT].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match sources '
                            'in `data_object`.')
         cols = [len(data_object.get_data(source)) for source in
-                source_ds]
-        starts = np.zeros(source_ds.shape[0], dtype=int)
-        ends = np.asarray(cols, dtype=int)
+                sources]
+        starts = np.zeros(source_ds.shape[0], dtype=np.int64)
+        ends = np.asarray(cols, dtype=np.int64)
         try:
             dataset = ngrp[data_object.name]
-            for iii in range(dataset.shape[0]):
-                try:
-                    starts[iii] = next(find(dataset[iii], np.isnan))[0][0]
-                except StopIteration:
-                    starts[iii] = len(dataset[iii])
-                ends[iii] = starts[iii] + cols[iii]
-            dataset.resize(max(ends), 1)            
+            starts, length_ds = self._get_fill_lengths(EVENT, dataset)
+            ends = starts + ends
+            dataset.resize(max(max(ends), dataset.shape[1]), 1)
         except KeyError:
             if data_object.unit is None:
                 raise ValueError('`unit` is required for creating dataset.')
             maxrows = len(source_ds) if fixed else None
             maxcols = max(ends) if fixed else None
-            dataset = ngrp.create_dataset(
-                data_object.name,
+            dataset = self._create_dataset(
+                ngrp, data_object.name,
                 shape=(source_ds.shape[0], max(ends)),
                 maxshape=(maxrows, maxcols),
                 dtype=data_object.dtype,
-                fillvalue=np.nan,
-                **self.h5args)
+                fillvalue=np.nan)
             dataset.attrs['field'] = data_object.field
             dataset.attrs['unit'] = data_object.unit
             source_ds.make_scale('source')
             dataset.dims[0].attach_scale(source_ds)
             dataset.dims[0].label = 'source'            
-        for iii, source in enumerate(source_ds):
+            length_ds = self._create_fill_lengths(EVENT, dataset)
+        for iii, source in enumerate(sources):
             data = data_object.get_data(source)
             dataset[iii, starts[iii]:ends[iii]] = data
+        length_ds[:] = ends
+        return dataset
+
+    @_queued
+    def add_event_ragged(self, source_ds, data_object, fixed=False):
+        """Add event data when data from all sources in a population is
+        stored in a single flat dataset with an offsets index.
+
+        The event times of all sources are concatenated in the order
+        of `source_ds` and appended to the 1D dataset
+        `/data/event/{population}/{name}` as one contiguous block. The
+        positions of each source's data in the block are appended as
+        a row to the offsets index
+        `/map/offsets/event/{population}_{name}`.
+
+        Args: 
+            source_ds (HDF5 Dataset): the dataset under
+                `/map/event` created for this population of
+                sources (created by add_event_ds).
+
+            data_object (nsdf.EventData): NSDFData object storing
+                the data for all sources in `source_ds`.
+
+            fixed (bool): if True, this is a one-time write and the
+                data cannot grow. Default: False
+
+        Returns:
+            HDF5 Dataset containing the data.
+
+        Raises:
+            AssertionError if dialect is not RAGGED.
+
+            KeyError if the sources in `data_object` do not match
+            those in `source_ds`.
+
+        """
+        assert self.dialect == dialect.RAGGED,    \
+            'add flat dataset under `event` only for dialect=RAGGED'
+        return self._add_ragged(EVENT, source_ds, data_object, fixed)
+
+    def _add_ragged(self, stype, source_ds, data_object, fixed):
+        """Append the data in `data_object` as one block to the flat
+        dataset for sampling type `stype` (EVENT or NONUNIFORM) and
+        record the block in its offsets index."""
+        popname = source_ds.name.rpartition('/')[-1]
+        grp = self.data[stype].require_group(popname)
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
+            raise KeyError('members of `source_ds` must match sources '
+                           'in `data_object`.')
+        if stype == EVENT:
+            blocks = [data_object.get_data(src) for src in sources]
+        else:
+            blocks = [data_object.get_data(src)[0] for src in sources]
+            tblocks = [data_object.get_data(src)[1] for src in sources]
+        lengths = np.array([len(block) for block in blocks], dtype=np.int64)
+        data = np.concatenate(blocks)
+        tsname = '{}_{}'.format(popname, data_object.name)
+        try:
+            dataset = grp[data_object.name]
+            offsets = self._fd[dataset.attrs['offsets']]
+            start = dataset.shape[0]
+            if stype == EVENT:
+                data = self._encode_blocks(
+                    TickEncoding.from_attrs(dataset.attrs, dataset.dtype),
+                    blocks, data)
+            else:
+                time_ds = self.time_dim[tsname]
+                times = self._encode_blocks(
+                    TickEncoding.from_attrs(time_ds.attrs, time_ds.dtype),
+                    tblocks)
+            dataset.resize((start + len(data),))
+            dataset[start:] = data
+            if stype == NONUNIFORM:
+                time_ds.resize((start + len(data),))
+                time_ds[start:] = times
+            offsets.resize(offsets.shape[0] + 1, axis=0)
+        except KeyError:
+            if data_object.unit is None:
+                raise ValueError('`unit` is required for creating dataset.')
+            if (stype == NONUNIFORM) and (data_object.tunit is None):
+                raise ValueError('`tunit` is required for creating dataset.')
+            start = 0
+            maxlen = len(data) if fixed else None
+            encoding = self.time_encoding
+            dtype = data_object.dtype
+            if stype == EVENT and encoding is not None:
+                data = self._encode_blocks(encoding, blocks, data)
+                dtype = encoding.dtype
+            dataset = self._create_dataset(
+                grp, data_object.name,
+                shape=data.shape,
+                maxshape=(maxlen,),
+                dtype=dtype,
+                data=data)
+            if stype == EVENT and encoding is not None:
+                encoding.set_attrs(dataset)
+            dataset.attrs['field'] = data_object.field
+            dataset.attrs['unit'] = data_object.unit
+            dataset.attrs['source'] = source_ds.ref
+            offsets = self.mapping.require_group('offsets').require_group(
+                stype).create_dataset(
+                    tsname,
+                    shape=(1, len(sources) + 1),
+                    maxshape=(1 if fixed else None, len(sources) + 1),
+                    chunks=None if fixed else (1, len(sources) + 1),
+                    dtype=np.int64)
+            dataset.attrs['offsets'] = offsets.ref
+            if stype == NONUNIFORM:
+                times = self._encode_blocks(encoding, tblocks)
+                time_ds = self._create_dataset(
+                    self.time_dim, tsname,
+                    shape=times.shape,
+                    maxshape=(maxlen,),
+                    dtype=data_object.ttype if encoding is None
+                    else encoding.dtype,
+                    data=times)
+                if encoding is not None:
+                    encoding.set_attrs(time_ds)
+                time_ds.make_scale('time')
+                dataset.dims[0].attach_scale(time_ds)
+                dataset.dims[0].label = 'time'
+                time_ds.attrs['unit'] = data_object.tunit
+        positions = np.empty(len(sources) + 1, dtype=np.int64)
+        positions[0] = start
+        np.cumsum(lengths, out=positions[1:])
+        positions[1:] += start
+        offsets[-1] = positions
         return dataset
     
+    def _encode_blocks(self, encoding, blocks, values=None):
+        """Return the concatenated time values in `blocks` encoded with
+        `encoding`, or as they are if `encoding` is None.
+
+        With delta encoding each block is encoded separately, starting
+        from its absolute tick. `values` is the concatenation of
+        `blocks` if already computed.
+
+        """
+        if encoding is None:
+            return np.concatenate(blocks) if values is None else values
+        if encoding.delta:
+            return np.concatenate([encoding.encode(block) for block in
+                                   blocks])
+        if values is None:
+            values = np.concatenate(blocks)
+        return encoding.encode(values)
+
+    def _encode_times(self, dataset, times):
+        """Encode `times` to be appended to 1D `dataset` with the
+        encoding recorded in it, if any.
+
+        Delta encoded datasets keep their last absolute tick in the
+        attribute `tick_last`, so that appending does not require
+        reading the existing data.
+
+        """
+        encoding = TickEncoding.from_attrs(dataset.attrs, dataset.dtype)
+        if encoding is None:
+            return times
+        previous = dataset.attrs.get('tick_last')
+        values = encoding.encode(times, previous)
+        if encoding.delta and len(values):
+            dataset.attrs['tick_last'] = (previous or 0) + \
+                int(np.sum(values, dtype=np.int64))
+        return values
+
+    def _init_encoding(self, dataset, encoding, values):
+        """Record `encoding` of the ticks `values` written to the new 1D
+        `dataset`, if not None."""
+        if encoding is None:
+            return
+        encoding.set_attrs(dataset)
+        if encoding.delta and len(values):
+            dataset.attrs['tick_last'] = int(np.sum(values, dtype=np.int64))
+
+    @_queued
     def add_static_data(self, source_ds, data_object,
                         fixed=True):
         """Append static data `variable` values from `sources` to `data`.
@@ -1508,37 +2920,71 @@ class NSDFWriter(object):
         
         """
         popname = source_ds.name.rpartition('/')[-1]
-        strinfo = h5.check_string_dtype(source_ds.dtype)
-        # This is to handle  h5py VLEN str presented as bytes
-        # conflicting with python str
-        if strinfo is not None:
-            src_ds_ = [src.decode(strinfo.encoding) for src in source_ds]
-        else:
-            src_ds_ = src_ds
         ugrp = self.data[STATIC].require_group(popname)
-        if not match_datasets(source_ds, data_object.get_sources()):
+        sources = self._ordered_sources(source_ds, data_object)
+        if sources is None:
             raise KeyError('members of `source_ds` must match keys of'
                            ' `source_data_dict`.')
-        ordered_data = [data_object.get_data( src) for src in    \
-                        src_ds_]
+        ordered_data = [data_object.get_data(src) for src in sources]
         data = np.vstack(ordered_data)
+        return self._add_static(ugrp, source_ds, data_object, data, fixed)
+
+    @_queued
+    def add_static_array(self, source_ds, data_object, data, sources=None,
+                         fixed=True):
+        """Append static data stored in the rows of a 2D array.
+
+        Like `add_uniform_array`, `data` is written without copying
+        when its rows are in the order of the sources in `source_ds`.
+
+        Args:
+            source_ds (HDF5 Dataset): the dataset storing the source
+                ids under map.
+
+            data_object (nsdf.StaticData): data object providing the
+                name, unit and field of the dataset. Any data stored
+                in it is ignored.
+
+            data (numpy.ndarray): 2D array with one row per source.
+
+            sources (sequence): the source of each row of `data`. If
+                None, the rows are in the order of `source_ds`.
+                Default: None.
+
+            fixed (bool): if True, the data cannot grow. Default: True
+
+        Returns:
+            HDF5 dataset storing the data
+
+        Raises:
+            KeyError if `sources` do not match those in `source_ds`.
+
+            ValueError if `data` does not have one row per source.
+
+        """
+        popname = source_ds.name.rpartition('/')[-1]
+        ugrp = self.data[STATIC].require_group(popname)
+        data = self._source_rows(source_ds, data, sources)
+        return self._add_static(ugrp, source_ds, data_object, data, fixed)
+
+    def _add_static(self, ugrp, source_ds, data_object, data, fixed):
+        """Write the rows of 2D array `data`, in the order of the
+        sources in `source_ds`, to the static dataset for `data_object`
+        under `ugrp`, creating the dataset if needed."""
         try:
             dataset = ugrp[data_object.name]
-            oldcolcount = dataset.shape[1]
-            dataset.resize(oldcolcount + data.shape[1], axis=1)
-            dataset[:, oldcolcount:] = data
+            write_columns(dataset, data)
         except KeyError:
             if data_object.unit is None:
                 raise ValueError('`unit` is required for creating dataset.')
             maxcol = None
             if fixed:
                 maxcol = data.shape[1]
-            dataset = ugrp.create_dataset(
-                data_object.name, shape=data.shape,
+            dataset = self._create_dataset(
+                ugrp, data_object.name, shape=data.shape,
                 dtype=data_object.dtype,
-                data=data,
-                maxshape=(data.shape[0], maxcol),
-                **self.h5args)
+                maxshape=(data.shape[0], maxcol))
+            dataset.write_direct(np.ascontiguousarray(data))
             source_ds.make_scale('source')
             dataset.dims[0].attach_scale(source_ds)
             dataset.dims[0].label = 'source'                        
@@ -1546,6 +2992,320 @@ class NSDFWriter(object):
             dataset.attrs['unit'] = data_object.unit
         return dataset
 
+
+# Attributes maintained by HDF5 for dimension scales. These are
+# recreated by attaching the scales in the merged file.
+_DIMSCALE_ATTRS = set(['CLASS', 'NAME', 'DIMENSION_LIST', 'REFERENCE_LIST',
+                       'DIMENSION_LABELS'])
+
+
+def _is_ref_dtype(dtype):
+    """Whether `dtype` is or contains an HDF5 object reference type."""
+    if dtype.fields is None:
+        return h5.check_ref_dtype(dtype) is not None
+    return any(_is_ref_dtype(field[0]) for field in dtype.fields.values())
+
+
+def _remap_refs(value, shard, target):
+    """Replace the references to objects in the file `shard` stored in
+    `value` with references to the objects of the same name in
+    `target`."""
+    if isinstance(value, h5.Reference):
+        if not value:
+            return value
+        return target[shard[value].name].ref
+    value = np.array(value)
+    if value.dtype.fields is not None:
+        for name in value.dtype.names:
+            if _is_ref_dtype(value.dtype[name]):
+                value[name] = _remap_refs(value[name], shard, target)
+        return value
+    flat = [_remap_refs(ref, shard, target) for ref in value.flat]
+    return np.array(flat, dtype=REFTYPE).reshape(value.shape)
+
+
+def _copy_attrs(source, dest, shard, target, refs):
+    """Copy the attributes of `source` in `shard` to `dest`. Only
+    attributes containing object references are copied if `refs` is
+    True, and only the others if it is False."""
+    for key in source.attrs:
+        if key in _DIMSCALE_ATTRS:
+            continue
+        value = source.attrs[key]
+        isref = (isinstance(value, h5.Reference) or
+                 (isinstance(value, np.ndarray) and
+                  _is_ref_dtype(value.dtype)))
+        if isref and refs:
+            dest.attrs[key] = _remap_refs(value, shard, target)
+        elif not isref and not refs:
+            dest.attrs[key] = value
+
+
+def merge_shards(filename, shardfiles):
+    """Combine NSDF files written independently, for example by
+    separate worker processes, into a single NSDF file.
+
+    Each shard is written by its own NSDFWriter with the same dialect,
+    for a subset of the populations or for a subset of the sources of
+    a population. In the merged file, every dataset under `/data` and
+    `/map` is an HDF5 virtual dataset over the corresponding datasets
+    in the shards, so no data is copied. Datasets present in more than
+    one shard are concatenated along the rows (sources) in the order
+    of `shardfiles`, and padded to the longest shard along the other
+    dimensions with the fill value of the dataset. The `/model` group
+    is taken from the first shard that has each entry.
+
+    The shard files are referred to by their paths relative to the
+    merged file, and must remain accessible at the same relative
+    location for reading the merged data.
+
+    Only the datasets whose rows are the sources of a population (the
+    maps, the data and the time dimension scales of the same shape as
+    the data) are concatenated. Other datasets present in more than
+    one shard, like the sampling times shared by all sources in the
+    NUREGULAR dialect, must be identical in all of them and are taken
+    once.
+
+    Datasets containing object references, like the maps of the ONED
+    dialect, cannot be virtual and are copied with their references
+    updated. Datasets of the RAGGED dialect can only be merged when
+    each population is written in a single shard. The per-source
+    datasets of the ONED dialect must have distinct names across the
+    shards, which is not the case by default for sources whose uids
+    contain '.' or '/' (see `source_name_dict` of `add_event_1d` and
+    `add_nonuniform_1d`).
+
+    If any shard has a uid index (see `NSDFWriter.add_uid_index`), the
+    index is rebuilt for the merged file.
+
+    Args:
+        filename (str): path of the merged file. It is overwritten if
+            it exists.
+
+        shardfiles (list of str): paths of the shard files.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError if the shards have different dialects, if the
+        datasets of a population cannot be concatenated or are encoded
+        with different scale factors, offsets or ticks, if a dataset
+        shared by the sources differs between the shards, or if ONED
+        datasets of different shards have the same name.
+
+    """
+    destdir = os.path.dirname(os.path.abspath(filename))
+    relnames = [os.path.relpath(os.path.abspath(path), destdir)
+                for path in shardfiles]
+    shards = [h5.File(path, 'r') for path in shardfiles]
+    try:
+        dialects = set(shard.attrs.get('dialect') for shard in shards)
+        if len(dialects) > 1:
+            raise ValueError('shards have different dialects: {}'.format(
+                dialects))
+        entries = {}
+        order = []
+        def collect(index):
+            def visit(name, obj):
+                if name not in entries:
+                    entries[name] = []
+                    order.append(name)
+                entries[name].append((index, obj))
+            return visit
+        persource, oned = set(), set()
+        for index, shard in enumerate(shards):
+            shard.visititems(collect(index))
+            _classify_datasets(shard, persource, oned)
+        # The rows in the uid indices of the shards are those within
+        # each shard: the index is rebuilt for the merged file
+        uid_index = entries.pop('map/uid_index', None) is not None
+        if uid_index:
+            order.remove('map/uid_index')
+        for name in order:
+            items = entries[name]
+            if len(items) < 2 or isinstance(items[0][1], h5.Group) or \
+               name.startswith('model/'):
+                continue
+            if name in oned:
+                raise ValueError('ONED dataset {} exists in more than one'
+                                 ' shard. Give the datasets distinct'
+                                 ' names with `source_name_dict`.'.format(
+                                     name))
+            if name in persource and not _same_encoding(items):
+                raise ValueError('dataset {} is encoded differently in the'
+                                 ' shards. Give the shards a common'
+                                 ' offset, e.g. ScaleOffset(scale,'
+                                 ' offset=...).'.format(name))
+            if name not in persource:
+                if not _same_data(items):
+                    raise ValueError('dataset {} differs between the'
+                                     ' shards.'.format(name))
+                entries[name] = items[:1]
+        with h5.File(filename, 'w') as fd:
+            _copy_attrs(shards[0], fd, shards[0], fd, False)
+            deferred = []
+            for name in order:
+                items = entries[name]
+                if isinstance(items[0][1], h5.Group):
+                    group = fd.require_group(name)
+                    for index, obj in items:
+                        _copy_attrs(obj, group, shards[index], fd, False)
+                elif _is_ref_dtype(items[0][1].dtype):
+                    deferred.append(name)
+                else:
+                    if name.startswith('model/'):
+                        items = items[:1]
+                    _merge_virtual(fd, name, items, relnames)
+            for name in deferred:
+                items = entries[name]
+                data = np.concatenate([
+                    _remap_refs(obj[()], shards[index], fd)
+                    for index, obj in items])
+                index, obj = items[0]
+                dataset = fd.create_dataset(name, data=data, dtype=obj.dtype)
+                _copy_attrs(obj, dataset, shards[index], fd, False)
+            for name in order:
+                index, obj = entries[name][0]
+                dest = fd[name]
+                _copy_attrs(obj, dest, shards[index], fd, True)
+                if not isinstance(obj, h5.Dataset):
+                    continue
+                for dim, dest_dim in zip(obj.dims, dest.dims):
+                    if dim.label:
+                        dest_dim.label = dim.label
+                    for scalename, scale in dim.items():
+                        dest_scale = fd[scale.name]
+                        if not dest_scale.is_scale:
+                            dest_scale.make_scale(scalename)
+                        dest_dim.attach_scale(dest_scale)
+    finally:
+        for shard in shards:
+            shard.close()
+    if uid_index:
+        # Reading the virtual datasets needs the shards closed here
+        with h5.File(filename, 'a') as fd:
+            _write_uid_index(fd)
+
+
+def _write_uid_index(fd):
+    """Create or replace the uid index dataset `/map/uid_index` of the
+    NSDF file `fd`."""
+    records = list(uid_records(fd))
+    table = np.empty(len(records), dtype=UIDINDEXTYPE)
+    for ii, record in enumerate(records):
+        table[ii] = record
+    if 'uid_index' in fd['map']:
+        del fd['map']['uid_index']
+    fd['map'].create_dataset('uid_index', data=table)
+
+
+def _classify_datasets(shard, persource, oned):
+    """Add the names of the datasets in `shard` whose rows are the
+    sources of a population (maps, data with a source dimension scale
+    and their time scales and indices of the same length) to the set
+    `persource`, and those of the per-source datasets of the ONED
+    dialect and their time scales to the set `oned`."""
+    def visit(name, obj):
+        if not isinstance(obj, h5.Dataset):
+            return
+        parts = name.split('/')
+        if parts[0] == 'map' and len(parts) > 2 and \
+           parts[1] in SAMPLING_TYPES:
+            persource.add(name)
+            return
+        if parts[0] != 'data' or obj.ndim == 0:
+            return
+        if 'source' in obj.parent.attrs:
+            oned.add(name)
+            for scale in obj.dims[0].values():
+                oned.add(scale.name.lstrip('/'))
+            return
+        if 'source' not in obj.attrs and \
+           'source' not in obj.dims[0].keys():
+            return
+        persource.add(name)
+        for dim in obj.dims:
+            for scale in dim.values():
+                if scale.ndim == obj.ndim:
+                    persource.add(scale.name.lstrip('/'))
+        # Indices referred to by attributes, like the fill lengths of
+        # NANPADDED data, with one row per source
+        for value in obj.attrs.values():
+            if not isinstance(value, h5.Reference) or not value:
+                continue
+            target = shard[value]
+            if isinstance(target, h5.Dataset) and target.ndim and \
+               target.shape[0] == obj.shape[0]:
+                persource.add(target.name.lstrip('/'))
+    shard.visititems(visit)
+
+
+def _same_data(items):
+    """Whether the shard datasets in `items` have the same contents."""
+    first = items[0][1]
+    values = first[()]
+    for index, obj in items[1:]:
+        if obj.shape != first.shape or obj.dtype != first.dtype:
+            return False
+        if not np.array_equal(obj[()], values,
+                              equal_nan=first.dtype.kind == 'f'):
+            return False
+    return True
+
+
+def _same_encoding(items):
+    """Whether the shard datasets in `items` store their values with
+    the same scaled integer (`ScaleOffset`) and tick (`TickEncoding`)
+    encoding attributes, so that their raw values can be joined."""
+    first = items[0][1]
+    for key in ENCODING_ATTRS:
+        value = first.attrs.get(key)
+        for index, obj in items[1:]:
+            other = obj.attrs.get(key)
+            if (value is None) != (other is None) or \
+               (value is not None and not np.array_equal(value, other)):
+                return False
+    return True
+
+
+def _merge_virtual(fd, name, items, relnames):
+    """Create virtual dataset `name` in `fd` concatenating the shard
+    datasets in `items` along the first axis."""
+    first = items[0][1]
+    if first.ndim == 0:
+        dataset = fd.create_dataset(name, data=first[()], dtype=first.dtype)
+        _copy_attrs(first, dataset, None, fd, False)
+        return dataset
+    if len(items) > 1:
+        if 'offsets' in first.attrs or name.startswith('map/offsets/'):
+            raise ValueError('RAGGED dataset {} is split across shards.'
+                             ' Write each population in a single'
+                             ' shard.'.format(name))
+        for index, obj in items:
+            if obj.ndim != first.ndim or obj.dtype != first.dtype:
+                raise ValueError('datasets {} in the shards cannot be'
+                                 ' concatenated.'.format(name))
+    shape = (sum(obj.shape[0] for index, obj in items),) + tuple(
+        max(obj.shape[axis] for index, obj in items)
+        for axis in range(1, first.ndim))
+    layout = h5.VirtualLayout(shape=shape, dtype=first.dtype)
+    start = 0
+    for index, obj in items:
+        rows = obj.shape[0]
+        if 0 not in obj.shape:
+            region = (slice(start, start + rows),) + tuple(
+                slice(0, size) for size in obj.shape[1:])
+            layout[region] = h5.VirtualSource(relnames[index], obj.name,
+                                              shape=obj.shape)
+        start += rows
+    fillvalue = None
+    if first.dtype.kind not in 'OSUV':
+        fillvalue = first.fillvalue
+    dataset = fd.create_virtual_dataset(name, layout, fillvalue=fillvalue)
+    _copy_attrs(first, dataset, None, fd, False)
+    return dataset
+
     
 # 
 # nsdfwriter.py ends here
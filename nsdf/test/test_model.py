@@ -99,6 +99,130 @@ class TestModel(unittest.TestCase):
         for ii in range(1, uid__):
             self.assertIn(str(ii), id_path_dict)
 
+    def test_id_path_dict_incremental(self):
+        """Components added after the mapping is built are included"""
+        self.mdict = create_ob_model_tree()
+        tree = self.mdict['model_tree']
+        id_path_dict = tree.get_id_path_dict()
+        cell = model.ModelComponent('mitral_10', uid='mc10')
+        cell.add_children([model.ModelComponent('mc_{}'.format(ii),
+                                                uid='mc10_{}'.format(ii))
+                           for ii in range(3)])
+        self.mdict['mitral_population'].add_child(cell)
+        model.ModelComponent('soma', uid='mc10_soma', parent=cell)
+        self.assertIs(tree.get_id_path_dict(), id_path_dict)
+        self.assertEqual(id_path_dict['mc10'], '/model/Mitral/mitral_10')
+        self.assertEqual(id_path_dict['mc10_2'],
+                         '/model/Mitral/mitral_10/mc_2')
+        self.assertEqual(id_path_dict['mc10_soma'],
+                         '/model/Mitral/mitral_10/soma')
+        expected = dict(id_path_dict)
+        tree.update_id_path_dict()
+        self.assertEqual(tree.get_id_path_dict(), expected)
+
+    def test_id_path_dict_moved(self):
+        """The mapping of a component is rebuilt when it is moved"""
+        cell = model.ModelComponent('mitral_10', uid='mc10')
+        model.ModelComponent('soma', uid='mc10_soma', parent=cell)
+        self.assertEqual(cell.get_id_path_dict()['mc10_soma'],
+                         '/mitral_10/soma')
+        self.root.add_child(cell)
+        self.assertEqual(cell.get_id_path_dict()['mc10_soma'],
+                         '/root/mitral_10/soma')
+
+    def test_indexed_per_tree(self):
+        """Building the mapping of one tree does not make additions to
+        other trees update their ancestors"""
+        self.mdict = create_ob_model_tree()
+        self.mdict['model_tree'].get_id_path_dict()
+        cell = model.ModelComponent('mitral_10', uid='mc10',
+                                    parent=self.root)
+        self.assertFalse(cell._indexed)
+        self.root.get_id_path_dict()
+        soma = model.ModelComponent('soma', uid='mc10_soma', parent=cell)
+        self.assertTrue(soma._indexed)
+        self.assertEqual(self.root.get_id_path_dict()['mc10_soma'],
+                         '/root/mitral_10/soma')
+
+class TestModelTree(unittest.TestCase):
+    """Test the array-backed model tree."""
+    def setUp(self):
+        self.mdict = create_ob_model_tree()
+        self.tree = model.ModelTree('root', uid='root')
+        self.tree.root.add_child(self.mdict['model_tree'])
+
+    def tearDown(self):
+        reset_uid()
+
+    def test_paths(self):
+        root = self.tree.root
+        self.assertEqual(len(self.tree), 1 + len(
+            self.mdict['model_tree'].get_id_path_dict()))
+        id_path_dict = root.get_id_path_dict()
+        for uid, path in self.mdict['model_tree'].get_id_path_dict().items():
+            self.assertEqual(id_path_dict[uid], '/root' + path)
+        cell = root.get_node('model/Mitral/mitral_3')
+        self.assertEqual(cell.path, '/root/model/Mitral/mitral_3')
+        self.assertEqual(cell.depth, 3)
+        self.assertEqual(cell.parent, root.get_node('model/Mitral'))
+        self.assertEqual(sorted(cell.children),
+                         sorted(self.mdict['mitral_cells'][3].children))
+
+    def test_slots(self):
+        """Views do not carry an instance dict"""
+        self.assertFalse(hasattr(self.tree.root, '__dict__'))
+        self.assertFalse(hasattr(self.tree.root.children, '__dict__'))
+
+    def test_add_after_index(self):
+        """Components added later are in the id->path mapping"""
+        root = self.tree.root
+        id_path_dict = root.get_id_path_dict()
+        mitral = root.get_node('model/Mitral')
+        mitral.add_child(model.ModelComponent('mitral_10', uid='mc10',
+                                              attrs={'kind': 'mitral'}))
+        cell = mitral.children['mitral_10']
+        self.assertEqual(cell.attrs['kind'], 'mitral')
+        self.assertEqual(id_path_dict['mc10'], '/root/model/Mitral/mitral_10')
+        self.assertEqual(cell.path, '/root/model/Mitral/mitral_10')
+
+    def test_grandchild(self):
+        """Components created with a copied component as parent are added
+        to the tree"""
+        tree = model.ModelTree('root', uid='root')
+        soma = model.ModelComponent('soma', parent=tree.root)
+        dend = model.ModelComponent('dend', parent=soma)
+        model.ModelComponent('spine', parent=dend)
+        self.assertEqual(len(tree), 4)
+        self.assertEqual(tree.root.get_node('soma/dend/spine').path,
+                         '/root/soma/dend/spine')
+
+    def test_attach(self):
+        """The root of a ModelTree can be attached to a ModelComponent"""
+        top = model.ModelComponent('top')
+        index = top.get_id_path_dict()
+        top.add_child(self.tree.root)
+        self.assertEqual(self.tree.root.get_node('model').path,
+                         '/top/root/model')
+        self.assertEqual(index[self.mdict['mitral_cells'][0].uid],
+                         '/top/root/model/Mitral/mitral_0')
+        self.assertRaises(TypeError, top.add_child,
+                          self.tree.root.get_node('model'))
+
+    def test_deep_chain(self):
+        """Traversal does not recurse"""
+        tree = model.ModelTree('soma')
+        node = 0
+        for ii in range(5000):
+            node = tree.add(node, 'seg_{}'.format(ii))
+        self.assertEqual(tree.node(node).depth, 5000)
+        visited = []
+        tree.root.visit(lambda node: visited.append(node.name))
+        self.assertEqual(len(visited), 5001)
+        uid_dict = {}
+        tree.root.check_uid(uid_dict)
+        self.assertEqual(len(uid_dict), 5001)
+
+
 class TestCommonPrefix(unittest.TestCase):
     def setUp(self):
         self.paths = [
@@ -110,6 +234,12 @@ class TestCommonPrefix(unittest.TestCase):
             '/modeltree/model/Mitral/mitral_4']
     def test_common_prefix(self):
         self.assertEqual(common_prefix(self.paths), '/modeltree/model/Mitral')
+
+    def test_partial_token(self):
+        """Names sharing a prefix are not a common ancestor"""
+        self.assertEqual(common_prefix(['/a/b', '/a/b-c', '/a/b/d']), '/a')
+        self.assertEqual(common_prefix(['/a/b/c']), '/a/b/c')
+        self.assertEqual(common_prefix([]), '')
         
 if __name__ == '__main__':
     unittest.main()
@@ -91,6 +91,53 @@ class TestNSDFUniformData(unittest.TestCase):
             np.testing.assert_allclose(value,
                                self.data.get_data(key))
 
+
+class TestNSDFUniformBlockData(unittest.TestCase):
+    def setUp(self):
+        self.sources = ['src_{}'.format(name) for name in 'abc']
+        self.data = nsdf.UniformBlockData('test', self.sources, 10,
+                                          unit='m', field='distance',
+                                          dt=0.5, tunit='ms')
+
+    def test_create(self):
+        self.assertEqual(self.data.field, 'distance')
+        self.assertEqual(self.data.dt, 0.5)
+        self.assertEqual(self.data.get_block().shape, (3, 10))
+        self.assertEqual(self.data.get_sources(), self.sources)
+
+    def test_put(self):
+        values = np.random.uniform(size=10)
+        self.data.put_data('src_b', values)
+        row = self.data.get_data('src_b')
+        nptest.assert_allclose(row, values)
+        # rows are views of the block
+        row[0] = -1.0
+        self.assertEqual(self.data.get_block()[1, 0], -1.0)
+        self.assertRaises(KeyError, self.data.put_data, 'src_d', values)
+        self.assertEqual(set(self.data.get_source_data_dict().keys()),
+                         set(self.sources))
+
+    def test_block_input(self):
+        block = np.arange(6.0).reshape(2, 3)
+        data = nsdf.UniformBlockData('test', ['x', 'y'], block, unit='m')
+        self.assertIs(data.get_block(), block)
+        nptest.assert_allclose(data.get_data('y'), [3.0, 4.0, 5.0])
+        self.assertRaises(ValueError, nsdf.UniformBlockData, 'test',
+                          ['x', 'x'], 3)
+
+    def test_write(self):
+        filepath = '{}.h5'.format(self.id())
+        block = self.data.get_block()
+        block[:] = np.random.uniform(size=block.shape)
+        writer = nsdf.NSDFWriter(filepath, mode='w')
+        source_ds = writer.add_uniform_ds('pop', self.sources[::-1])
+        writer.add_uniform_data(source_ds, self.data)
+        writer.close()
+        with h5.File(filepath, 'r') as fd:
+            nptest.assert_allclose(fd['/data/uniform/pop/test'][()],
+                                   block[::-1])
+        os.remove(filepath)
+
 if __name__ == '__main__':
     unittest.main()
 
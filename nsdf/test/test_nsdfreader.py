@@ -123,6 +123,9 @@ def create_test_data_file(filename, dialect):
     elif dialect == nsdf.dialect.NANPADDED:
         writer.add_nonuniform_nan(nonuniform_ds, nonuniform_data)
         writer.add_event_nan(event_ds, event_data)
+    elif dialect == nsdf.dialect.RAGGED:
+        writer.add_nonuniform_ragged(nonuniform_ds, nonuniform_data)
+        writer.add_event_ragged(event_ds, event_data)
     else:
         raise Exception('unknown dialect: {}'.format(dialect))
     tend = datetime.now()
@@ -160,6 +163,47 @@ def create_test_data_file(filename, dialect):
     }
 
 
+def write_time_blocks(filename, dialect, sources, blocks,
+                      time_encoding=None):
+    """Write the event data `spike` and the nonuniform data `Im` of
+    population `pop` to a new file at path `filename` using dialect
+    `dialect`, appending one block at a time.
+
+    Each block in `blocks` maps the sources to their event times in
+    that block. The same times are used as the sampling times of `Im`,
+    whose values are the negated times stored as float32.
+
+    """
+    writer = nsdf.NSDFWriter(filename, dialect=dialect, mode='w',
+                             time_encoding=time_encoding)
+    if dialect == nsdf.dialect.ONED:
+        event_ds = writer.add_event_ds_1d('pop', 'spike', sources)
+        nonuniform_ds = writer.add_nonuniform_ds_1d('pop', 'Im', sources)
+    else:
+        event_ds = writer.add_event_ds('pop', sources)
+        nonuniform_ds = writer.add_nonuniform_ds('pop', sources)
+    for block in blocks:
+        event = nsdf.EventData('spike', unit='s')
+        nonuniform = nsdf.NonuniformData('Im', unit='pA', tunit='s',
+                                         dtype=np.float32)
+        for src, times in block.items():
+            event.put_data(src, times)
+            nonuniform.put_data(src, (-times, times))
+        if dialect == nsdf.dialect.ONED:
+            writer.add_event_1d(event_ds, event)
+            writer.add_nonuniform_1d(nonuniform_ds, nonuniform)
+        elif dialect == nsdf.dialect.VLEN:
+            writer.add_event_vlen(event_ds, event)
+            writer.add_nonuniform_vlen(nonuniform_ds, nonuniform)
+        elif dialect == nsdf.dialect.NANPADDED:
+            writer.add_event_nan(event_ds, event)
+            writer.add_nonuniform_nan(nonuniform_ds, nonuniform)
+        else:
+            writer.add_event_ragged(event_ds, event)
+            writer.add_nonuniform_ragged(nonuniform_ds, nonuniform)
+    writer.close()
+
+
 class TestNSDFReaderOneD(unittest.TestCase):
     """Check that file written in ONED dialect is read correctly"""
     def setUp(self):
@@ -405,8 +449,475 @@ class TestNSDFReaderNUREGULAR(unittest.TestCase):
             var = data.get_data(src)
             fvar = file_data.get_data(src)
             np.testing.assert_allclose(var, fvar)
-            
-            
+
+
+
+class TestNSDFReaderRAGGED(unittest.TestCase):
+    """Check that file written in RAGGED dialect is read correctly"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.data_dict = create_test_data_file(self.filename,
+                                               nsdf.dialect.RAGGED)
+
+    def tearDown(self):
+        os.remove(self.filename)
+
+    def test_get_nonuniform_data(self):
+        data = self.data_dict['nonuniform_data']
+        reader = nsdf.NSDFReader(self.filename)
+        file_data = reader.get_nonuniform_data('mitral', 'Im')
+        self.assertEqual(set(file_data.get_sources()),
+                         set(data.get_sources()))
+        self.assertEqual(data.unit, file_data.unit)
+        self.assertEqual(data.name, file_data.name)
+        self.assertEqual(data.tunit, file_data.tunit)
+        for src in data.get_sources():
+            var, times = data.get_data(src)
+            fvar, ftimes = file_data.get_data(src)
+            np.testing.assert_allclose(var, fvar)
+            np.testing.assert_allclose(times, ftimes)
+
+    def test_get_event_data(self):
+        data = self.data_dict['event_data']
+        reader = nsdf.NSDFReader(self.filename)
+        file_data = reader.get_event_data('cells', 'spike')
+        self.assertEqual(set(file_data.get_sources()),
+                         set(data.get_sources()))
+        self.assertEqual(data.unit, file_data.unit)
+        self.assertEqual(data.name, file_data.name)
+        for src in data.get_sources():
+            np.testing.assert_allclose(data.get_data(src),
+                                       file_data.get_data(src))
+
+    def test_append_event_data(self):
+        """Appended blocks are stitched back together per source"""
+        data = self.data_dict['event_data']
+        more = nsdf.EventData('spike', unit='ms', dtype=np.float32)
+        for src in data.get_sources():
+            more.put_data(src, np.random.uniform(100, 200,
+                                                 np.random.randint(0, 5)))
+        writer = nsdf.NSDFWriter(self.filename, dialect=nsdf.dialect.RAGGED,
+                                 mode='a')
+        writer.add_event_ragged(writer.mapping[nsdf.EVENT]['cells'], more)
+        writer.close()
+        reader = nsdf.NSDFReader(self.filename)
+        offsets = reader.mapping['offsets'][nsdf.EVENT]['cells_spike']
+        self.assertEqual(offsets.shape, (2, len(data.get_sources()) + 1))
+        for src in data.get_sources():
+            expected = np.concatenate((data.get_data(src),
+                                       more.get_data(src)))
+            np.testing.assert_allclose(
+                reader.get_event_source_data('cells', 'spike', src),
+                expected)
+        self.assertRaises(KeyError, reader.get_event_source_data, 'cells',
+                          'spike', 'unknown')
+
+
+class TestNSDFReaderScaleOffset(unittest.TestCase):
+    """Check that uniform data stored as scaled integers is read back as
+    floats"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.sources = ['a', 'b', 'c']
+        self.expected = np.random.uniform(-70, -50, size=(3, 40))
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def test_get_uniform_data(self):
+        writer = nsdf.NSDFWriter(self.filename, mode='w', buffersize=16)
+        source_ds = writer.add_uniform_ds('pop', self.sources)
+        writer.set_precision(source_ds, nsdf.ScaleOffset(0.01), 'Vm')
+        for start in range(0, 40, 10):
+            data = nsdf.UniformData('Vm', unit='mV', dt=0.1, tunit='ms')
+            for ii, src in enumerate(self.sources):
+                data.put_data(src, self.expected[ii, start: start + 10])
+            writer.add_uniform_data(source_ds, data)
+        data.put_data('a', [1000.0] * 10)
+        self.assertRaises(ValueError, writer.add_uniform_data, source_ds,
+                          data)
+        writer.close()
+        with h5.File(self.filename, 'r') as fd:
+            self.assertEqual(fd['/data/uniform/pop/Vm'].dtype, np.int16)
+        reader = nsdf.NSDFReader(self.filename)
+        file_data = reader.get_uniform_data('pop', 'Vm')
+        self.assertEqual(file_data.dtype, np.float64)
+        np.testing.assert_allclose(file_data.get_block(), self.expected,
+                                   atol=0.005)
+
+    def test_append_int32(self):
+        """Appends are range-checked against the type of the dataset"""
+        writer = nsdf.NSDFWriter(self.filename, mode='w')
+        source_ds = writer.add_uniform_ds('pop', self.sources)
+        writer.set_precision(source_ds, nsdf.ScaleOffset(0.001, offset=0,
+                                                         dtype=np.int32))
+        for scale in (1, 100):
+            data = nsdf.UniformData('Vm', unit='mV', dt=0.1, tunit='ms')
+            for ii, src in enumerate(self.sources):
+                data.put_data(src, scale * self.expected[ii])
+            writer.add_uniform_data(source_ds, data)
+        writer.close()
+        reader = nsdf.NSDFReader(self.filename)
+        np.testing.assert_allclose(
+            reader.get_uniform_data('pop', 'Vm').get_block(),
+            np.hstack((self.expected, 100 * self.expected)), atol=0.0005)
+
+
+class TestNSDFReaderTicks(unittest.TestCase):
+    """Check that times stored as integer ticks are read back as times"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.dt = 1e-4
+        self.sources = ['a', 'b', 'c']
+        self.blocks = []
+        start = 0
+        for size in [5, 3]:
+            block = {}
+            for ii, src in enumerate(self.sources):
+                ticks = start + np.cumsum(np.random.randint(1, 100, size + ii))
+                block[src] = ticks * self.dt
+            start += 10000
+            self.blocks.append(block)
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def write(self, dialect, delta):
+        encoding = nsdf.TickEncoding(self.dt, delta=delta, dtype=np.int32)
+        write_time_blocks(self.filename, dialect, self.sources, self.blocks,
+                          encoding)
+
+    def check(self, dialect):
+        reader = nsdf.NSDFReader(self.filename)
+        events = reader.get_event_data('pop', 'spike')
+        nonuniform = reader.get_nonuniform_data('pop', 'Im')
+        for src in self.sources:
+            expected = np.concatenate([block[src] for block in self.blocks])
+            np.testing.assert_allclose(events.get_data(src), expected)
+            np.testing.assert_allclose(nonuniform.get_data(src)[1],
+                                       expected)
+            if dialect == nsdf.dialect.RAGGED:
+                np.testing.assert_allclose(
+                    reader.get_event_source_data('pop', 'spike', src),
+                    expected)
+
+    def test_oned(self):
+        for delta in (False, True):
+            self.write(nsdf.dialect.ONED, delta)
+            self.check(nsdf.dialect.ONED)
+
+    def test_ragged(self):
+        for delta in (False, True):
+            self.write(nsdf.dialect.RAGGED, delta)
+            with h5.File(self.filename, 'r') as fd:
+                dataset = fd['/data/event/pop/spike']
+                self.assertEqual(dataset.dtype, np.int32)
+                self.assertEqual(dataset.attrs['encoding'],
+                                 'tick-delta' if delta else 'tick')
+            self.check(nsdf.dialect.RAGGED)
+
+    def test_append_overflow(self):
+        """Appends are range-checked against the type of the dataset"""
+        for dialect in (nsdf.dialect.ONED, nsdf.dialect.RAGGED):
+            self.write(dialect, False)
+            writer = nsdf.NSDFWriter(self.filename, dialect=dialect,
+                                     mode='a')
+            event = nsdf.EventData('spike', unit='s')
+            for src in self.sources:
+                event.put_data(src, [3e9 * self.dt])
+            if dialect == nsdf.dialect.ONED:
+                source_ds = writer.mapping[nsdf.EVENT]['pop']['spike']
+                self.assertRaises(ValueError, writer.add_event_1d,
+                                  source_ds, event)
+            else:
+                source_ds = writer.mapping[nsdf.EVENT]['pop']
+                self.assertRaises(ValueError, writer.add_event_ragged,
+                                  source_ds, event)
+            writer.close()
+
+    def test_not_multiple(self):
+        encoding = nsdf.TickEncoding(self.dt)
+        self.assertRaises(ValueError, encoding.encode, [0.5 * self.dt])
+
+
+class TestNSDFReaderWindow(unittest.TestCase):
+    """Check reading a time window of the data of a subset of sources"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.sources = ['a', 'b', 'c', 'd']
+        self.subset = ['d', 'b']
+        self.t0, self.t1 = 0.25, 0.6
+        self.dt = 1e-3
+        self.blocks = []
+        start = 0
+        for size in [40, 30]:
+            block = {}
+            for ii, src in enumerate(self.sources):
+                ticks = start + np.cumsum(np.random.randint(1, 10, size + ii))
+                block[src] = ticks * self.dt
+            start += 500
+            self.blocks.append(block)
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def test_uniform(self):
+        data = np.random.uniform(size=(len(self.sources), 100))
+        writer = nsdf.NSDFWriter(self.filename, mode='w')
+        source_ds = writer.add_uniform_ds('pop', self.sources)
+        vm = nsdf.UniformData('Vm', unit='mV', dt=0.01, tunit='s')
+        for src, row in zip(self.sources, data):
+            vm.put_data(src, row)
+        writer.add_uniform_data(source_ds, vm, tstart=0.1)
+        writer.close()
+        reader = nsdf.NSDFReader(self.filename)
+        window = reader.get_uniform_data('pop', 'Vm', t0=self.t0,
+                                         t1=self.t1, sources=self.subset)
+        self.assertEqual(window.get_sources(), self.subset)
+        self.assertAlmostEqual(window.tstart, 0.25)
+        rows = [self.sources.index(src) for src in self.subset]
+        np.testing.assert_allclose(window.get_block(), data[rows, 15:50])
+        self.assertRaises(KeyError, reader.get_uniform_data, 'pop', 'Vm',
+                          sources=['x'])
+
+    def check(self):
+        # Keep the window boundaries clear of the event ticks, where
+        # rounding decides whether an event is in the window
+        t0, t1 = self.t0 + self.dt / 2, self.t1 + self.dt / 2
+        reader = nsdf.NSDFReader(self.filename)
+        events = reader.get_event_data('pop', 'spike', t0=t0, t1=t1,
+                                       sources=self.subset)
+        nonuniform = reader.get_nonuniform_data('pop', 'Im', t0=t0, t1=t1,
+                                                sources=self.subset)
+        self.assertEqual(sorted(events.get_sources()), sorted(self.subset))
+        for src in self.subset:
+            times = np.concatenate([block[src] for block in self.blocks])
+            expected = times[(times >= t0) & (times < t1)]
+            np.testing.assert_allclose(events.get_data(src), expected,
+                                       rtol=1e-6)
+            values, ntimes = nonuniform.get_data(src)
+            np.testing.assert_allclose(ntimes, expected, rtol=1e-6)
+            np.testing.assert_allclose(values, -expected, rtol=1e-6)
+            self.assertEqual(nonuniform.dtype, values.dtype)
+        # The type is known even when nothing is read
+        for kwargs in [dict(sources=[]), dict(t0=10.0, t1=11.0)]:
+            empty = reader.get_nonuniform_data('pop', 'Im', **kwargs)
+            self.assertEqual(np.dtype(empty.dtype), nonuniform.dtype)
+        events = reader.get_event_data('pop', 'spike', t1=t1)
+        self.assertEqual(sorted(events.get_sources()), sorted(self.sources))
+        uids, counts = reader.get_event_counts('pop', 'spike', t0, t1,
+                                               self.subset)
+        self.assertEqual(uids, self.subset)
+        for src, count in zip(uids, counts):
+            times = np.concatenate([block[src] for block in self.blocks])
+            self.assertEqual(count, np.sum((times >= t0) & (times < t1)))
+
+    def test_oned(self):
+        write_time_blocks(self.filename, nsdf.dialect.ONED, self.sources,
+                          self.blocks)
+        self.check()
+
+    def test_vlen(self):
+        write_time_blocks(self.filename, nsdf.dialect.VLEN, self.sources,
+                          self.blocks)
+        self.check()
+
+    def test_nanpadded(self):
+        write_time_blocks(self.filename, nsdf.dialect.NANPADDED, self.sources,
+                          self.blocks)
+        self.check()
+
+    def test_ragged(self):
+        write_time_blocks(self.filename, nsdf.dialect.RAGGED, self.sources,
+                          self.blocks)
+        self.check()
+
+    def test_ticks(self):
+        for delta in (False, True):
+            encoding = nsdf.TickEncoding(self.dt, delta=delta)
+            for dialect in (nsdf.dialect.ONED, nsdf.dialect.RAGGED):
+                write_time_blocks(self.filename, dialect, self.sources,
+                                  self.blocks, encoding)
+                self.check()
+
+    def test_processes(self):
+        write_time_blocks(self.filename, nsdf.dialect.ONED, self.sources,
+                          self.blocks, nsdf.TickEncoding(self.dt))
+        reader = nsdf.NSDFReader(self.filename, processes=2)
+        events = reader.get_event_data('pop', 'spike')
+        nonuniform = reader.get_nonuniform_data('pop', 'Im')
+        self.assertEqual(nonuniform.tunit, 's')
+        for src in self.sources:
+            times = np.concatenate([block[src] for block in self.blocks])
+            np.testing.assert_allclose(events.get_data(src), times)
+            values, ntimes = nonuniform.get_data(src)
+            np.testing.assert_allclose(ntimes, times)
+            np.testing.assert_allclose(values, -times)
+
+    def test_other_scale(self):
+        """Only the scale called time is read as sampling times"""
+        write_time_blocks(self.filename, nsdf.dialect.ONED, self.sources,
+                          self.blocks)
+        with h5.File(self.filename, 'a') as fd:
+            group = fd.create_group('index')
+            for name, dataset in fd['/data/nonuniform/pop/Im'].items():
+                times = dataset.dims[0]['time']
+                dataset.dims[0].detach_scale(times)
+                index = group.create_dataset(name,
+                                             data=np.arange(len(dataset)))
+                index.make_scale('index')
+                dataset.dims[0].attach_scale(index)
+                dataset.dims[0].attach_scale(times)
+        reader = nsdf.NSDFReader(self.filename)
+        nonuniform = reader.get_nonuniform_data('pop', 'Im')
+        for src in self.sources:
+            times = np.concatenate([block[src] for block in self.blocks])
+            values, ntimes = nonuniform.get_data(src)
+            np.testing.assert_allclose(ntimes, times)
+
+class TestNSDFReaderUidIndex(unittest.TestCase):
+    """Check looking up sources by uid across populations"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.vm = np.random.uniform(size=(3, 10))
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def write(self, dialect, persist):
+        writer = nsdf.NSDFWriter(self.filename, dialect=dialect, mode='w')
+        if persist:
+            writer.add_uid_index()
+        source_ds = writer.add_uniform_ds('soma', ['a', 'b', 'c'])
+        for field, data in (('Vm', self.vm), ('Im', -self.vm)):
+            uniform = nsdf.UniformData(field, unit='mV', dt=0.1, tunit='ms')
+            for src, row in zip(['a', 'b', 'c'], data):
+                uniform.put_data(src, row)
+            writer.add_uniform_data(source_ds, uniform)
+        event = nsdf.EventData('spike', unit='ms')
+        event.put_data('b', [1.0, 2.0])
+        event.put_data('d', [3.0])
+        if dialect == nsdf.dialect.ONED:
+            event_ds = writer.add_event_ds_1d('cells', 'spike', ['b', 'd'])
+            writer.add_event_1d(event_ds, event)
+        else:
+            event_ds = writer.add_event_ds('cells', ['b', 'd'])
+            writer.add_event_ragged(event_ds, event)
+        writer.close()
+
+    def check(self):
+        reader = nsdf.NSDFReader(self.filename)
+        data, unit, times, tunit = reader.get_uniform_row('b', 'Im')
+        np.testing.assert_allclose(data, -self.vm[1])
+        self.assertEqual(unit, 'mV')
+        self.assertEqual(len(times), 10)
+        self.assertIsNone(reader.get_uniform_row('d', 'Vm'))
+        found = reader.find_source('b')
+        self.assertEqual(sorted((stype, pop) for stype, pop, _, _ in found),
+                         [(nsdf.EVENT, 'cells'), (nsdf.UNIFORM, 'soma'),
+                          (nsdf.UNIFORM, 'soma')])
+        (stype, pop, dataset, row), = reader.find_source('d', nsdf.EVENT)
+        self.assertEqual(row, 1)
+        self.assertEqual(reader.find_source('x'), [])
+
+    def test_scan(self):
+        for dialect in (nsdf.dialect.ONED, nsdf.dialect.RAGGED):
+            self.write(dialect, False)
+            with h5.File(self.filename, 'r') as fd:
+                self.assertNotIn('uid_index', fd['map'])
+            self.check()
+
+    def test_persisted(self):
+        for dialect in (nsdf.dialect.ONED, nsdf.dialect.RAGGED):
+            self.write(dialect, True)
+            with h5.File(self.filename, 'r') as fd:
+                # Rebuilt on close to include the data added afterwards
+                self.assertEqual(len(fd['map/uid_index']), 8)
+            self.check()
+
+
+class TestNSDFReaderModelTree(unittest.TestCase):
+    """Check that the model tree is rebuilt from groups and tables"""
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.mdict = create_ob_model_tree()
+        for ii, cell in enumerate(self.mdict['mitral_cells']):
+            cell.attrs['index'] = ii
+            cell.attrs['kind'] = 'mitral'
+
+    def tearDown(self):
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+
+    def check_tree(self, compact):
+        writer = nsdf.NSDFWriter(self.filename, mode='w')
+        writer.add_modeltree(self.mdict['model_tree'], compact=compact)
+        writer.close()
+        reader = nsdf.NSDFReader(self.filename)
+        if compact:
+            self.assertNotIn('model', reader.model['modeltree'])
+        tree = reader.get_modeltree()
+        id_path_dict = tree.get_id_path_dict()
+        # the model tree is now attached under the writer's modeltree
+        expected = self.mdict['model_tree'].get_id_path_dict()
+        self.assertEqual(len(id_path_dict), len(expected) + 1)
+        for uid, path in expected.items():
+            self.assertEqual(id_path_dict[uid], path)
+        mitral = tree.children['model'].children['Mitral']
+        for ii in range(len(self.mdict['mitral_cells'])):
+            cell = mitral.children['mitral_{}'.format(ii)]
+            self.assertEqual(cell.attrs['index'], ii)
+            self.assertEqual(cell.attrs['kind'], 'mitral')
+
+    def test_groups(self):
+        self.check_tree(False)
+
+    def test_compact(self):
+        self.check_tree(True)
+
+    def test_compact_append(self):
+        """Components are appended under stored rows after reopening"""
+        writer = nsdf.NSDFWriter(self.filename, mode='w')
+        writer.add_modeltree(self.mdict['model_tree'], compact=True)
+        writer.close()
+        writer = nsdf.NSDFWriter(self.filename, mode='a')
+        cell = nsdf.ModelComponent('mitral_10', uid='mc10',
+                                   attrs={'index': 10, 'kind': 'mitral'})
+        nsdf.ModelComponent('soma', uid='mc10_soma', parent=cell)
+        writer.add_modeltree(cell, target='model/Mitral', compact=True)
+        writer.close()
+        reader = nsdf.NSDFReader(self.filename)
+        tree = reader.get_modeltree()
+        self.assertEqual(tree.get_id_path_dict()['mc10_soma'],
+                         '/modeltree/model/Mitral/mitral_10/soma')
+        cell = tree.get_node('model/Mitral/mitral_10')
+        self.assertEqual(cell.attrs['index'], 10)
+        self.assertEqual(cell.attrs['kind'], 'mitral')
+
+    def test_compact_attr_type(self):
+        """Attribute values are not coerced to the type of the table"""
+        writer = nsdf.NSDFWriter(self.filename, mode='w')
+        writer.add_modeltree(self.mdict['model_tree'], compact=True)
+        for attrs in [{'index': 1.5}, {'kind': 3}]:
+            cell = nsdf.ModelComponent('mitral_10', uid='mc10', attrs=attrs)
+            self.assertRaises(ValueError, writer.add_modeltree, cell,
+                              target='model/Mitral', compact=True)
+        cell = nsdf.ModelComponent('mitral_10', uid='mc10',
+                                   attrs={'label': 'a'})
+        nsdf.ModelComponent('soma', uid='mc10_soma', parent=cell,
+                            attrs={'label': 1})
+        self.assertRaises(ValueError, writer.add_modeltree, cell,
+                          target='model/Mitral', compact=True)
+        writer.close()
+        with h5.File(self.filename, 'r') as fd:
+            self.assertEqual(len(fd['/model/modeltable/uid']),
+                             len(self.mdict['model_tree'].get_id_path_dict())
+                             + 1)
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -149,8 +149,271 @@ class TestNSDFWriterUniform(unittest.TestCase):
             for row, source in zip(data, data.dims[0]['source']):
                 nptest.assert_allclose(row[-self.dlen:], self.data_object.get_data(source))
         os.remove(self.filepath)
-        
-    
+
+
+class TestNSDFWriterUniformBuffered(unittest.TestCase):
+    """Incremental writing of uniformly sampled data through the write
+    buffer"""
+    def setUp(self):
+        self.mdict = create_ob_model_tree()
+        self.filepath = '{}.h5'.format(self.id())
+        self.sources = [cell.children['gc_0'].uid
+                        for cell in self.mdict['granule_cells']]
+        self.buffersize = 8
+        self.steps = [5, 3, 20, 1, 7]
+        self.expected = np.random.uniform(-65, -55,
+                                          size=(len(self.sources),
+                                                sum(self.steps)))
+
+    def tearDown(self):
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def write(self, writer, source_ds=None):
+        if source_ds is None:
+            source_ds = writer.add_uniform_ds('pop0', self.sources)
+        start = 0
+        for step in self.steps:
+            data_object = nsdf.UniformData('Vm', unit='mV', dt=1e-4,
+                                           tunit='s')
+            for ii, uid in enumerate(self.sources):
+                data_object.put_data(uid,
+                                     self.expected[ii, start: start + step])
+            dataset = writer.add_uniform_data(source_ds, data_object)
+            start += step
+        return dataset
+
+    def test_buffered_append(self):
+        """Buffered data is written out in whole blocks and on close"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                 buffersize=self.buffersize)
+        dataset = self.write(writer)
+        # 36 columns added: 4 complete blocks on file, 4 in buffer
+        self.assertEqual(dataset.shape[1], 32)
+        self.assertEqual(dataset.chunks[1], self.buffersize)
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            dataset = fd['/data/uniform/pop0/Vm']
+            nptest.assert_allclose(dataset[()], self.expected)
+            self.assertAlmostEqual(dataset.attrs['dt'], 1e-4)
+
+    def test_flush(self):
+        """flush() writes out partially filled buffers"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                 buffersize=self.buffersize)
+        dataset = self.write(writer)
+        writer.flush()
+        nptest.assert_allclose(dataset[()], self.expected)
+        writer.close()
+
+    def test_chunks(self):
+        """Chunk shape follows the declared access pattern"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                 access=nsdf.access.SOURCEMAJOR)
+        dataset = self.write(writer)
+        self.assertEqual(dataset.attrs['access'], nsdf.access.SOURCEMAJOR)
+        self.assertEqual(dataset.chunks, (len(self.sources), 128))
+        writer.close()
+
+    def test_source_mismatch(self):
+        """Sources are checked against the cached map on every append"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w')
+        self.write(writer)
+        source_ds = writer.mapping[nsdf.UNIFORM]['pop0']
+        data_object = nsdf.UniformData('Vm', unit='mV', dt=1e-4, tunit='s')
+        for uid in self.sources[1:] + ['unknown']:
+            data_object.put_data(uid, [0.0])
+        self.assertRaises(KeyError, writer.add_uniform_data, source_ds,
+                          data_object)
+        writer.close()
+
+    def test_expected_length(self):
+        """Datasets of declared length are preallocated and trimmed on
+        close"""
+        total = sum(self.steps)
+        # (writer args, declared length, dataset length before close)
+        for kwargs, length, allocated in [
+                (dict(), total + 10, total + 10),
+                (dict(buffersize=self.buffersize), total + 10, total + 10),
+                (dict(buffersize=self.buffersize), 10, 32),
+                (dict(expected_length=total), None, total)]:
+            writer = nsdf.NSDFWriter(self.filepath, mode='w', **kwargs)
+            source_ds = writer.add_uniform_ds('pop0', self.sources)
+            if length is not None:
+                writer.set_expected_length(source_ds, length, 'Vm')
+            dataset = self.write(writer, source_ds)
+            self.assertEqual(dataset.shape[1], allocated)
+            writer.close()
+            with h5.File(self.filepath, 'r') as fd:
+                dataset = fd['/data/uniform/pop0/Vm']
+                self.assertEqual(dataset.maxshape[1], None)
+                nptest.assert_allclose(dataset[()], self.expected)
+
+    def test_array(self):
+        """2D arrays are written in the row order of the map"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w')
+        source_ds = writer.add_uniform_ds('pop0', self.sources)
+        data_object = nsdf.UniformData('Vm', unit='mV', dt=1e-4, tunit='s')
+        writer.add_uniform_array(source_ds, data_object,
+                                 self.expected[:, :10])
+        writer.add_uniform_array(source_ds, data_object,
+                                 self.expected[::-1, 10:],
+                                 sources=self.sources[::-1])
+        self.assertRaises(KeyError, writer.add_uniform_array, source_ds,
+                          data_object, self.expected,
+                          sources=self.sources[:-1] + self.sources[:1])
+        self.assertRaises(ValueError, writer.add_uniform_array, source_ds,
+                          data_object, self.expected[0])
+        static = nsdf.StaticData('area', unit='um^2')
+        writer.add_static_array(source_ds, static, self.expected[:, :1])
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            nptest.assert_allclose(fd['/data/uniform/pop0/Vm'][()],
+                                   self.expected)
+            nptest.assert_allclose(fd['/data/static/pop0/area'][()],
+                                   self.expected[:, :1])
+
+    def test_batch(self):
+        """All variables of a population are written by one call"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                 buffersize=self.buffersize)
+        source_ds = writer.add_uniform_ds('pop0', self.sources)
+        fields = ['Vm', 'Ca', 'Ik']
+        start = 0
+        for step in self.steps:
+            data_objects = []
+            for jj, field in enumerate(fields):
+                data_object = nsdf.UniformData(field, unit='mV', dt=1e-4,
+                                               tunit='s')
+                for ii, uid in enumerate(reversed(self.sources)):
+                    data_object.put_data(
+                        uid, jj + self.expected[-ii - 1,
+                                                start: start + step])
+                data_objects.append(data_object)
+            datasets = writer.add_uniform_batch(source_ds, data_objects)
+            start += step
+        self.assertEqual([ds.name.rpartition('/')[-1] for ds in datasets],
+                         fields)
+        data_objects[-1].put_data('unknown', [0.0])
+        self.assertRaises(KeyError, writer.add_uniform_batch, source_ds,
+                          data_objects)
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            for jj, field in enumerate(fields):
+                nptest.assert_allclose(fd['/data/uniform/pop0'][field][()],
+                                       jj + self.expected)
+
+    def test_batch_atomic(self):
+        """A variable with `dt` 0 in a batch leaves the file unchanged"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w')
+        source_ds = writer.add_uniform_ds('pop0', self.sources)
+        data_objects = [nsdf.UniformData('Vm', unit='mV', dt=1e-4,
+                                         tunit='s'),
+                        nsdf.UniformData('Ca', unit='mM', dt=0.0)]
+        for data_object in data_objects:
+            for ii, uid in enumerate(self.sources):
+                data_object.put_data(uid, self.expected[ii])
+        self.assertRaises(ValueError, writer.add_uniform_batch, source_ds,
+                          data_objects)
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            self.assertEqual(len(fd['/data/uniform/pop0']), 0)
+
+    def test_compress_threads(self):
+        """Chunks compressed in parallel are readable by plain h5py"""
+        for kwargs in [dict(buffersize=self.buffersize),
+                       dict(buffersize=self.buffersize, shuffle=True),
+                       dict(chunks=(3, 4)),
+                       dict(chunks=(3, 4), fixed=True)]:
+            fixed = kwargs.pop('fixed', False)
+            writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                     compression='gzip',
+                                     compress_threads=3, **kwargs)
+            if fixed:
+                source_ds = writer.add_uniform_ds('pop0', self.sources)
+                data_object = nsdf.UniformData('Vm', unit='mV', dt=1e-4,
+                                               tunit='s')
+                for ii, uid in enumerate(self.sources):
+                    data_object.put_data(uid, self.expected[ii])
+                writer.add_uniform_data(source_ds, data_object, fixed=True)
+            else:
+                self.write(writer)
+            writer.close()
+            with h5.File(self.filepath, 'r') as fd:
+                dataset = fd['/data/uniform/pop0/Vm']
+                self.assertEqual(dataset.compression, 'gzip')
+                nptest.assert_allclose(dataset[()], self.expected)
+
+
+class TestNSDFWriterAsync(unittest.TestCase):
+    """Writing data in the background I/O thread"""
+    def setUp(self):
+        self.mdict = create_ob_model_tree()
+        self.filepath = '{}.h5'.format(self.id())
+        self.sources = [cell.children['gc_0'].uid
+                        for cell in self.mdict['granule_cells']]
+        self.steps = [5, 3, 20, 1, 7]
+        self.expected = np.random.uniform(-65, -55,
+                                          size=(len(self.sources),
+                                                sum(self.steps)))
+
+    def tearDown(self):
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def write(self, writer):
+        source_ds = writer.add_uniform_ds('pop0', self.sources)
+        # the same object and arrays are reused for every step
+        data_object = nsdf.UniformData('Vm', unit='mV', dt=1e-4, tunit='s')
+        futures = []
+        start = 0
+        for step in self.steps:
+            for ii, uid in enumerate(self.sources):
+                data_object.put_data(
+                    uid, self.expected[ii, start: start + step].copy())
+            futures.append(writer.add_uniform_data(source_ds, data_object))
+            # overwriting the arrays must not affect queued data
+            for data in data_object.get_all_data():
+                data[:] = 0
+            start += step
+        return futures
+
+    def check_data(self):
+        with h5.File(self.filepath, 'r') as fd:
+            nptest.assert_allclose(fd['/data/uniform/pop0/Vm'][()],
+                                   self.expected)
+
+    def test_async(self):
+        writer = nsdf.NSDFWriter(self.filepath, mode='w', async_io=True)
+        futures = self.write(writer)
+        writer.flush()
+        for future in futures:
+            self.assertTrue(future.done())
+            self.assertEqual(future.result().name, '/data/uniform/pop0/Vm')
+        writer.close()
+        self.check_data()
+
+    def test_backpressure(self):
+        """A queue budget smaller than one block still writes everything"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w', async_io=True,
+                                 io_queue_bytes=64, buffersize=4)
+        self.write(writer)
+        writer.close()
+        self.check_data()
+
+    def test_error(self):
+        """Errors from the I/O thread are raised by flush()"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='w', async_io=True)
+        source_ds = writer.add_uniform_ds('pop0', self.sources)
+        data_object = nsdf.UniformData('Vm', dt=1e-4, tunit='s')
+        for uid in self.sources:
+            data_object.put_data(uid, [0.0])
+        future = writer.add_uniform_data(source_ds, data_object)
+        self.assertRaises(ValueError, future.result)
+        self.assertRaises(ValueError, writer.flush)
+        writer.close()
+
+
 class TestNSDFWriterNonuniform1D(unittest.TestCase):
     """Test case for writing nonuniformly sampled data in 1D arrays"""
     def setUp(self):
@@ -662,6 +925,17 @@ class TestNSDFWriterEvent1D(unittest.TestCase):
                 self.assertEqual(dataset.attrs['field'], self.field)
         os.remove(self.filepath)
 
+    def test_map_refs(self):
+        """Each row of the map refers to the dataset of its source"""
+        with h5.File(self.filepath, 'r') as fd:
+            source_ds = fd['/map'][nsdf.EVENT][self.popname][self.varname]
+            for row in source_ds[()]:
+                uid = row['source'].decode()
+                self.assertEqual(fd[row['data']].attrs['source'], uid)
+                self.assertEqual(fd[row['data']].name.rpartition('/')[-1],
+                                 self.src_name_dict[uid])
+        os.remove(self.filepath)
+
     def test_append_data(self):
         """Try appending data to existing 1D event dataset"""
         # start over for appending data
@@ -761,6 +1035,90 @@ class TestNSDFWriterEventVlen(unittest.TestCase):
         os.remove(self.filepath)
 
 
+class TestNSDFWriterEventVlenAppend(unittest.TestCase):
+    """Test incremental writing of event data in VLEN datasets"""
+    def setUp(self):
+        self.mdict = create_ob_model_tree()
+        self.filepath = '{}.h5'.format(self.id())
+        self.sources = [cell.uid for cell in self.mdict['mitral_cells']]
+        self.blocks = []
+        for ii in range(4):
+            block = nsdf.EventData('spike', unit='s', dtype=np.float32)
+            for uid in self.sources:
+                block.put_data(uid, np.random.uniform(
+                    ii, ii + 1, size=np.random.randint(0, 10)))
+            self.blocks.append(block)
+
+    def tearDown(self):
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+    def write(self, **kwargs):
+        writer = nsdf.NSDFWriter(self.filepath, mode='w',
+                                 dialect=nsdf.dialect.VLEN, **kwargs)
+        ds = writer.add_event_ds('pop1', self.sources)
+        for block in self.blocks:
+            dataset = writer.add_event_vlen(ds, block)
+        return writer, dataset
+
+    def check_data(self):
+        reader = nsdf.NSDFReader(self.filepath)
+        data = reader.get_event_data('pop1', 'spike')
+        # sources may be read back as bytes
+        data = dict((getattr(src, 'decode', lambda: src)(), data.get_data(src))
+                    for src in data.get_sources())
+        for uid in self.sources:
+            expected = np.concatenate([block.get_data(uid)
+                                       for block in self.blocks])
+            nptest.assert_allclose(data[uid], expected)
+
+    def test_rewrite(self):
+        writer, dataset = self.write()
+        self.assertEqual(dataset.shape, (len(self.sources),))
+        writer.close()
+        self.check_data()
+
+    def test_segments(self):
+        """Each append is a new column of the dataset"""
+        writer, dataset = self.write(vlen_segments=True)
+        self.assertEqual(dataset.shape, (len(self.sources),
+                                         len(self.blocks)))
+        writer.close()
+        self.check_data()
+
+    def test_buffered(self):
+        """Buffered appends are written as one segment on close"""
+        writer, dataset = self.write(vlen_segments=True, buffersize=1000)
+        self.assertEqual(dataset.shape, (len(self.sources), 0))
+        writer.close()
+        self.check_data()
+        with h5.File(self.filepath, 'r') as fd:
+            self.assertEqual(fd['/data/event/pop1/spike'].shape,
+                             (len(self.sources), 1))
+
+    def test_buffered_empty(self):
+        """Buffered blocks without any event are written on close"""
+        for block in self.blocks:
+            for uid in self.sources:
+                block.put_data(uid, np.empty(0, dtype=np.float32))
+        writer, dataset = self.write(vlen_segments=True, buffersize=1000)
+        writer.close()
+        self.check_data()
+        with h5.File(self.filepath, 'r') as fd:
+            self.assertEqual(fd['/data/event/pop1/spike'].shape,
+                             (len(self.sources), 1))
+
+    def test_equal_lengths(self):
+        """Rows of equal length are not taken for a 2D array"""
+        for block in self.blocks:
+            for uid in self.sources:
+                block.put_data(uid, np.ones(3, dtype=np.float32))
+        for kwargs in [{}, dict(vlen_segments=True)]:
+            writer, dataset = self.write(**kwargs)
+            writer.close()
+            self.check_data()
+
+
 class TestNSDFWriterEventNanPadded(unittest.TestCase):
     """Test the case of writing event data with NaN padding"""
     def setUp(self):
@@ -862,6 +1220,196 @@ class TestNSDFWriterEventNanPadded(unittest.TestCase):
                                                new_dlen[ii]:], np.nan)
         os.remove(self.filepath)
 
+    def test_length_index(self):
+        """The fill length of each row is kept in /map/length and is
+        rebuilt for files written without it"""
+        with h5.File(self.filepath, 'r') as fd:
+            dataset = fd['/data'][nsdf.EVENT][self.popname][self.varname]
+            length_ds = fd[dataset.attrs['length']]
+            self.assertEqual(length_ds.name, '/map/length/{}/{}_{}'.format(
+                nsdf.EVENT, self.popname, self.varname))
+            nptest.assert_equal(length_ds[()], self.dlen)
+        # drop the index to emulate a file from an older writer
+        with h5.File(self.filepath, 'a') as fd:
+            dataset = fd['/data'][nsdf.EVENT][self.popname][self.varname]
+            del dataset.attrs['length']
+            del fd['/map/length']
+        writer = nsdf.NSDFWriter(self.filepath, mode='a',
+                                 dialect=nsdf.dialect.NANPADDED)
+        source_ds = writer.mapping[nsdf.EVENT][self.popname]
+        writer.add_event_nan(source_ds, self.data_object)
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            dataset = fd['/data'][nsdf.EVENT][self.popname][self.varname]
+            nptest.assert_equal(fd[dataset.attrs['length']][()],
+                                2 * self.dlen)
+        os.remove(self.filepath)
+
+
+class TestMergeShards(unittest.TestCase):
+    """Merging shard files written separately for subsets of sources"""
+    def setUp(self):
+        self.mdict = create_ob_model_tree()
+        self.filepath = '{}.h5'.format(self.id())
+        self.sources = [cell.uid for cell in self.mdict['mitral_cells']]
+        half = len(self.sources) // 2
+        self.parts = [self.sources[:half], self.sources[half:]]
+        self.shards = ['{}_{}.h5'.format(self.id(), ii)
+                       for ii in range(len(self.parts))]
+        self.vm = dict((uid, np.random.uniform(-65, -55, size=10))
+                       for uid in self.sources)
+        self.spikes = dict((uid, np.sort(np.random.uniform(
+            0, 1, size=np.random.randint(1, 10)))) for uid in self.sources)
+        self.times = np.sort(np.random.uniform(0, 1, size=10))
+
+    def tearDown(self):
+        for path in self.shards + [self.filepath]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def write_shards(self, dialect, precision=None):
+        for path, part in zip(self.shards, self.parts):
+            writer = nsdf.NSDFWriter(path, mode='w', dialect=dialect)
+            writer.add_modeltree(self.mdict['model_tree'])
+            source_ds = writer.add_uniform_ds('mitral', part)
+            if precision is not None:
+                writer.set_precision(source_ds, precision)
+            data_object = nsdf.UniformData('Vm', unit='mV', dt=0.1,
+                                           tunit='ms')
+            spikes = nsdf.EventData('spike', unit='s')
+            for uid in part:
+                data_object.put_data(uid, self.vm[uid])
+                spikes.put_data(uid, self.spikes[uid])
+            writer.add_uniform_data(source_ds, data_object)
+            if dialect == nsdf.dialect.NUREGULAR:
+                source_ds = writer.add_nonuniform_ds('mitral', part)
+                current = nsdf.NonuniformRegularData('Im', unit='pA',
+                                                     tunit='s')
+                current.set_times(self.times)
+                for uid in part:
+                    current.put_data(uid, -self.vm[uid])
+                writer.add_nonuniform_regular(source_ds, current)
+            elif dialect == nsdf.dialect.ONED:
+                source_ds = writer.add_event_ds_1d('mitral', 'spike', part)
+                writer.add_event_1d(source_ds, spikes)
+            else:
+                source_ds = writer.add_event_ds('mitral', part)
+                if dialect == nsdf.dialect.NANPADDED:
+                    writer.add_event_nan(source_ds, spikes)
+                else:
+                    writer.add_event_ragged(source_ds, spikes)
+            writer.close()
+
+    def check_spikes(self):
+        reader = nsdf.NSDFReader(self.filepath)
+        spikes = reader.get_event_data('mitral', 'spike')
+        self.assertEqual(sorted(spikes.get_sources()), sorted(self.sources))
+        for uid in self.sources:
+            nptest.assert_allclose(spikes.get_data(uid), self.spikes[uid])
+
+    def test_merge(self):
+        self.write_shards(nsdf.dialect.NANPADDED)
+        nsdf.merge_shards(self.filepath, self.shards)
+        with h5.File(self.filepath, 'r') as fd:
+            for path, expected in [('/data/uniform/mitral/Vm', self.vm),
+                                   ('/data/event/mitral/spike',
+                                    self.spikes)]:
+                dataset = fd[path]
+                self.assertTrue(dataset.is_virtual)
+                sources = dataset.dims[0]['source']
+                self.assertEqual(sources.shape, (len(self.sources),))
+                lengths = fd[dataset.attrs['length']] \
+                          if 'length' in dataset.attrs else None
+                for iii, uid in enumerate(sources.asstr()):
+                    data = expected[uid]
+                    nptest.assert_allclose(dataset[iii, :len(data)], data)
+                    if lengths is not None:
+                        self.assertEqual(lengths[iii], len(data))
+            self.assertEqual(fd['/model/modeltree'].attrs['uid'],
+                             'modeltree')
+
+    def test_empty_shard(self):
+        """A shard in which no source fired must not shift the sources
+        of the following shards"""
+        for uid in self.parts[0]:
+            self.spikes[uid] = np.empty(0)
+        self.write_shards(nsdf.dialect.NANPADDED)
+        nsdf.merge_shards(self.filepath, self.shards)
+        self.check_spikes()
+
+    def test_precision(self):
+        """Scaled integers with a common offset are merged"""
+        self.write_shards(nsdf.dialect.NANPADDED,
+                          nsdf.ScaleOffset(0.01, offset=-60.0))
+        nsdf.merge_shards(self.filepath, self.shards)
+        reader = nsdf.NSDFReader(self.filepath)
+        vm = reader.get_uniform_data('mitral', 'Vm')
+        for uid in self.sources:
+            nptest.assert_allclose(vm.get_data(uid), self.vm[uid],
+                                   atol=0.005)
+
+    def test_precision_differ(self):
+        """Scaled integers with an offset fitted to each shard cannot
+        be merged"""
+        for uid in self.parts[1]:
+            self.vm[uid] += 80.0
+        self.write_shards(nsdf.dialect.NANPADDED, nsdf.ScaleOffset(0.01))
+        self.assertRaises(ValueError, nsdf.merge_shards, self.filepath,
+                          self.shards)
+
+    def test_uid_index(self):
+        """The uid index is rebuilt with the rows in the merged file"""
+        self.write_shards(nsdf.dialect.NANPADDED)
+        for path in self.shards:
+            writer = nsdf.NSDFWriter(path, mode='a',
+                                     dialect=nsdf.dialect.NANPADDED)
+            writer.add_uid_index()
+            writer.close()
+        nsdf.merge_shards(self.filepath, self.shards)
+        reader = nsdf.NSDFReader(self.filepath)
+        uid = self.parts[1][-1]
+        data, _, _, _ = reader.get_uniform_row(uid, 'Vm')
+        nptest.assert_allclose(data, self.vm[uid])
+
+    def test_nuregular(self):
+        """The sampling times shared by all sources are taken once"""
+        self.write_shards(nsdf.dialect.NUREGULAR)
+        nsdf.merge_shards(self.filepath, self.shards)
+        reader = nsdf.NSDFReader(self.filepath)
+        current = reader.get_nonuniform_data('mitral', 'Im')
+        nptest.assert_allclose(current.get_times(), self.times)
+        for uid in self.sources:
+            nptest.assert_allclose(current.get_data(uid), -self.vm[uid])
+
+    def test_shared_differ(self):
+        self.write_shards(nsdf.dialect.NUREGULAR)
+        with h5.File(self.shards[1], 'a') as fd:
+            fd['/map/time/mitral_Im'][0] = 2.0
+        self.assertRaises(ValueError, nsdf.merge_shards, self.filepath,
+                          self.shards)
+
+    def test_oned(self):
+        self.write_shards(nsdf.dialect.ONED)
+        nsdf.merge_shards(self.filepath, self.shards)
+        self.check_spikes()
+
+    def test_oned_collision(self):
+        """ONED datasets named by row in each shard collide"""
+        self.parts = [['x.a', 'x.b'], ['y.c']]
+        self.sources = self.parts[0] + self.parts[1]
+        for uid in self.sources:
+            self.vm[uid] = np.zeros(10)
+            self.spikes[uid] = np.ones(1)
+        self.write_shards(nsdf.dialect.ONED)
+        self.assertRaises(ValueError, nsdf.merge_shards, self.filepath,
+                          self.shards)
+
+    def test_split_ragged(self):
+        """RAGGED populations cannot be split across shards"""
+        self.write_shards(nsdf.dialect.RAGGED)
+        self.assertRaises(ValueError, nsdf.merge_shards, self.filepath,
+                          self.shards)
+
 
 class TestNSDFWriterModelTree(unittest.TestCase):
     """Test the structure of model tree saved in `/model/modeltree` of the
@@ -913,6 +1461,26 @@ class TestNSDFWriterModelTree(unittest.TestCase):
             self.mdict['model_tree'].visit(nodes_match, hdfroot)
         os.remove(self.filepath)
 
+    def test_add_modeltree_staged(self):
+        """A subtree added under an existing component is written below
+        its group"""
+        writer = nsdf.NSDFWriter(self.filepath, mode='a')
+        root = nsdf.ModelComponent('model', uid='staged_root')
+        writer.add_modeltree(root)
+        cell = nsdf.ModelComponent('cell', uid='staged_cell')
+        for ii in range(5):
+            nsdf.ModelComponent('comp_{}'.format(ii),
+                                uid='staged_comp_{}'.format(ii),
+                                parent=cell, attrs={'index': ii})
+        writer.add_modeltree(cell, target='model')
+        writer.close()
+        with h5.File(self.filepath, 'r') as fd:
+            grp = fd['/model/modeltree/model/cell']
+            self.assertEqual(grp.attrs['uid'], 'staged_cell')
+            self.assertEqual(len(grp), 5)
+            self.assertEqual(grp['comp_3'].attrs['index'], 3)
+        os.remove(self.filepath)
+
     def test_model_map_linking(self):
         """Check if each group in the model is linked to the source maps of
         which its children are members.
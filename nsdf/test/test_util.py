@@ -45,8 +45,13 @@
 
 # Code:
 
+import os
 import unittest
 
+import h5py as h5
+import numpy as np
+
+import nsdf
 from nsdf import model
 import util
 
@@ -106,7 +111,99 @@ class TestCommonPrefix(unittest.TestCase):
             '/modeltree/model/Mitral/mitral_4']
     def test_common_prefix(self):
         self.assertEqual(util.common_prefix(self.paths), '/modeltree/model/Mitral')
-        
+
+
+class TestPlanChunks(unittest.TestCase):
+    def test_fixed_contiguous(self):
+        self.assertIsNone(nsdf.plan_chunks((10, 100), (10, 100), 'f8'))
+        self.assertEqual(nsdf.plan_chunks((10, 100), (10, 100), 'f8',
+                                          filtered=True),
+                         (10, 128))
+
+    def test_timemajor(self):
+        chunks = nsdf.plan_chunks((100, 10), (100, None), 'f8',
+                                  pattern=nsdf.access.TIMEMAJOR,
+                                  expected=100000)
+        self.assertEqual(chunks[0], 100)
+        self.assertLessEqual(chunks[0] * chunks[1] * 8, nsdf.CHUNK_BYTES)
+
+    def test_sourcemajor(self):
+        chunks = nsdf.plan_chunks((100000, 10), (100000, None), 'f4',
+                                  pattern=nsdf.access.SOURCEMAJOR,
+                                  expected=100000)
+        self.assertEqual(chunks, (2, 131072))
+
+    def test_blocklen(self):
+        self.assertEqual(nsdf.plan_chunks((10, 0), (10, None), 'f8',
+                                          blocklen=64),
+                         (10, 64))
+
+    def test_1d_growth(self):
+        self.assertEqual(nsdf.plan_chunks((200,), (None,), 'f4'), (4096,))
+
+    def test_empty(self):
+        """Datasets created empty do not get single element chunks"""
+        self.assertEqual(nsdf.plan_chunks((0,), (None,), 'f8'),
+                         (nsdf.MIN_CHUNK_BYTES // 8,))
+        chunks = nsdf.plan_chunks((10, 0), (10, None), 'f8')
+        self.assertEqual(chunks[0], 10)
+        self.assertGreaterEqual(chunks[1], 16)
+
+
+class TestRowBlocks(unittest.TestCase):
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.fd = h5.File(self.filename, 'w')
+
+    def tearDown(self):
+        self.fd.close()
+        os.remove(self.filename)
+
+    def test_chunk_aligned(self):
+        dataset = self.fd.create_dataset('data', shape=(100, 50),
+                                         dtype='f8', chunks=(7, 50))
+        blocks = nsdf.row_blocks(dataset, nbytes=30 * 50 * 8)
+        self.assertEqual(blocks[0], (0, 28))
+        self.assertEqual(blocks[-1][1], 100)
+        for (_, stop), (start, _) in zip(blocks[:-1], blocks[1:]):
+            self.assertEqual(stop, start)
+            self.assertEqual(start % 7, 0)
+
+    def test_small_budget(self):
+        dataset = self.fd.create_dataset('data', data=np.ones((10, 50)))
+        self.assertEqual(nsdf.row_blocks(dataset, nbytes=8),
+                         [(ii, ii + 1) for ii in range(10)])
+        self.assertEqual(nsdf.row_blocks(dataset, ncols=1, nbytes=40),
+                         [(0, 5), (5, 10)])
+
+
+class TestBisectDataset(unittest.TestCase):
+    def setUp(self):
+        self.filename = '{}.h5'.format(self.id())
+        self.fd = h5.File(self.filename, 'w')
+        self.values = np.sort(np.random.uniform(size=1000))
+
+    def tearDown(self):
+        self.fd.close()
+        os.remove(self.filename)
+
+    def test_chunked(self):
+        dataset = self.fd.create_dataset('data', data=self.values,
+                                         chunks=(64,))
+        for value in [-1.0, 2.0, self.values[64], self.values[500] + 1e-9]:
+            self.assertEqual(nsdf.bisect_dataset(dataset, value),
+                             np.searchsorted(self.values, value))
+        self.assertEqual(nsdf.bisect_dataset(dataset, 2.0, 100, 300), 300)
+        self.assertEqual(nsdf.bisect_dataset(dataset, -1.0, 100, 300), 100)
+
+    def test_nan_padded_row(self):
+        data = np.full((2, 1000), np.nan)
+        data[1, :600] = self.values[:600]
+        dataset = self.fd.create_dataset('data', data=data, chunks=(1, 50))
+        self.assertEqual(nsdf.bisect_dataset(dataset, 2.0, row=1), 600)
+        self.assertEqual(nsdf.bisect_dataset(dataset, self.values[300],
+                                             row=1), 300)
+
 if __name__ == '__main__':
     unittest.main()
 
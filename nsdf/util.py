@@ -61,6 +61,9 @@ from itertools import chain
 import h5py as h5
 import os
 
+from .constants import access, CHUNK_BYTES, MIN_CHUNK_BYTES, READ_BYTES, \
+    SAMPLING_TYPES
+
 def node_finder(container_list, match_fn):
     """Return a function that can be passed to h5py.Group.visititem to
     collect all nodes satisfying `match_fn` collect in `container_list`"""
@@ -210,7 +213,504 @@ def split_os_path(path):
             break
     components.reverse()
     return components
-    
-        
+
+
+def decode_uids(mapping):
+    """Return the uids stored in the map dataset `mapping` as a list of
+    str. For the 1D dialect, `mapping` is a (source, data) table and
+    the `source` column is read."""
+    if mapping.dtype.fields is None:
+        ids = mapping[()]
+        strinfo = h5.check_string_dtype(mapping.dtype)
+    else:
+        ids = mapping['source']
+        strinfo = h5.check_string_dtype(mapping.dtype['source'])
+    if strinfo is None:
+        return list(ids)
+    return [uid.decode(strinfo.encoding) for uid in ids]
+
+
+def uid_records(fd):
+    """Iterate over the data sources of every dataset under `/data` in
+    the NSDF file `fd`.
+
+    Yields:
+        (uid, stype, population, row, field, ref) for each source and
+        dataset recorded from it. `stype` is the sampling type,
+        `population` and `field` are those of the dataset, `row` is
+        the position of the source in the population's map and `ref`
+        is a reference to the dataset, or to the source's own dataset
+        in the 1D dialect.
+
+    """
+    uids = {}
+    for stype in SAMPLING_TYPES:
+        if stype not in fd['data']:
+            continue
+        for population, popgroup in fd['data'][stype].items():
+            for variable, data in popgroup.items():
+                field = data.attrs.get('field', variable)
+                if isinstance(data, h5.Group) or 'source' in data.attrs:
+                    mapping = fd[data.attrs['source']]
+                else:
+                    mapping = data.dims[0]['source']
+                try:
+                    sources = uids[mapping.name]
+                except KeyError:
+                    sources = decode_uids(mapping)
+                    uids[mapping.name] = sources
+                if isinstance(data, h5.Group):
+                    refs = mapping['data']
+                else:
+                    refs = [data.ref] * len(sources)
+                for row, (uid, ref) in enumerate(zip(sources, refs)):
+                    yield uid, stype, population, row, field, ref
+
+
+def coalesce(indices):
+    """Group sorted, unique `indices` into runs of consecutive values.
+
+    Returns:
+        list of (start, stop) tuples, one for each run, such that the
+        run covers range(start, stop).
+
+    Examples:
+        >>> coalesce([1, 2, 3, 7, 9, 10])
+        [(1, 4), (7, 8), (9, 11)]
+
+    """
+    indices = np.asarray(indices, dtype=np.int64)
+    if len(indices) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(indices) != 1) + 1
+    starts = indices[np.concatenate(([0], breaks))]
+    stops = indices[np.concatenate((breaks - 1, [len(indices) - 1]))] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def read_rows(dataset, rows, selection=()):
+    """Read the entries at positions `rows` along the first axis of
+    `dataset`, with one hyperslab read for each run of consecutive
+    positions.
+
+    Args:
+        dataset (h5py.Dataset): dataset to read from.
+
+        rows (sequence of int): positions along the first axis, in the
+            order they should appear in the result. Repeats are
+            allowed.
+
+        selection (tuple): selection along the remaining axes, e.g.
+            `(slice(10, 20),)` for columns 10 to 19 of a 2D dataset.
+
+    Returns:
+        numpy.ndarray with one entry along the first axis for each of
+        `rows`.
+
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    unique, inverse = np.unique(rows, return_inverse=True)
+    runs = coalesce(unique)
+    if len(runs) == 0:
+        return dataset[(slice(0, 0),) + tuple(selection)]
+    if len(runs) == 1:
+        block = dataset[(slice(*runs[0]),) + tuple(selection)]
+    else:
+        block = np.concatenate([dataset[(slice(start, stop),) +
+                                        tuple(selection)]
+                                for start, stop in runs])
+    if len(unique) == len(rows) and (np.diff(rows) > 0).all():
+        return block
+    return block[inverse]
+
+
+def row_blocks(dataset, ncols=None, nbytes=READ_BYTES):
+    """Split the rows of `dataset` into blocks of about `nbytes` bytes
+    to be read at once, with the block boundaries aligned to the
+    chunks of `dataset` so that no chunk is read twice.
+
+    Args:
+        dataset (h5py.Dataset): dataset to be read.
+
+        ncols (int): number of entries of each row to be read. Default
+            all of them.
+
+        nbytes (int): target size of each block in bytes.
+
+    Returns:
+        list of (start, stop) tuples, one for each block, such that
+        the block covers the rows range(start, stop).
+
+    """
+    nrows = dataset.shape[0] if dataset.ndim else 0
+    if ncols is None:
+        ncols = int(np.prod(dataset.shape[1:]))
+    step = max(1, nbytes // max(1, ncols * dataset.dtype.itemsize))
+    if dataset.chunks is not None:
+        rows = dataset.chunks[0]
+        step = max(rows, step - step % rows)
+    return [(start, min(start + step, nrows))
+            for start in range(0, nrows, step)]
+
+
+def bisect_dataset(dataset, value, lo=0, hi=None, row=None):
+    """Return the first position in the range [lo, hi) of the sorted 1D
+    `dataset`, or of row `row` of a 2D dataset, where the value is not
+    less than `value`. NaN values are treated as larger than any value,
+    so that NaN padded rows can be searched.
+
+    The search first bisects over the first elements of the chunks of
+    the dataset (blocks of 4096 elements if it is contiguous) and then
+    searches the single remaining chunk in memory, so that each probe
+    reads at most one chunk.
+
+    Returns:
+        int: the position, `hi` if all values are less than `value`.
+
+    """
+    if hi is None:
+        hi = dataset.shape[-1]
+
+    def select(start, stop):
+        return slice(start, stop) if row is None else \
+            (row, slice(start, stop))
+
+    step = 4096 if dataset.chunks is None else dataset.chunks[-1]
+    # Bisect over the chunks that start inside (lo, hi)
+    first = lo // step + 1
+    last = (hi - 1) // step
+    while first <= last:
+        mid = (first + last) // 2
+        pos = mid * step
+        if dataset[select(pos, pos + 1)][0] < value:
+            lo = pos + 1
+            first = mid + 1
+        else:
+            hi = pos
+            last = mid - 1
+    if lo >= hi:
+        return lo
+    return lo + int(np.searchsorted(dataset[select(lo, hi)], value))
+
+
+def _pow2ceil(value):
+    """Smallest power of 2 that is >= `value` (at least 1)."""
+    return 1 << max(0, int(np.ceil(np.log2(max(value, 1)))))
+
+
+def plan_chunks(shape, maxshape, dtype, pattern=access.TIMEMAJOR,
+                expected=None, blocklen=None, filtered=False,
+                nbytes=CHUNK_BYTES):
+    """Choose the chunk shape for a 1D dataset or a 2D (source, time)
+    dataset.
+
+    The last axis is taken to be the time axis, along which datasets
+    grow. Its chunk length is chosen from the final length of the
+    dataset if that is known (`expected` or a fixed `maxshape`),
+    otherwise the dataset is assumed to grow to 16 times its initial
+    length, or to MIN_CHUNK_BYTES bytes per row if it is created
+    empty. Chunks are limited to about `nbytes` bytes.
+
+    Args:
+        shape (tuple): initial shape of the dataset.
+
+        maxshape (tuple): maximum shape of the dataset, None for
+            unlimited axes.
+
+        dtype (numpy.dtype): data type of the dataset. Variable length
+            types are accounted by the size of their descriptors.
+
+        pattern (nsdf.access member): expected access pattern of 2D
+            datasets. TIMEMAJOR chunks span as many sources as
+            possible, SOURCEMAJOR chunks span as many sampling times
+            as possible. Default: TIMEMAJOR.
+
+        expected (int): expected final length along the time axis. If
+            None, it is guessed from `shape` and `maxshape`.
+
+        blocklen (int): if specified, chunk length along the time
+            axis. Useful when data is always written in blocks of
+            this length.
+
+        filtered (bool): whether the dataset uses filters
+            (e.g. compression), which require chunked storage.
+
+        nbytes (int): target size of a chunk in bytes.
+
+    Returns:
+        tuple: the chunk shape, or None if the dataset is better
+            stored contiguously (it cannot grow and is not filtered).
+
+    """
+    shape = tuple(shape)
+    maxshape = tuple(maxshape) if maxshape is not None else shape
+    if maxshape == shape and not filtered:
+        return None
+    dtype = np.dtype(dtype)
+    itemsize = 16 if dtype.kind == 'O' else max(dtype.itemsize, 1)
+    budget = max(1, nbytes // itemsize)
+    if maxshape[-1] is not None:
+        length = maxshape[-1]
+    elif expected is not None:
+        length = expected
+    else:
+        length = 16 * shape[-1] or MIN_CHUNK_BYTES // itemsize
+    length = max(1, length)
+    if len(shape) == 1:
+        if blocklen is not None:
+            return (blocklen,)
+        return (int(min(_pow2ceil(length), budget)),)
+    rows = max(1, shape[0] if maxshape[0] is None else maxshape[0])
+    if blocklen is not None:
+        cols = blocklen
+        rowchunk = min(rows, max(1, budget // cols))
+    elif pattern == access.SOURCEMAJOR:
+        cols = int(min(_pow2ceil(length), budget))
+        rowchunk = min(rows, max(1, budget // cols))
+    else:
+        # Keep a few columns in each chunk even for huge populations
+        mincols = min(_pow2ceil(length), 16)
+        rowchunk = min(rows, max(1, budget // mincols))
+        cols = int(min(_pow2ceil(length), max(1, budget // rowchunk)))
+    return (int(rowchunk), int(cols))
+
+
+class TickEncoding(object):
+    """Encoding of time values as integer multiples (ticks) of a time
+    step.
+
+    Event times and sampling times of simulated data are usually
+    multiples of the simulation time step. Storing them as integer
+    ticks, optionally as the differences between successive ticks
+    (delta encoding), makes them much more compressible with
+    shuffle+gzip.
+
+    The encoding is recorded in the attributes `encoding` ('tick' or
+    'tick-delta'), `dt` and `tstart` of the dataset storing the
+    ticks.
+
+    Attributes:
+        dt (float): the time step.
+
+        tstart (float): time corresponding to tick 0.
+
+        delta (bool): whether the difference from the previous tick is
+            stored instead of the tick itself. The first value of a
+            segment is stored as the absolute tick.
+
+        dtype (numpy.dtype): integer type of the stored values.
+
+        tolerance (float): largest acceptable rounding error as a
+            fraction of `dt`.
+
+    Examples:
+        >>> enc = TickEncoding(0.1, delta=True)
+        >>> enc.encode([0.2, 0.5, 0.6])
+        array([2, 3, 1])
+        >>> enc.decode([2, 3, 1])
+        array([0.2, 0.5, 0.6])
+
+    """
+    def __init__(self, dt, tstart=0.0, delta=False, dtype=np.int64,
+                 tolerance=1e-3):
+        if dt <= 0:
+            raise ValueError('`dt` must be > 0.')
+        self.dt = dt
+        self.tstart = tstart
+        self.delta = delta
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind not in 'iu':
+            raise ValueError('`dtype` must be an integer type.')
+        self.tolerance = tolerance
+
+    @classmethod
+    def from_attrs(cls, attrs, dtype=np.int64):
+        """Return the encoding described by the attributes `attrs` of a
+        dataset, None if its values are not encoded. `dtype` is the
+        type of the dataset, against which encoded values are
+        range-checked."""
+        try:
+            encoding = attrs['encoding']
+        except KeyError:
+            return None
+        if isinstance(encoding, bytes):
+            encoding = encoding.decode('utf-8')
+        if encoding not in ('tick', 'tick-delta'):
+            raise ValueError('unknown encoding {}'.format(encoding))
+        return cls(attrs['dt'], attrs['tstart'],
+                   delta=(encoding == 'tick-delta'), dtype=dtype)
+
+    def set_attrs(self, dataset):
+        """Record the encoding in the attributes of `dataset`."""
+        dataset.attrs['encoding'] = 'tick-delta' if self.delta else 'tick'
+        dataset.attrs['dt'] = self.dt
+        dataset.attrs['tstart'] = self.tstart
+
+    def ticks(self, times):
+        """Return the absolute ticks of `times` as int64 array.
+
+        Raises:
+            ValueError if any of `times` is not a multiple of `dt`
+            after `tstart` within `tolerance`.
+
+        """
+        times = np.asarray(times, dtype=np.float64)
+        ticks = np.rint((times - self.tstart) / self.dt)
+        if np.any(np.abs(ticks * self.dt + self.tstart - times) >
+                  self.tolerance * self.dt):
+            raise ValueError('times must be multiples of `dt` = {} after'
+                             ' `tstart` = {}'.format(self.dt, self.tstart))
+        return ticks.astype(np.int64)
+
+    def encode(self, times, previous=None):
+        """Encode `times` as ticks of type `dtype`.
+
+        Args:
+            times (sequence of float): time values.
+
+            previous (int): for delta encoding, the absolute tick
+                preceding `times` when they are appended to existing
+                data. If None, the first value is stored as the
+                absolute tick.
+
+        Returns:
+            numpy.ndarray of `dtype`.
+
+        Raises:
+            ValueError if `times` are not multiples of `dt` or the
+            values do not fit in `dtype`.
+
+        """
+        ticks = self.ticks(times)
+        if self.delta:
+            ticks = np.diff(ticks, prepend=0 if previous is None
+                            else previous)
+        info = np.iinfo(self.dtype)
+        if len(ticks) and (ticks.min() < info.min or
+                           ticks.max() > info.max):
+            raise ValueError('ticks do not fit in {}'.format(self.dtype))
+        return ticks.astype(self.dtype)
+
+    def decode(self, values, starts=None):
+        """Convert stored ticks `values` back to float64 times.
+
+        Args:
+            values (sequence of int): stored ticks.
+
+            starts (sequence of int): for delta encoding, the positions
+                in `values` where independently encoded segments start.
+                If None, `values` is a single segment.
+
+        Returns:
+            numpy.ndarray of float64.
+
+        """
+        ticks = np.asarray(values, dtype=np.int64)
+        if self.delta and len(ticks):
+            if starts is not None:
+                starts = np.unique(np.asarray(starts, dtype=np.int64))
+                starts = starts[(starts > 0) & (starts < len(ticks))]
+            if starts is not None and len(starts):
+                # Subtract the sum of the previous segment at each
+                # segment start so that the running sum restarts there
+                sums = np.add.reduceat(ticks, np.concatenate(([0], starts)))
+                ticks = ticks.copy()
+                ticks[starts] -= sums[:-1]
+            ticks = np.cumsum(ticks)
+        return ticks * self.dt + self.tstart
+
+
+class ScaleOffset(object):
+    """Storage of floating point values as scaled integers at a given
+    resolution.
+
+    A value `x` is stored as the integer `round((x - offset) / scale)`
+    and read back as `offset + scale * stored`, so the error is at most
+    half of `scale`. Storing a membrane potential in mV with `scale`
+    0.01 in int16, for example, takes a quarter of the space of
+    float64.
+
+    The encoding is recorded in the attributes `scale_factor` and
+    `add_offset` of the dataset storing the integers, following the
+    netCDF conventions.
+
+    Attributes:
+        scale (float): resolution of the stored values.
+
+        offset (float): value stored as 0. If None, it is chosen from
+            the range of the first data written (see `fit`).
+
+        dtype (numpy.dtype): integer type of the stored values.
+
+    Examples:
+        >>> enc = ScaleOffset(0.01, offset=-65.0, dtype=np.int16)
+        >>> enc.encode([-65.0, -64.5, -70.123])
+        array([   0,   50, -512], dtype=int16)
+
+    """
+    def __init__(self, scale, offset=None, dtype=np.int16):
+        if scale <= 0:
+            raise ValueError('`scale` must be > 0.')
+        self.scale = scale
+        self.offset = offset
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind not in 'iu':
+            raise ValueError('`dtype` must be an integer type.')
+
+    @classmethod
+    def from_attrs(cls, attrs, dtype=np.int16):
+        """Return the encoding described by the attributes `attrs` of a
+        dataset, None if its values are not scaled. `dtype` is the
+        type of the dataset, against which encoded values are
+        range-checked."""
+        if 'scale_factor' not in attrs:
+            return None
+        return cls(attrs['scale_factor'], attrs.get('add_offset', 0.0),
+                   dtype=dtype)
+
+    def set_attrs(self, dataset):
+        """Record the encoding in the attributes of `dataset`."""
+        dataset.attrs['scale_factor'] = self.scale
+        dataset.attrs['add_offset'] = self.offset
+
+    def fit(self, data):
+        """Return this encoding if `offset` is set, otherwise a copy
+        whose offset is the middle of the range of `data` rounded to a
+        multiple of `scale`."""
+        if self.offset is not None:
+            return self
+        data = np.asarray(data)
+        offset = 0.0
+        if data.size:
+            middle = (np.nanmin(data) + np.nanmax(data)) / 2.0
+            offset = float(np.rint(middle / self.scale) * self.scale)
+        return ScaleOffset(self.scale, offset, self.dtype)
+
+    def encode(self, data):
+        """Return `data` as integers of `dtype`.
+
+        Raises:
+            ValueError if `data` has values which are not finite or
+            are out of the range representable in `dtype`.
+
+        """
+        offset = 0.0 if self.offset is None else self.offset
+        values = np.rint((np.asarray(data, dtype=np.float64) - offset) /
+                         self.scale)
+        info = np.iinfo(self.dtype)
+        if values.size and not (np.isfinite(values).all() and
+                                values.min() >= info.min and
+                                values.max() <= info.max):
+            raise ValueError('data cannot be stored in {} with scale {}'
+                             ' and offset {}'.format(self.dtype, self.scale,
+                                                    offset))
+        return values.astype(self.dtype)
+
+    def decode(self, values):
+        """Convert stored integers `values` back to float64 values."""
+        offset = 0.0 if self.offset is None else self.offset
+        return np.asarray(values, dtype=np.float64) * self.scale + offset
+
+
 # 
 # util.py ends here